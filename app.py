@@ -1,10 +1,32 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context, g, has_request_context, make_response
 import psycopg2
-from psycopg2 import pool
-import pandas as pd
-import io, os, time
+from psycopg2 import errors
+import os, sys, time, json, base64, tempfile, threading, datetime, decimal
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from urllib.parse import quote
 from dotenv import load_dotenv
 from functools import wraps
+from export import EXPORT_FORMATS, ARROW_FORMATS, is_available, iter_batches, write_xlsx, write_arrow, write_csv, stream_csv
+from export_jobs import ExportJobManager, QueueFull
+from counts import CountService, normalize_filter_key
+from snapshot import BackgroundSnapshot
+from search_index import SubstringIndex
+from facets import FacetIndex
+from replica import LocalReplica
+import rollups
+import partitions
+from cache import make_cache
+from dbpool import ConnectionPool, PoolError
+from prepared import PreparingConnection, PreparedStatements, QueryCompiler
+from http_cache import ResponseCache
+from metrics import Metrics, SlowQueryLog, cursor_factory, render_stats
+import plan_guard
+from regions import region_name, region_label, region_names, region_name_for_inn, region_names_sql
+
+try:
+    import orjson
+except ImportError:  # без orjson ответ /data кодируется стандартным json
+    orjson = None
 
 # -------------------------
 # Настройка приложения
@@ -20,114 +42,118 @@ DB_CONFIG = {
     "password": os.getenv("DB_PASSWORD")
 }
 
-# пул соединений
-db_pool = pool.SimpleConnectionPool(1, 10, **DB_CONFIG)
-PAGE_SIZE = 50
+# метрики (metrics.py, /metrics): время маршрутов, фаз и SQL-запросов
+metrics = Metrics(lambda: request.endpoint if has_request_context() else "background")
+# журнал медленных запросов: порог (мс, 0 — выключен) и как часто снимать план одного и того же запроса (сек)
+SLOW_QUERY_MS = int(os.getenv("SLOW_QUERY_MS", 0))
+SLOW_QUERY_EXPLAIN_INTERVAL = int(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", 300))
+slow_queries = (SlowQueryLog(SLOW_QUERY_MS, lambda: get_connection(), lambda conn: release_connection(conn),
+                             interval=SLOW_QUERY_EXPLAIN_INTERVAL) if SLOW_QUERY_MS > 0 else None)
+# EXPLAIN форм запросов приложения при старте (plan_guard.py): Seq Scan и Sort таблиц
+# от PLAN_CHECK_MIN_ROWS строк и недостающие индексы пишутся в журнал
+PLAN_CHECK_ON_START = os.getenv("PLAN_CHECK_ON_START", "0") == "1"
+PLAN_CHECK_MIN_ROWS = int(os.getenv("PLAN_CHECK_MIN_ROWS", 100_000))
 
-# -------------------------
-# Справочник регионов (код -> наименование)
-# -------------------------
-REGION_MAP = {
-    1: "Республика Адыгея", 
-    2: "Республика Башкортостан", 
-    3: "Республика Бурятия", 
-    4: "Республика Алтай",
-    5: "Республика Дагестан", 
-    6: "Республика Ингушетия", 
-    7: "Кабардино-Балкарская Республика",
-    8: "Республика Калмыкия", 
-    9: "Карачаево-Черкесская Республика", 
-    10: "Республика Карелия",
-    11: "Республика Коми", 
-    12: "Республика Марий Эл", 
-    13: "Республика Мордовия",
-    14: "Республика Саха (Якутия)", 
-    15: "Республика Северная Осетия — Алания", 
-    16: "Республика Татарстан",
-    17: "Республика Тыва", 
-    18: "Удмуртская Республика", 
-    19: "Республика Хакасия",
-    20: "Чеченская Республика", 
-    21: "Чувашская Республика", 
-    22: "Алтайский край",
-    23: "Краснодарский край", 
-    24: "Красноярский край", 
-    25: "Приморский край", 
-    26: "Ставропольский край",
-    27: "Хабаровский край", 
-    28: "Амурская область", 
-    29: "Архангельская область", 
-    30: "Астраханская область",
-    31: "Белгородская область",
-    32: "Брянская область",
-    33: "Владимирская область",
-    34: "Волгоградская область",
-    35: "Вологодская область",
-    36: "Воронежская область",
-    37: "Ивановская область",
-    38: "Иркутская область",
-    39: "Калининградская область", 
-    40: "Калужская область", 
-    41: "Камчатский край", 
-    42: "Кемеровская область",
-    43: "Кировская область", 
-    44: "Костромская область", 
-    45: "Курганская область", 
-    46: "Курская область",
-    47: "Ленинградская область", 
-    48: "Липецкая область",
-    49: "Магаданская область",
-    50: "Московская область",
-    51: "Мурманская область", 
-    52: "Нижегородская область", 
-    53: "Новгородская область", 
-    54: "Новосибирская область",
-    55: "Омская область",
-    56: "Оренбургская область",
-    57: "Орловская область",
-    58: "Пензенская область",
-    59: "Пермский край",
-    60: "Псковская область",
-    61: "Ростовская область",
-    62: "Рязанская область",
-    63: "Самарская область",
-    64: "Саратовская область",
-    65: "Сахалинская область",
-    66: "Свердловская область",
-    67: "Смоленская область",
-    68: "Тамбовская область",
-    69: "Тверская область",
-    70: "Томская область",
-    71: "Тульская область",
-    72: "Тюменская область",
-    73: "Ульяновская область",
-    74: "Челябинская область",
-    75: "Забайкальский край",
-    76: "Ярославская область",
-    77: "Москва", 
-    78: "Санкт-Петербург",
-    79: "Еврейская автономная область", 
-    80: "",
-    81: "",
-    82: "",
-    83: "Ненецкий автономный округ",
-    84: "",
-    85: "",
-    86: "Ханты-Мансийский автономный округ — Югра", 
-    87: "Чукотский автономный округ",
-    88: "",
-    89: "Ямало-Ненецкий автономный округ", 
-    90: "Запорожская область", 
-    91: "Республика Крым", 
-    92: "Севастополь", 
-    93: "Донецкая Народная Республика", 
-    94: "Луганская Народная Республика", 
-    95: "Херсонская область", 
-    96: "", 
-    97: "", 
-    98: "",     
-    99: "Иные территории"
+# пул соединений (dbpool.py): размер, ожидание свободного соединения (сек) и очередь ожидающих,
+# время жизни соединения и простой, после которого оно проверяется перед выдачей
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_POOL_MAX_WAITING = int(os.getenv("DB_POOL_MAX_WAITING", 100))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 3600))
+DB_POOL_CHECK_IDLE = float(os.getenv("DB_POOL_CHECK_IDLE", 30))
+# подготовленные операторы (prepared.py): форма запроса планируется один раз на соединение пула.
+# PREPARED_STATEMENTS=0 — при подключении через pgbouncer в режиме transaction pooling
+PREPARED_STATEMENTS = os.getenv("PREPARED_STATEMENTS", "1") == "1"
+PREPARED_MAX_PER_CONNECTION = int(os.getenv("PREPARED_MAX_PER_CONNECTION", 200))
+# текст SQL по форме запроса (какие фильтры заданы, сортировка)
+QUERY_SHAPES_MAX = int(os.getenv("QUERY_SHAPES_MAX", 1000))
+query_compiler = QueryCompiler(QUERY_SHAPES_MAX)
+prepared_statements = PreparedStatements(PREPARED_MAX_PER_CONNECTION)
+db_pool = ConnectionPool(DB_POOL_MIN, DB_POOL_MAX, timeout=DB_POOL_TIMEOUT, max_waiting=DB_POOL_MAX_WAITING,
+                         max_lifetime=DB_POOL_MAX_LIFETIME, check_idle=DB_POOL_CHECK_IDLE,
+                         connection_factory=PreparingConnection if PREPARED_STATEMENTS else None,
+                         cursor_factory=cursor_factory(metrics, slow_queries), **DB_CONFIG)
+
+# statement_timeout (мс) для запросов маршрута; 0 — без ограничения.
+# Фоновые задачи (снимки, выгрузки, копия DuckDB) берут соединения без ограничения.
+STATEMENT_TIMEOUT_MS = int(os.getenv("STATEMENT_TIMEOUT_MS", 60000))
+ROUTE_STATEMENT_TIMEOUTS = {
+    "autocomplete": int(os.getenv("AUTOCOMPLETE_TIMEOUT_MS", 5000)),
+    "all_facets": int(os.getenv("AUTOCOMPLETE_TIMEOUT_MS", 5000)),
+    "export_file": int(os.getenv("EXPORT_TIMEOUT_MS", 0)),
 }
+PAGE_SIZE = 50
+SALES_TABLE = "intermediate_scheme.sbis_coll_sell_upd_for_flask"
+
+# больше групп /aggregate не отдаёт (ответ помечается truncated)
+AGGREGATE_MAX_GROUPS = int(os.getenv("AGGREGATE_MAX_GROUPS", 10000))
+
+# подсчёт строк: выше этой оценки планировщика точный COUNT(*) не запускаем
+COUNT_EXACT_MAX_ROWS = int(os.getenv("COUNT_EXACT_MAX_ROWS", 1_000_000))
+COUNT_TIMEOUT_MS = int(os.getenv("COUNT_TIMEOUT_MS", 2000))
+COUNT_ASYNC_TIMEOUT_MS = int(os.getenv("COUNT_ASYNC_TIMEOUT_MS", 30000))
+# точные значения хранятся до следующей загрузки, но не больше чем для стольких наборов фильтров (LRU)
+COUNT_CACHE_MAX_ENTRIES = int(os.getenv("COUNT_CACHE_MAX_ENTRIES", 10000))
+count_service = CountService(SALES_TABLE, COUNT_EXACT_MAX_ROWS, COUNT_TIMEOUT_MS, max_entries=COUNT_CACHE_MAX_ENTRIES)
+
+# /data считает строки параллельно со страницей на втором соединении из пула (COUNT_WORKERS потоков);
+# страница ждёт подсчёт не дольше DATA_COUNT_BUDGET_MS (count=async) или COUNT_TIMEOUT_MS
+DATA_PARALLEL_COUNT = os.getenv("DATA_PARALLEL_COUNT", "1") == "1"
+DATA_COUNT_BUDGET_MS = int(os.getenv("DATA_COUNT_BUDGET_MS", 150))
+COUNT_WORKERS = int(os.getenv("COUNT_WORKERS", 4))
+count_executor = ThreadPoolExecutor(max_workers=COUNT_WORKERS, thread_name_prefix="count")
+_counts_in_flight = {}
+_counts_lock = threading.Lock()
+
+# фоновые выгрузки
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "sales_exports"))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", 2))
+EXPORT_QUEUE_SIZE = int(os.getenv("EXPORT_QUEUE_SIZE", 20))
+EXPORT_RESULT_TTL = int(os.getenv("EXPORT_RESULT_TTL", 3600))
+
+# списки вариантов длиннее этого не встраиваются в страницу, а идут через автодополнение
+OPTIONS_INLINE_LIMIT = int(os.getenv("OPTIONS_INLINE_LIMIT", 300))
+
+# поля с большим числом различных значений в индекс подстрок не берём (ищем в БД)
+SEARCH_INDEX_MAX_VALUES = int(os.getenv("SEARCH_INDEX_MAX_VALUES", 2_000_000))
+
+# снимок вариантов фильтров (DISTINCT по всей таблице) строится в фоне; statement_timeout его запросов (мс)
+FILTER_OPTIONS_TIMEOUT_MS = int(os.getenv("FILTER_OPTIONS_TIMEOUT_MS", 600000))
+
+# зависимые списки фильтров в памяти (0 — всегда DISTINCT в БД)
+FACETS_ENABLED = os.getenv("FACETS_ENABLED", "1") == "1"
+# больше строк в таблице — индекс не строим. Индекс свой в каждом воркере: около 72 байт
+# на строку (facets.py), то есть около 360 МБ на воркер при 5 млн строк
+FACETS_MAX_ROWS = int(os.getenv("FACETS_MAX_ROWS", 5_000_000))
+# сколько последних дней перечитывать после новой загрузки
+FACETS_REFRESH_DAYS = int(os.getenv("FACETS_REFRESH_DAYS", 45))
+
+# локальная копия таблицы в DuckDB (replica.py): /data, /count, автодополнение и выгрузка xlsx
+# читают её, когда она синхронизирована с последней загрузкой; 0 — всё из PostgreSQL
+REPLICA_ENABLED = os.getenv("REPLICA_ENABLED", "0") == "1"
+# {pid} в пути — отдельный файл на процесс (файл DuckDB пишет только один процесс), поэтому
+# по умолчанию копия своя у каждого воркера gunicorn; путь без {pid} — только при одном воркере
+# (тогда копия переживает перезапуск и не строится заново)
+REPLICA_PATH = os.getenv("REPLICA_PATH", os.path.join(tempfile.gettempdir(), "sales_replica_{pid}.duckdb"))
+# сколько последних дней перечитывать после новой загрузки
+REPLICA_REFRESH_DAYS = int(os.getenv("REPLICA_REFRESH_DAYS", 45))
+
+# сводные таблицы (rollups.py, migrations/003_sales_rollups.sql) для итогов и подсчёта строк
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "1") == "1"
+
+# секционированная по месяцам таблица (partitions.py, migrations/005_sales_partitioned.sql):
+# после каждой загрузки секции создаются на столько месяцев вперёд
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 2))
+
+# как часто перечитывать метку загрузки данных из service_toolkit.upd_t
+DATA_VERSION_TTL = int(os.getenv("DATA_VERSION_TTL", 30))
+
+# код региона из первых двух цифр ИНН (так же считается фильтр region_code[])
+REGION_CODE_SQL = 'COALESCE(NULLIF(regexp_replace(SUBSTRING("doc_counterparty_inn" FROM 1 FOR 2), \'[^0-9]\', \'\', \'g\'), \'\')::int, 0)'
+
+# то же значение в индексированной колонке (migrations/001_region_code_column.sql)
+REGION_CODE_COLUMN_SQL = '"region_code"'
 
 # -------------------------
 # Поля и порядок колонок
@@ -148,12 +174,31 @@ COLUMN_ORDER = [
     "inside_doc_item_quantity", "inside_doc_item_full_item_price", "Номенклатура.ГАУ",
     "Номенклатура.ГАУ.Группа", "Sale_type"
 ]
+# колонки, которые читаем из БД ("Регион" вычисляется по ИНН)
+DB_COLUMNS = [c for c in COLUMN_ORDER if c != "Регион"]
+# позиции колонок COLUMN_ORDER в строке страницы (DB_COLUMNS + "__tiebreaker"); "Регион" — по ИНН
+INN_INDEX = DB_COLUMNS.index("doc_counterparty_inn")
+REGION_POSITION = COLUMN_ORDER.index("Регион")
+PAGE_COLUMN_INDEX = [INN_INDEX if c == "Регион" else DB_COLUMNS.index(c) for c in COLUMN_ORDER]
 
 # -------------------------
 # Кэш автоподсказок
 # -------------------------
-autocomplete_cache = {}
-CACHE_TTL = 600  # seconds
+CACHE_TTL = int(os.getenv("CACHE_TTL", 600))  # seconds
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 5000))
+# memory — в процессе; sqlite / redis — общий для воркеров (CACHE_URL: путь к файлу или redis://...)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_URL = os.getenv("CACHE_URL")
+autocomplete_cache = make_cache(CACHE_BACKEND, CACHE_MAX_ENTRIES, CACHE_TTL, url=CACHE_URL, namespace="autocomplete")
+
+# готовые HTTP-ответы (http_cache.py): тело и сжатые варианты, ETag по версии данных
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 86400))
+# gzip, br (нужен пакет brotli); пусто — тела хранятся только без сжатия
+RESPONSE_CACHE_ENCODINGS = [e.strip() for e in os.getenv("RESPONSE_CACHE_ENCODINGS", "gzip").split(",") if e.strip()]
+# Cache-Control: max-age — сколько секунд браузер не перепроверяет ответ (0 — всегда через If-None-Match)
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", 0))
 
 def get_cache_key(field, params):
     parts = [field]
@@ -162,34 +207,45 @@ def get_cache_key(field, params):
         parts.append(f"{k}={'|'.join(v)}")
     return "|".join(parts)
 
-def get_from_cache(key):
-    item = autocomplete_cache.get(key)
-    if item and (time.time() - item["time"] < CACHE_TTL):
-        return item["data"]
-    if item:
-        del autocomplete_cache[key]
-    return None
+def get_from_cache(key, version=None):
+    return autocomplete_cache.get(key, version)
 
-def set_to_cache(key, data):
-    autocomplete_cache[key] = {"data": data, "time": time.time()}
+def set_to_cache(key, data, version=None):
+    autocomplete_cache.set(key, data, version)
 
 # -------------------------
 # Утилиты работы с БД и фильтрами
 # -------------------------
-def get_connection():
-    return db_pool.getconn()
+def get_connection(statement_timeout_ms=0):
+    return db_pool.getconn(statement_timeout_ms)
 
-def release_connection(conn):
-    db_pool.putconn(conn)
+def release_connection(conn, close=False):
+    db_pool.putconn(conn, close=close)
 
 def safe_db_call(func):
+    timeout_ms = ROUTE_STATEMENT_TIMEOUTS.get(func.__name__, STATEMENT_TIMEOUT_MS)
+
     @wraps(func)
     def wrapper(*args, **kwargs):
         conn = None
         try:
-            conn = get_connection()
-            return func(conn, *args, **kwargs)
+            with metrics.phase("pool_acquire"):
+                conn = get_connection(timeout_ms)
+            try:
+                return func(conn, *args, **kwargs)
+            except errors.UndefinedColumn:
+                # схему могли поменять на ходу (миграция: таблица заменена представлением без ctid) —
+                # если так и есть, запрос повторяется уже по новой схеме
+                if not recheck_schema(conn):
+                    raise
+                return func(conn, *args, **kwargs)
+        except PoolError as e:
+            # все соединения заняты — клиенту стоит повторить запрос позже
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+        except errors.QueryCanceled:
+            return jsonify({"error": f"запрос к БД выполнялся дольше {timeout_ms} мс"}), 504
         except Exception as e:
+            app.logger.exception("ошибка в %s", func.__name__)
             # отладочная информация в JSON
             return jsonify({"error": str(e)}), 500
         finally:
@@ -197,15 +253,90 @@ def safe_db_call(func):
                 release_connection(conn)
     return wrapper
 
-def extract_region_from_inn(inn: str):
+_data_version = {"value": None, "checked": 0.0}
+
+def get_data_version(conn):
+    """MAX("datetime") из service_toolkit.upd_t — метка последней загрузки данных.
+       Перечитывается из БД не чаще раза в DATA_VERSION_TTL секунд."""
+    now = time.time()
+    if now - _data_version["checked"] >= DATA_VERSION_TTL:
+        cur = conn.cursor()
+        cur.execute('SELECT MAX("datetime") FROM service_toolkit.upd_t')
+        version = cur.fetchone()[0]
+        cur.close()
+        if version != _data_version["value"]:
+            on_data_version_changed(conn, version)
+        _data_version["value"] = version
+        _data_version["checked"] = now
+    return _data_version["value"]
+
+def on_data_version_changed(conn, version):
+    """Действия после новой загрузки (общие для app.py и asgi.py)."""
+    # загрузчик мог пересоздать таблицу — проверяем схему заново
+    check_schema(conn)
+    # строки новых месяцев — из секции по умолчанию в свои секции
+    partition_state.get_ready(version)
+
+def current_data_version():
+    """Метка загрузки без обращения к БД, пока она не старше DATA_VERSION_TTL,
+       иначе — проверка на соединении из пула."""
+    if time.time() - _data_version["checked"] < DATA_VERSION_TTL:
+        return _data_version["value"]
+    conn = get_connection()
     try:
-        s = str(inn)
-        if not s:
-            return "Неизвестный регион"
-        code = int(s[:2])
-        return REGION_MAP.get(code, "Неизвестный регион")
-    except Exception:
-        return "Неизвестный регион"
+        return get_data_version(conn)
+    finally:
+        release_connection(conn)
+
+response_cache = ResponseCache(
+    make_cache(CACHE_BACKEND, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, url=CACHE_URL, namespace="responses"),
+    current_data_version, max_age=HTTP_CACHE_MAX_AGE, encodings=RESPONSE_CACHE_ENCODINGS)
+
+def cached_response(view):
+    """Ответ маршрута из кэша готовых ответов (снаружи safe_db_call: попадание не берёт соединение)."""
+    return response_cache.cached(view) if RESPONSE_CACHE_ENABLED else view
+
+_schema = {"region_code_column": False, "row_id_column": False}
+
+def check_schema(conn):
+    """Проверка применённых миграций: если колонки region_code нет,
+       запросы продолжают вычислять код региона выражением по ИНН;
+       колонка row_id (секционированная таблица) заменяет ctid в keyset-пагинации."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attname IN ('region_code', 'row_id') AND NOT attisdropped
+    """, (SALES_TABLE,))
+    columns = {r[0] for r in cur.fetchall()}
+    _schema["region_code_column"] = "region_code" in columns
+    _schema["row_id_column"] = "row_id" in columns
+    cur.close()
+
+def recheck_schema(conn):
+    """Проверка схемы заново после ошибки «нет такой колонки»: миграция могла быть
+       применена, пока приложение работает (новая загрузка для этого не нужна).
+       True, если схема изменилась."""
+    before = dict(_schema)
+    conn.rollback()
+    check_schema(conn)
+    return _schema != before
+
+def region_code_sql():
+    return REGION_CODE_COLUMN_SQL if _schema["region_code_column"] else REGION_CODE_SQL
+
+def tiebreaker_sql():
+    """(выражение, тип) уникального «разрывателя ничьих» для keyset-пагинации:
+       физический адрес строки ctid, а у секционированной таблицы — row_id
+       (ctid в разных секциях повторяется и через представление не виден)."""
+    return ('"row_id"', "bigint") if _schema["row_id_column"] else ("ctid", "tid")
+
+def add_region_column(rows):
+    """Вставляет "Регион" (векторно по всей пачке) в строки из БД в порядке DB_COLUMNS,
+       чтобы порядок значений совпал с COLUMN_ORDER."""
+    inn_idx = DB_COLUMNS.index("doc_counterparty_inn")
+    pos = COLUMN_ORDER.index("Регион")
+    names = region_names([row[inn_idx] for row in rows])
+    return [row[:pos] + (name,) + row[pos:] for row, name in zip(rows, names)]
 
 def parse_region_codes_from_params(params):
     """Берёт region_code[] значения и пытается извлечь коды (int).
@@ -224,241 +355,865 @@ def parse_region_codes_from_params(params):
             continue
     return codes
 
-def build_filter_query(params):
-    filters, values = [], []
+def build_filter_query(params, exclude=None, region_sql=None):
+    """WHERE по фильтрам запроса. exclude — поле, фильтр по которому не применяется
+       (варианты самого поля не сужаем его же выбором); region_sql — выражение кода
+       региона, если запрос идёт не к таблице продаж (сводные таблицы)."""
+    fields, values = [], []
     # стандартные поля
     for f in FIELDS:
         vals = params.getlist(f + '[]')
-        if vals:
-            filters.append(f'"{f}" = ANY(%s)')
+        if vals and f != exclude:
+            fields.append(f)
             values.append(vals)
 
     # region_code[]
-    region_codes = parse_region_codes_from_params(params)
+    region_codes = parse_region_codes_from_params(params) if exclude != "region_code" else []
     if region_codes:
-        filters.append(
-            'COALESCE(NULLIF(regexp_replace(SUBSTRING("doc_counterparty_inn" FROM 1 FOR 2), \'[^0-9]\', \'\', \'g\'), \'\')::int, 0) = ANY(%s)'
-        )
         values.append(region_codes)
 
     # date_from / date_to
     if params.get("date_from"):
-        filters.append('"Дата">=%s')
         values.append(params["date_from"])
     if params.get("date_to"):
-        filters.append('"Дата"<=%s')
         values.append(params["date_to"])
 
-    where_clause = " WHERE " + " AND ".join(filters) if filters else ""
-    return where_clause, values
+    # текст WHERE зависит только от того, какие фильтры заданы
+    shape = (tuple(fields), bool(region_codes), bool(params.get("date_from")), bool(params.get("date_to")),
+             region_sql or region_code_sql())
+    return query_compiler.compile(("where",) + shape, lambda: filter_clause(*shape)), values
+
+def filter_clause(fields, region, date_from, date_to, region_sql):
+    """Текст WHERE для формы фильтра; значения идут параметрами в том же порядке."""
+    filters = [f'"{f}" = ANY(%s)' for f in fields]
+    if region:
+        filters.append(f'{region_sql} = ANY(%s)')
+    if date_from:
+        filters.append('"Дата">=%s')
+    if date_to:
+        filters.append('"Дата"<=%s')
+    return " WHERE " + " AND ".join(filters) if filters else ""
 
 # -------------------------
-# Маршруты
+# Постраничная выборка: OFFSET и keyset (курсор)
 # -------------------------
-@app.route("/")
-@safe_db_call
-def index(conn):
-    # собрать варианты для initial dropdowns (необязательно, но удобно)
+def sort_db_column(sort_col):
+    """Колонка БД, по которой реально сортируем. "Регион" вычисляется в pandas,
+       поэтому сортировка по нему идёт по ИНН (первые две цифры — код региона)."""
+    return "doc_counterparty_inn" if sort_col == "Регион" else sort_col
+
+def encode_cursor(sort_col, sort_dir, sort_value, tiebreaker):
+    """Непрозрачный курсор: сортировка + значения последней строки страницы."""
+    payload = [sort_col, sort_dir, None if sort_value is None else str(sort_value), str(tiebreaker)]
+    raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, sort_col, sort_dir):
+    """Возвращает (sort_value, tiebreaker) или None, если курсор битый
+       или выдан для другой сортировки."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        c_col, c_dir, sort_value, tiebreaker = json.loads(raw.decode("utf-8"))
+    except Exception:
+        return None
+    if c_col != sort_col or c_dir != sort_dir or not isinstance(tiebreaker, str):
+        return None
+    # курсор с ctid, выданный до перехода на секционированную таблицу (или наоборот)
+    if tiebreaker.isdigit() != _schema["row_id_column"]:
+        return None
+    return sort_value, tiebreaker
+
+def build_seek_conditions(sort_col, sort_dir, sort_value, tiebreaker):
+    """Условия «строго после курсора» для ORDER BY col dir, tiebreaker dir: [(условие, значения)]
+       по отрезкам в порядке сортировки — строки с непустым col и строки с NULL (в PostgreSQL
+       NULL идут последними при ASC и первыми при DESC). В условиях нет OR, поэтому каждый
+       отрезок читается по индексу с нужного места, а не фильтром по всей таблице."""
+    col = f'"{sort_db_column(sort_col)}"'
+    tb, tb_type = tiebreaker_sql()
+    if sort_dir == "ASC":
+        if sort_value is None:
+            return [(f"({col} IS NULL AND {tb} > %s::{tb_type})", [tiebreaker])]
+        return [(f"({col}, {tb}) > (%s, %s::{tb_type})", [sort_value, tiebreaker]), (f"{col} IS NULL", [])]
+    if sort_value is None:
+        return [(f"({col} IS NULL AND {tb} < %s::{tb_type})", [tiebreaker]), (f"{col} IS NOT NULL", [])]
+    return [(f"({col}, {tb}) < (%s, %s::{tb_type})", [sort_value, tiebreaker])]
+
+def total_pages_for(total_rows):
+    if total_rows is None:
+        return None
+    return (total_rows // PAGE_SIZE) + (1 if total_rows % PAGE_SIZE else 0)
+
+def build_page_query(where_clause, values, sort_col, sort_dir, page=1):
+    """SQL страницы page по LIMIT/OFFSET (переход на произвольную страницу)."""
+    return page_query(where_clause, list(values), sort_col, sort_dir, (max(page, 1) - 1) * PAGE_SIZE)
+
+def build_page_queries(where_clause, values, sort_col, sort_dir, page=1, seek=None):
+    """[(query, params)] одной страницы: seek=(sort_value, tiebreaker) — keyset-режим, по запросу
+       на отрезок после курсора (fetch_page читает их по очереди, пока не наберёт страницу),
+       иначе один запрос LIMIT/OFFSET."""
+    if seek is None:
+        return [build_page_query(where_clause, values, sort_col, sort_dir, page)]
+    queries = []
+    for cond, cond_values in build_seek_conditions(sort_col, sort_dir, *seek):
+        seek_clause = (where_clause + " AND " if where_clause else " WHERE ") + cond
+        queries.append(page_query(seek_clause, list(values) + cond_values, sort_col, sort_dir, 0))
+    return queries
+
+def page_query(where_clause, params, sort_col, sort_dir, offset):
+    # LIMIT и OFFSET — параметры: у всех страниц одной сортировки и фильтров один текст запроса
+    tiebreaker = tiebreaker_sql()[0]
+    query = query_compiler.compile(("page", where_clause, sort_col, sort_dir, tiebreaker),
+                                   lambda: page_query_sql(where_clause, sort_col, sort_dir, tiebreaker))
+    return query, params + [PAGE_SIZE, offset]
+
+def page_query_sql(where_clause, sort_col, sort_dir, tiebreaker):
+    # выбираем все колонки, кроме виртуальной "Регион" (его добавим по ИНН)
+    cols = ", ".join([f'"{c}"' for c in DB_COLUMNS])
+    order_col = sort_db_column(sort_col)
+    return (f'SELECT {cols}, {tiebreaker}::text AS "__tiebreaker" FROM {SALES_TABLE} {where_clause} '
+            f'ORDER BY "{order_col}" {sort_dir}, {tiebreaker} {sort_dir} LIMIT %s OFFSET %s')
+
+# -------------------------
+# Итоги по измерениям (/aggregate)
+# -------------------------
+AGGREGATE_DIMENSIONS = {
+    "region": None,  # код региона: колонка region_code или выражение по ИНН (region_code_sql)
+    "gau": '"Номенклатура.ГАУ"',
+    "gau_group": '"Номенклатура.ГАУ.Группа"',
+    "department": '"doc_department"',
+    "manager": '"doc_assigned_manager"',
+    "month": 'CAST(date_trunc(\'month\', "Дата") AS date)',
+}
+
+AGGREGATE_MEASURES = ('SUM("inside_doc_item_full_item_price"), SUM("inside_doc_item_quantity"), COUNT(*)')
+
+def aggregate_dimension_sql(name, region_sql=None):
+    return AGGREGATE_DIMENSIONS[name] or region_sql or region_code_sql()
+
+def build_aggregate_query(where_clause, group_by, rollup=None):
+    """Суммы цены и количества и число строк по группам group_by. Общий итог считается
+       тем же запросом (GROUPING SETS) и идёт первой строкой; у строк групп is_total = 0.
+       rollup — сводная таблица, по которой считать вместо исходных строк."""
+    table, measures = (rollup.table, rollups.MEASURES) if rollup else (SALES_TABLE, AGGREGATE_MEASURES)
+    if not group_by:
+        return f"SELECT {measures} FROM {table} {where_clause}"
+    exprs = [aggregate_dimension_sql(d, rollups.REGION_SQL if rollup else None) for d in group_by]
+    keys = ", ".join(exprs)
+    order = ", ".join(str(i + 1) for i in range(len(exprs)))
+    return (f"SELECT {keys}, {measures}, GROUPING({exprs[0]}) AS is_total FROM {table} {where_clause} "
+            f"GROUP BY GROUPING SETS (({keys}), ()) ORDER BY is_total DESC, {order} LIMIT {AGGREGATE_MAX_GROUPS + 2}")
+
+def aggregate_measures(row):
+    amount, quantity, lines = row
+    return {"amount": float(amount) if amount is not None else 0.0,
+            "quantity": float(quantity) if quantity is not None else 0.0,
+            "lines": lines}
+
+def aggregate_group(group_by, row):
+    item = {}
+    for name, value in zip(group_by, row):
+        if name == "region":
+            value = region_label(value)
+        elif name == "month" and value is not None:
+            value = value.strftime("%Y-%m")
+        item[name] = value
+    item.update(aggregate_measures(row[len(group_by):len(group_by) + 3]))
+    return item
+
+def build_filter_options(conn):
+    """Все значения для фильтров: DISTINCT по каждому полю из FIELDS и коды регионов."""
     options = {}
     cur = conn.cursor()
     for f in FIELDS:
-        cur.execute(f'SELECT DISTINCT "{f}" FROM intermediate_scheme.sbis_coll_sell_upd_for_flask')
-        options[f] = sorted([r[0] for r in cur.fetchall() if r[0]])
+        cur.execute(f'SELECT DISTINCT "{f}" FROM {SALES_TABLE} ORDER BY 1')
+        options[f] = [r[0] for r in cur.fetchall() if r[0]]
     # region codes present in table
-    cur.execute('''
-        SELECT DISTINCT COALESCE(NULLIF(regexp_replace(SUBSTRING("doc_counterparty_inn" FROM 1 FOR 2), '[^0-9]', '', 'g'), '')::int, 0)
-        FROM intermediate_scheme.sbis_coll_sell_upd_for_flask
-    ''')
-    region_codes = sorted([r[0] for r in cur.fetchall() if r[0]])
-    options["region_code"] = [f"{code} — {REGION_MAP.get(code, 'Неизвестный регион')}" for code in region_codes]
+    cur.execute(f'SELECT DISTINCT {region_code_sql()} FROM {SALES_TABLE} ORDER BY 1')
+    options["region_code"] = [region_label(r[0]) for r in cur.fetchall() if r[0]]
     cur.close()
-    return render_template("index_final.html", options=options, fields=FIELDS, column_order=COLUMN_ORDER)
+    return options
 
-@app.route("/data")
+def get_filter_connection():
+    return get_connection(FILTER_OPTIONS_TIMEOUT_MS)
+
+# строится в фоне после каждой загрузки (запрос его не ждёт): до готовности страница берёт
+# снимок прошлой загрузки, а подсказки без ввода — запрос в БД с таймаутом маршрута
+filter_options = BackgroundSnapshot(build_filter_options, get_filter_connection, release_connection)
+
+def build_search_indexes(conn):
+    """Индексы подстрок по значениям каждого поля из FIELDS (из снимка вариантов)."""
+    options = filter_options.get(conn, get_data_version(conn))
+    return {f: SubstringIndex(options[f]) for f in FIELDS if len(options[f]) <= SEARCH_INDEX_MAX_VALUES}
+
+# строятся в фоне после каждой загрузки; до готовности автодополнение идёт в БД
+search_indexes = BackgroundSnapshot(build_search_indexes, get_filter_connection, release_connection)
+
+def build_facets(conn):
+    """Индекс для зависимых списков: после первой загрузки обновляется по окну дат."""
+    previous = facets.peek()
+    if previous is None:
+        columns = {f: f'"{f}"' for f in FIELDS}
+        columns["region_code"] = region_code_sql()
+        return FacetIndex.load(conn, SALES_TABLE, columns, '"Дата"', FACETS_MAX_ROWS)
+    return previous.refresh(conn, FACETS_REFRESH_DAYS, FACETS_MAX_ROWS)
+
+facets = BackgroundSnapshot(build_facets, get_connection, release_connection)
+
+replica_store = LocalReplica(REPLICA_PATH.format(pid=os.getpid()), SALES_TABLE, DB_COLUMNS,
+                             "doc_counterparty_inn", "Дата") if REPLICA_ENABLED else None
+
+def sync_replica(conn):
+    return replica_store.sync(conn, get_data_version(conn), REPLICA_REFRESH_DAYS)
+
+# синхронизируется в фоне после каждой загрузки; до готовности запросы идут в PostgreSQL
+local_replica = BackgroundSnapshot(sync_replica, get_connection, release_connection)
+
+def get_replica(version):
+    """Локальная копия, если она включена и синхронизирована с версией version, иначе None."""
+    return local_replica.get_ready(version) if replica_store is not None else None
+
+def refresh_rollups(conn):
+    return rollups.refresh(conn, get_data_version(conn))
+
+# обновляются в фоне после каждой загрузки; до готовности итоги считаются по исходным строкам
+rollup_state = BackgroundSnapshot(refresh_rollups, get_connection, release_connection)
+
+def maintain_partitions(conn):
+    return partitions.ensure(conn, PARTITION_MONTHS_AHEAD)
+
+# после каждой загрузки в фоне; без миграции секционирования ничего не делает
+partition_state = BackgroundSnapshot(maintain_partitions, get_connection, release_connection)
+
+def pick_rollup(params, group_by, version):
+    """Сводная таблица, актуальная для версии version, из которой можно ответить
+       на запрос с фильтрами params и группировкой group_by, или None."""
+    if not ROLLUPS_ENABLED or not rollup_state.get_ready(version):
+        return None
+    return rollups.pick([f for f in FIELDS if params.getlist(f + '[]')], group_by)
+
+def rollup_count_query(params, version):
+    """(query, values) точного числа строк под фильтрами по сводной таблице или None, если она не подходит."""
+    rollup = pick_rollup(params, (), version)
+    if rollup is None:
+        return None
+    where_clause, values = build_filter_query(params, region_sql=rollups.REGION_SQL)
+    return f'SELECT COALESCE(SUM("lines"), 0)::bigint FROM {rollup.table} {where_clause}', values
+
+def rollup_count(conn, params, version):
+    query = rollup_count_query(params, version)
+    if query is None:
+        return None
+    return fetch_rows(conn, None, *query)[0][0]
+
+def _count_key(where_clause, values, version, force_exact):
+    return normalize_filter_key(where_clause, values), str(version), force_exact
+
+def run_count(key, where_clause, values, version, force_exact):
+    """count_service.count на своём соединении из пула (в потоке count_executor)."""
+    try:
+        conn = get_connection()
+        try:
+            return count_service.count(conn, where_clause, values, version, force_exact=force_exact,
+                                       timeout_ms=COUNT_ASYNC_TIMEOUT_MS if force_exact else None)
+        finally:
+            release_connection(conn)
+    finally:
+        with _counts_lock:
+            _counts_in_flight.pop(key, None)
+
+def start_count(where_clause, values, version, force_exact=False):
+    """Future с (total, exact). Такой же уже идущий подсчёт не повторяется."""
+    key = _count_key(where_clause, values, version, force_exact)
+    with _counts_lock:
+        future = _counts_in_flight.get(key)
+        if future is None:
+            future = count_executor.submit(run_count, key, where_clause, values, version, force_exact)
+            _counts_in_flight[key] = future
+    return future
+
+def running_count(where_clause, values, version, force_exact=False):
+    with _counts_lock:
+        return _counts_in_flight.get(_count_key(where_clause, values, version, force_exact))
+
+def wait_count(future, deadline):
+    """(total, exact), если подсчёт закончился до deadline (time.monotonic()), иначе None."""
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except (FutureTimeout, PoolError, psycopg2.Error):
+        return None
+
+def fetch_rows(conn, replica, query, values):
+    """Все строки запроса из локальной копии (если передана) или из PostgreSQL."""
+    if replica is not None:
+        cur = replica.execute(query, values)
+    else:
+        cur = conn.cursor()
+        prepared_statements.execute(cur, query, values)
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+def fetch_page(conn, replica, queries):
+    """Строки страницы по запросам build_page_queries: следующий отрезок — только если
+       в предыдущих не набралось PAGE_SIZE строк."""
+    rows = []
+    for query, values in queries:
+        rows += fetch_rows(conn, replica, query, values)
+        if len(rows) >= PAGE_SIZE:
+            break
+    return rows[:PAGE_SIZE]
+
+# поля зависимых выпадающих списков (/facets)
+FACET_FIELDS = FIELDS + ["region_code"]
+
+def facet_filters(params):
+    """Выбранные значения фильтров из запроса в виде {поле: [значения]}."""
+    filters = {f: params.getlist(f + '[]') for f in FIELDS}
+    filters["region_code"] = parse_region_codes_from_params(params)
+    return filters
+
+def region_labels_matching(codes, q):
+    """Подписи регионов по кодам, отфильтрованные по вводу (код с начала или часть названия)."""
+    res = []
+    for code in sorted(codes):
+        if not q:
+            res.append(region_label(code))
+        elif q.isdigit() and str(code).startswith(q):
+            res.append(region_label(code))
+        elif not q.isdigit() and q.lower() in region_name(code).lower():
+            res.append(region_label(code))
+    return res
+
+def has_cross_filters(field, params):
+    """Есть ли в запросе автодополнения фильтры по другим полям (или по датам)."""
+    if params.get("date_from") or params.get("date_to"):
+        return True
+    if field != "region_code" and parse_region_codes_from_params(params):
+        return True
+    return any(params.getlist(f + '[]') for f in FIELDS if f != field)
+
+def build_facets_query(params, fields):
+    """Один SELECT на все поля: по ARRAY(SELECT DISTINCT ...) на поле, у каждого
+       подзапроса свой WHERE без фильтра по самому полю (как в /autocomplete)."""
+    columns, values = [], []
+    for field in fields:
+        where_clause, field_values = build_filter_query(params, exclude=field)
+        if field == "region_code":
+            columns.append(f'ARRAY(SELECT DISTINCT {region_code_sql()} FROM {SALES_TABLE} {where_clause})')
+        else:
+            columns.append(f'ARRAY(SELECT DISTINCT "{field}" FROM {SALES_TABLE} {where_clause} ORDER BY 1 LIMIT %s)')
+            field_values.append(50)
+        values += field_values
+    return "SELECT " + ", ".join(columns), values
+
+def facet_suggestions(conn, params, version):
+    """Варианты без ввода для всех полей FACET_FIELDS — {поле: [значения]}.
+       Поле берётся из кэша автодополнения (по тому же ключу, что /autocomplete/<field>
+       с пустым q), из снимка или из индекса в памяти; остальные поля считаются
+       в БД одним запросом."""
+    base = params.copy()
+    base["q"] = ""
+    res, keys, missing = {}, {}, []
+    options = filter_options.get_ready(version)
+    for field in FACET_FIELDS:
+        keys[field] = get_cache_key(field, base)
+        cached = get_from_cache(keys[field], version)
+        if cached is not None:
+            res[field] = cached
+        elif options is not None and not has_cross_filters(field, params):
+            res[field] = options[field] if field == "region_code" else options[field][:50]
+        else:
+            missing.append(field)
+
+    facet_index = facets.get_ready(version) if missing and FACETS_ENABLED else None
+    if facet_index is not None:
+        filters = facet_filters(params)
+        for field in missing:
+            values = facet_index.values(field, filters, params.get("date_from"), params.get("date_to"))
+            res[field] = region_labels_matching(values, "") if field == "region_code" else values[:50]
+    elif missing:
+        query, values = build_facets_query(params, missing)
+        row = fetch_rows(conn, get_replica(version), query, values)[0]
+        for field, values in zip(missing, row):
+            values = [v for v in values if v]
+            res[field] = region_labels_matching(values, "") if field == "region_code" else values
+
+    for field in missing:
+        set_to_cache(keys[field], res[field], version)
+    return {field: res[field] for field in FACET_FIELDS}
+
+def startup_checks():
+    conn = get_connection()
+    try:
+        check_schema(conn)
+    finally:
+        release_connection(conn)
+
+try:
+    startup_checks()
+except psycopg2.Error:
+    # БД недоступна при старте: остаёмся на выражении, проверим после следующей загрузки
+    pass
+
+def check_query_plans():
+    try:
+        conn = get_connection()
+        try:
+            results = plan_guard.check(conn, plan_guard.query_shapes(sys.modules[__name__], conn), PLAN_CHECK_MIN_ROWS,
+                                       SALES_TABLE)
+            proposals = plan_guard.propose(results, plan_guard.existing_indexes(conn, SALES_TABLE),
+                                           plan_guard.trgm_available(conn))
+        finally:
+            release_connection(conn)
+    except (psycopg2.Error, PoolError) as e:
+        app.logger.warning("проверка планов запросов не выполнена: %s", e)
+        return
+    for line in plan_guard.report_lines(results, proposals):
+        app.logger.warning("план запроса: %s", line)
+
+if PLAN_CHECK_ON_START:
+    # в фоне: старт не ждёт EXPLAIN всех форм запросов
+    threading.Thread(target=check_query_plans, name="plan-check", daemon=True).start()
+
+# -------------------------
+# Маршруты
+# -------------------------
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        metrics.observe_request(request.endpoint, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.route("/")
+@cached_response
 @safe_db_call
-def data(conn):
-    page = int(request.args.get("page", 1))
-    sort_col = request.args.get("sort_col", "Дата")
-    sort_dir = request.args.get("sort_dir", "desc")
-    offset = (page - 1) * PAGE_SIZE
+def index(conn):
+    # варианты для выпадающих списков берём из снимка (пересчитывается раз на загрузку);
+    # длинные списки в страницу не встраиваем — их подгружает автодополнение
+    version = get_data_version(conn)
+    options = filter_options.get_latest(version) or {}
+    inline = {f: vals for f, vals in options.items() if len(vals) <= OPTIONS_INLINE_LIMIT}
+    response = make_response(render_template("index_final.html", options=inline, fields=FIELDS,
+                                             column_order=COLUMN_ORDER))
+    # снимок этой загрузки ещё строится — страницу со старыми списками (или без них) не кэшируем
+    response.cache_control.no_store = filter_options.current(version) is None
+    return response
+
+def parse_page_args(args):
+    """(page, sort_col, sort_dir, seek) из параметров /data; ValueError — битый курсор."""
+    page = int(args.get("page", 1))
+    sort_col = args.get("sort_col", "Дата")
+    sort_dir = args.get("sort_dir", "desc")
 
     if sort_col not in COLUMN_ORDER:
         sort_col = "Дата"
     sort_dir = "ASC" if sort_dir == "asc" else "DESC"
 
+    # курсор (если передан) ведёт на страницу сразу после последней строки предыдущей
+    seek = None
+    if args.get("cursor"):
+        seek = decode_cursor(args["cursor"], sort_col, sort_dir)
+        if seek is None:
+            raise ValueError("некорректный cursor")
+    return page, sort_col, sort_dir, seek
+
+def page_cell(value):
+    """Значение ячейки для JSON: дата — "ГГГГ-ММ-ДД", numeric — float."""
+    if value is None or value.__class__ is str:
+        return value
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()[:10]
+    return value
+
+def page_row(row):
+    """Строка страницы (кортеж из курсора) в порядке COLUMN_ORDER."""
+    values = [page_cell(row[i]) for i in PAGE_COLUMN_INDEX]
+    values[REGION_POSITION] = region_name_for_inn(row[INN_INDEX])
+    return values
+
+def page_payload(rows, sort_col, sort_dir, total_rows, total_exact, keyset=True, columns=False):
+    """Ответ /data по строкам страницы (кортежи: колонки DB_COLUMNS + "__tiebreaker").
+       keyset=False — курсор следующей страницы не выдаём (строки не из PostgreSQL);
+       columns=True — список колонок и строки массивами вместо объекта на строку."""
+    # курсор следующей страницы строим по «сырым» значениям последней строки
+    next_cursor = None
+    if len(rows) == PAGE_SIZE and keyset:
+        last = rows[-1]
+        next_cursor = encode_cursor(sort_col, sort_dir, last[DB_COLUMNS.index(sort_db_column(sort_col))], last[-1])
+
+    page = [page_row(row) for row in rows]
+    payload = {"total_pages": total_pages_for(total_rows), "total_exact": total_exact, "next_cursor": next_cursor}
+    if columns:
+        payload["columns"] = COLUMN_ORDER
+        payload["rows"] = page
+    else:
+        payload["data"] = [dict(zip(COLUMN_ORDER, values)) for values in page]
+    return payload
+
+def json_body(payload):
+    """JSON без отступов: orjson, если установлен, иначе стандартный json."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+def json_response(payload):
+    with metrics.phase("serialize"):
+        body = json_body(payload)
+    return Response(body, mimetype="application/json")
+
+@app.route("/data")
+@cached_response
+@safe_db_call
+def data(conn):
+    try:
+        page, sort_col, sort_dir, seek = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     where_clause, values = build_filter_query(request.args)
-    # выбираем все колонки, кроме виртуальной "Регион" (его добавим в pandas)
-    cols = ", ".join([f'"{c}"' for c in COLUMN_ORDER if c != "Регион"])
-    query = f'SELECT {cols} FROM intermediate_scheme.sbis_coll_sell_upd_for_flask {where_clause} ORDER BY "{sort_col}" {sort_dir} LIMIT {PAGE_SIZE} OFFSET {offset}'
-    count_query = f'SELECT COUNT(*) FROM intermediate_scheme.sbis_coll_sell_upd_for_flask {where_clause}'
-    df = pd.read_sql(query, conn, params=values)
-    cur = conn.cursor()
-    cur.execute(count_query, values)
-    total_rows = cur.fetchone()[0]
-    cur.close()
+    # сначала версия: после новой загрузки схема (ctid или row_id) проверяется до построения запроса
+    version = get_data_version(conn)
+    queries = build_page_queries(where_clause, values, sort_col, sort_dir, page=page, seek=seek)
+    # курсор keyset-пагинации содержит номер строки в PostgreSQL (ctid или row_id) — такие страницы только оттуда
+    replica = get_replica(version) if seek is None else None
+    if replica is not None:
+        # локальная копия: та же страница и точный COUNT(*) без обращения к PostgreSQL
+        rows = fetch_page(None, replica, queries)
+        total_rows, total_exact = replica.count(where_clause, values), True
+    else:
+        started = time.monotonic()
+        count_async = request.args.get("count") == "async"
+        count_future = None
+        # фильтры только по датам, региону и группе ГАУ считаются по сводной таблице
+        total_rows = rollup_count(conn, request.args, version)
+        if total_rows is not None:
+            total_exact = True
+        else:
+            total_rows = count_service.get_cached(where_clause, values, version)
+            total_exact = total_rows is not None
+            if total_rows is None and DATA_PARALLEL_COUNT:
+                # COUNT(*) идёт на втором соединении, пока здесь выбирается страница
+                count_future = start_count(where_clause, values, version, force_exact=count_async)
+        rows = fetch_page(conn, None, queries)
 
-    # добавляем колонку "Регион"
-    if "doc_counterparty_inn" in df.columns:
-        df["Регион"] = df["doc_counterparty_inn"].apply(extract_region_from_inn)
-    if "Дата" in df.columns:
-        df["Дата"] = pd.to_datetime(df["Дата"], errors="coerce").dt.strftime("%Y-%m-%d")
+        if count_future is not None:
+            budget_ms = DATA_COUNT_BUDGET_MS if count_async else COUNT_TIMEOUT_MS
+            counted = wait_count(count_future, started + budget_ms / 1000)
+            if counted is not None:
+                total_rows, total_exact = counted
+            elif not count_async:
+                # не уложились: оценка планировщика (точное значение подсчёт положит в кэш)
+                total_rows, total_exact = count_service.estimate(conn, where_clause, values), False
+            # count=async без числа строк: клиент запросит /count, который дождётся этого же подсчёта
+        elif total_rows is None and not count_async:
+            total_rows, total_exact = count_service.count(conn, where_clause, values, version)
 
-    # приводим порядок столбцов к COLUMN_ORDER (если они есть)
-    df = df[[c for c in COLUMN_ORDER if c in df.columns]]
-    total_pages = (total_rows // PAGE_SIZE) + (1 if total_rows % PAGE_SIZE else 0)
-    return jsonify({"data": df.to_dict(orient="records"), "total_pages": total_pages})
+    with metrics.phase("transform"):
+        payload = page_payload(rows, sort_col, sort_dir, total_rows, total_exact, keyset=replica is None,
+                               columns=request.args.get("layout") == "columns")
+    response = json_response(payload)
+    # число строк ещё не посчитано или это оценка — такой ответ не кэшируем
+    response.cache_control.no_store = not total_exact
+    return response
 
-@app.route("/export")
+@app.route("/count")
+@cached_response
 @safe_db_call
-def export_excel(conn):
+def count_rows(conn):
+    """Точное (по возможности) число строк для текущих фильтров — для count=async."""
+    where_clause, values = build_filter_query(request.args)
+    version = get_data_version(conn)
+    replica = get_replica(version)
+    total_rows = rollup_count(conn, request.args, version) if replica is None else None
+    if replica is not None:
+        total_rows, total_exact = replica.count(where_clause, values), True
+    elif total_rows is not None:
+        total_exact = True
+    else:
+        # подсчёт, начатый /data для тех же фильтров, не повторяем, а дожидаемся
+        future = running_count(where_clause, values, version, force_exact=True)
+        counted = wait_count(future, time.monotonic() + COUNT_ASYNC_TIMEOUT_MS / 1000 + DB_POOL_TIMEOUT) if future else None
+        if counted is not None:
+            total_rows, total_exact = counted
+        else:
+            total_rows, total_exact = count_service.count(conn, where_clause, values, version,
+                                                          force_exact=True, timeout_ms=COUNT_ASYNC_TIMEOUT_MS)
+    response = jsonify({"total_rows": total_rows, "total_pages": total_pages_for(total_rows), "total_exact": total_exact})
+    response.cache_control.no_store = not total_exact
+    return response
+
+def build_export_query(where_clause, region_in_db=False):
+    """SELECT для выгрузки в порядке COLUMN_ORDER. "Регион" считается в БД только
+       для COPY (region_in_db); пачечные форматы добавляют его сами по таблице регионов."""
+    if region_in_db:
+        cols = ", ".join([f'{region_names_sql(region_code_sql())} AS "Регион"' if c == "Регион" else f'"{c}"' for c in COLUMN_ORDER])
+    else:
+        cols = ", ".join([f'"{c}"' for c in DB_COLUMNS])
+    return f'SELECT {cols} FROM {SALES_TABLE} {where_clause} ORDER BY "Дата" DESC'
+
+def write_export_file(conn, fmt, fileobj, where_clause, values, progress=None, replica=None):
+    """Строит файл выгрузки формата fmt в fileobj. xlsx читается из локальной копии,
+       если она передана; CSV (COPY) и Arrow (типы колонок PostgreSQL) — всегда из PostgreSQL."""
+    with metrics.phase(f"{fmt}_write"):
+        if fmt in ("csv", "csv.gz"):
+            query = build_export_query(where_clause, region_in_db=True)
+            write_csv(fileobj, conn, query, values, compress=fmt == "csv.gz")
+            return
+        query = build_export_query(where_clause)
+        if fmt in ARROW_FORMATS:
+            description = []
+            write_arrow(fileobj, fmt, iter_batches(conn, query, values, description=description), description,
+                        progress=progress, region_at=COLUMN_ORDER.index("Регион"))
+        else:
+            source = replica.iter_batches(query, values) if replica is not None else iter_batches(conn, query, values)
+            batches = (add_region_column(rows) for rows in source)
+            write_xlsx(fileobj, COLUMN_ORDER, batches, progress=progress)
+
+def export_download_name(fmt):
+    return f"Продажи.{EXPORT_FORMATS[fmt][0]}"
+
+@app.route("/export")
+def export_data():
+    fmt = request.args.get("format", "xlsx")
+    if not is_available(fmt):
+        return jsonify({"error": f"формат выгрузки недоступен: {fmt}"}), 400
     where_clause, values = build_filter_query(request.args)
-    cols = ", ".join([f'"{c}"' for c in COLUMN_ORDER if c != "Регион"])
-    query = f'SELECT {cols} FROM intermediate_scheme.sbis_coll_sell_upd_for_flask {where_clause} ORDER BY "Дата" DESC'
-    df = pd.read_sql(query, conn, params=values)
-
-    # Добавляем Регион
-    if "doc_counterparty_inn" in df.columns:
-        df["Регион"] = df["doc_counterparty_inn"].apply(extract_region_from_inn)
-    if "Дата" in df.columns:
-        df["Дата"] = pd.to_datetime(df["Дата"], errors="coerce")
-
-    df = df[[c for c in COLUMN_ORDER if c in df.columns]]
-
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="Продажи")
-        workbook = writer.book
-        worksheet = writer.sheets["Продажи"]
-
-        header_format = workbook.add_format({'bold': True, 'align': 'center', 'valign': 'vcenter', 'fg_color': '#DDEBF7', 'border': 1})
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-
-        number_format = workbook.add_format({'num_format': '#,##0.00', 'border': 1})
-        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd', 'border': 1})
-        row_formats = [workbook.add_format({'bg_color': '#FFFFFF', 'border': 1}),
-                       workbook.add_format({'bg_color': '#F3F3F3', 'border': 1})]
-
-        for row_num, row in enumerate(df.itertuples(index=False), start=1):
-            fmt = row_formats[row_num % 2]
-            for col_num, cell in enumerate(row):
-                if pd.isna(cell):
-                    worksheet.write(row_num, col_num, "", fmt)
-                elif isinstance(cell, (int, float)):
-                    worksheet.write(row_num, col_num, cell, number_format)
-                elif isinstance(cell, pd.Timestamp):
-                    worksheet.write(row_num, col_num, cell, date_format)
-                else:
-                    worksheet.write(row_num, col_num, str(cell), fmt)
-
-        for i, col in enumerate(df.columns):
-            max_len = max(df[col].astype(str).map(len).max(), len(str(col)))
-            worksheet.set_column(i, i, max_len + 2)
-        worksheet.freeze_panes(1, 0)
+    if fmt in ("csv", "csv.gz"):
+        return export_csv_stream(fmt, where_clause, values)
+    return export_file(fmt, where_clause, values)
 
+@safe_db_call
+def export_file(conn, fmt, where_clause, values):
+    # файл собираем во временном файле на диске и отдаём его потоком
+    output = tempfile.TemporaryFile()
+    write_export_file(conn, fmt, output, where_clause, values, replica=get_replica(get_data_version(conn)))
     output.seek(0)
-    return send_file(output, as_attachment=True,
-                     download_name="Продажи.xlsx",
-                     mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    return send_file(output, as_attachment=True, download_name=export_download_name(fmt),
+                     mimetype=EXPORT_FORMATS[fmt][1])
+
+def export_csv_stream(fmt, where_clause, values):
+    """CSV идёт клиенту по мере выполнения COPY; соединение занято до конца передачи
+       и закрывается, если передача оборвалась посреди COPY."""
+    try:
+        conn = get_connection(ROUTE_STATEMENT_TIMEOUTS["export_file"])
+    except PoolError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    body = stream_csv(conn, build_export_query(where_clause, region_in_db=True), values, compress=fmt == "csv.gz",
+                      on_finish=lambda ok: release_connection(conn, close=not ok))
+    response = Response(stream_with_context(body), mimetype=EXPORT_FORMATS[fmt][1])
+    # COPY уже идёт: если тело не начнут читать (клиент ушёл), close() его остановит и вернёт соединение
+    response.call_on_close(body.close)
+    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(export_download_name(fmt))}"
+    return response
+
+def run_export_job(job, path, report):
+    """Исполнитель фоновой выгрузки: своё соединение из пула на время построения файла."""
+    where_clause, values, fmt = job["params"]
+    conn = get_connection()
+    try:
+        replica = get_replica(get_data_version(conn)) if fmt not in ("csv", "csv.gz") + ARROW_FORMATS else None
+        if replica is not None:
+            job["total_rows"] = replica.count(where_clause, values)
+        else:
+            job["total_rows"], _ = count_service.count(conn, where_clause, values, get_data_version(conn))
+        report()
+
+        def progress(rows_written):
+            job["rows_written"] = rows_written
+            report()
+
+        with open(path, "wb") as f:
+            write_export_file(conn, fmt, f, where_clause, values, progress=progress, replica=replica)
+    finally:
+        release_connection(conn)
+
+export_jobs = ExportJobManager(run_export_job, EXPORT_DIR, workers=EXPORT_WORKERS,
+                               max_queue=EXPORT_QUEUE_SIZE, result_ttl=EXPORT_RESULT_TTL)
+
+def export_job_response(job):
+    state = export_jobs.public_state(job)
+    state["status_url"] = f"/export/jobs/{job['id']}"
+    state["download_url"] = f"/export/jobs/{job['id']}/download"
+    return state
+
+@app.route("/export/jobs", methods=["POST"])
+def create_export_job():
+    fmt = request.values.get("format", "xlsx")
+    if not is_available(fmt):
+        return jsonify({"error": f"формат выгрузки недоступен: {fmt}"}), 400
+    where_clause, values = build_filter_query(request.values)
+    key = fmt + "|" + normalize_filter_key(where_clause, values)
+    try:
+        job, created = export_jobs.submit(key, (where_clause, values, fmt), extension=EXPORT_FORMATS[fmt][0])
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify(export_job_response(job)), 202 if created else 200
+
+@app.route("/export/jobs/<job_id>")
+def export_job_status(job_id):
+    job = export_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "задание не найдено"}), 404
+    return jsonify(export_job_response(job))
+
+@app.route("/export/jobs/<job_id>/download")
+def export_job_download(job_id):
+    job = export_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "задание не найдено"}), 404
+    if job["status"] != "done":
+        return jsonify(export_job_response(job)), 409
+    path = export_jobs.result_path(job)
+    if not os.path.exists(path):
+        return jsonify({"error": "файл выгрузки удалён по сроку хранения"}), 410
+    fmt = next((f for f, (ext, _) in EXPORT_FORMATS.items() if ext == job["extension"]), "xlsx")
+    return send_file(path, as_attachment=True, download_name=export_download_name(fmt),
+                     mimetype=EXPORT_FORMATS[fmt][1])
+
+AUTOCOMPLETE_FIELDS = FIELDS + ["region_code", "Дата"]
+
+def autocomplete_in_memory(field, q, params, version, get_options):
+    """Подсказки из снимка и индексов в памяти или None, если нужен запрос в БД.
+       get_options() — снимок вариантов фильтров для версии version (None, пока он строится)."""
+    cross_filtered = has_cross_filters(field, params)
+    options = get_options() if not q and field in FACET_FIELDS and not cross_filtered else None
+    if options is not None:
+        # без ввода и без других фильтров — готовый список из снимка
+        return options[field] if field == "region_code" else options[field][:50]
+
+    indexes = search_indexes.get_ready(version) if field in FIELDS and q and not cross_filtered else None
+    if indexes and field in indexes:
+        # без других фильтров ищем по индексу в памяти: сначала совпадения по началу строки
+        return indexes[field].search(q, 50)
+
+    facet_index = None
+    if FACETS_ENABLED and cross_filtered and field in FACET_FIELDS:
+        facet_index = facets.get_ready(version)
+    if facet_index is not None:
+        # с другими фильтрами — пересечение списков строк в памяти вместо DISTINCT по таблице
+        values = facet_index.values(field, facet_filters(params), params.get("date_from"), params.get("date_to"))
+        if field == "region_code":
+            return region_labels_matching(values, q)
+        q_lower = q.lower()
+        return [v for v in values if q_lower in str(v).lower()][:50]
+    return None
+
+def autocomplete_query(field, q, params):
+    """SQL подсказок по таблице с учётом остальных фильтров: (query, values)."""
+    if field == "region_code":
+        # фильтры по остальным полям и датам; выбираем только код, чтобы определить доступные регионы
+        where_clause, values = build_filter_query(params, exclude="region_code")
+        return f'SELECT DISTINCT {region_code_sql()} FROM {SALES_TABLE} {where_clause}', values
+
+    where_clause, values = build_filter_query(params, exclude=field)
+    if q:
+        where_clause = (where_clause + " AND " if where_clause else " WHERE ") + f'"{field}" ILIKE %s'
+        values.append(f"%{q}%")
+    query = query_compiler.compile(
+        ("autocomplete", field, where_clause),
+        lambda: f'SELECT DISTINCT "{field}" FROM {SALES_TABLE} {where_clause} ORDER BY "{field}" LIMIT %s')
+    return query, values + [50]
+
+def autocomplete_result(field, q, rows):
+    """Подсказки из строк autocomplete_query."""
+    values = [r[0] for r in rows if r[0]]
+    return region_labels_matching(values, q) if field == "region_code" else values
 
 @app.route("/autocomplete/<field>")
+@cached_response
 @safe_db_call
 def autocomplete(conn, field):
     # проверяем допустимые поля
-    if field not in FIELDS and field not in ["region_code", "Дата"]:
+    if field not in AUTOCOMPLETE_FIELDS:
         return jsonify([])
 
     q = request.args.get("q", "").strip()
     cache_key = get_cache_key(field, request.args)
-    cached = get_from_cache(cache_key)
-    if cached:
+    version = get_data_version(conn)
+    cached = get_from_cache(cache_key, version)
+    if cached is not None:
         return jsonify(cached)
 
-    res = []
+    res = autocomplete_in_memory(field, q, request.args, version, lambda: filter_options.get_ready(version))
+    if res is None:
+        query, values = autocomplete_query(field, q, request.args)
+        res = autocomplete_result(field, q, fetch_rows(conn, get_replica(version), query, values))
 
-    if field == "region_code":
-        # Собираем фильтры для остальных полей
-        filters, values = [], []
-        for f in FIELDS:
-            vals = request.args.getlist(f + '[]')
-            if vals:
-                filters.append(f'"{f}" = ANY(%s)')
-                values.append(vals)
-
-        # date_from / date_to
-        date_from = request.args.get("date_from")
-        date_to = request.args.get("date_to")
-        if date_from:
-            filters.append('"Дата" >= %s')
-            values.append(date_from)
-        if date_to:
-            filters.append('"Дата" <= %s')
-            values.append(date_to)
-
-        # Запрос: выбираем только ИНН, чтобы определить доступные регионы
-        where_clause = " WHERE " + " AND ".join(filters) if filters else ""
-        cur = conn.cursor()
-        cur.execute(f'''
-            SELECT DISTINCT COALESCE(NULLIF(regexp_replace(SUBSTRING("doc_counterparty_inn" FROM 1 FOR 2), '[^0-9]', '', 'g'), '')::int, 0)
-            FROM intermediate_scheme.sbis_coll_sell_upd_for_flask
-            {where_clause}
-        ''', values)
-        region_codes_in_db = [r[0] for r in cur.fetchall() if r[0]]
-        cur.close()
+    set_to_cache(cache_key, res, version)
+    return jsonify(res)
 
-        for code in region_codes_in_db:
-            name = REGION_MAP.get(code, "Неизвестный регион")
-            label = f"{code} — {name}"
-            if not q:
-                res.append(label)
-            else:
-                if q.isdigit() and str(code).startswith(q):
-                    res.append(label)
-                elif not q.isdigit() and q.lower() in name.lower():
-                    res.append(label)
-
-        res = sorted(res, key=lambda x: int(x.split("—")[0].strip()))
-    else:
-        # Стандартная логика для остальных полей с учётом всех фильтров
-        filters, values = [], []
-        for f in FIELDS:
-            vals = request.args.getlist(f+'[]')
-            if vals and f != field:
-                filters.append(f'"{f}" = ANY(%s)')
-                values.append(vals)
-
-        # region_code[] в качестве фильтра
-        region_codes = parse_region_codes_from_params(request.args)
-        if region_codes:
-            filters.append(
-                'COALESCE(NULLIF(regexp_replace(SUBSTRING("doc_counterparty_inn" FROM 1 FOR 2), \'[^0-9]\', \'\', \'g\'), \'\')::int, 0) = ANY(%s)'
-            )
-            values.append(region_codes)
-
-        # date_from / date_to
-        if request.args.get("date_from"):
-            filters.append('"Дата">=%s')
-            values.append(request.args["date_from"])
-        if request.args.get("date_to"):
-            filters.append('"Дата"<=%s')
-            values.append(request.args["date_to"])
-
-        if q:
-            filters.append(f'"{field}" ILIKE %s')
-            values.append(f"%{q}%")
-        where_clause = " WHERE " + " AND ".join(filters) if filters else ""
+@app.route("/facets")
+@cached_response
+@safe_db_call
+def all_facets(conn):
+    """Варианты для всех выпадающих списков при текущих фильтрах одним ответом —
+       вместо отдельного /autocomplete/<field> на каждое поле."""
+    return jsonify(facet_suggestions(conn, request.args, get_data_version(conn)))
 
-        cur = conn.cursor()
-        cur.execute(f'SELECT DISTINCT "{field}" FROM intermediate_scheme.sbis_coll_sell_upd_for_flask {where_clause} ORDER BY "{field}" LIMIT 50', values)
-        res = [r[0] for r in cur.fetchall() if r[0]]
-        cur.close()
+@app.route("/aggregate")
+@cached_response
+@safe_db_call
+def aggregate(conn):
+    """Итоги при фильтрах /data по измерениям group_by (через запятую):
+       region, gau, gau_group, department, manager, month."""
+    group_by = list(dict.fromkeys(d.strip() for d in request.args.get("group_by", "").split(",") if d.strip()))
+    unknown = [d for d in group_by if d not in AGGREGATE_DIMENSIONS]
+    if unknown:
+        return jsonify({"error": f"неизвестные измерения: {', '.join(unknown)}"}), 400
 
-    set_to_cache(cache_key, res)
+    # готовые ответы кэширует cached_response (до смены версии данных) — отдельного кэша итогов нет
+    version = get_data_version(conn)
+    # сводная таблица (если подходит) меньше исходной; иначе — исходные строки (в локальной копии или в БД)
+    rollup = pick_rollup(request.args, group_by, version)
+    if rollup is not None:
+        where_clause, values = build_filter_query(request.args, region_sql=rollups.REGION_SQL)
+        rows = fetch_rows(conn, None, build_aggregate_query(where_clause, group_by, rollup), values)
+    else:
+        where_clause, values = build_filter_query(request.args)
+        rows = fetch_rows(conn, get_replica(version), build_aggregate_query(where_clause, group_by), values)
+    if not group_by:
+        res = {"group_by": [], "totals": aggregate_measures(rows[0]), "groups": [], "truncated": False}
+    else:
+        groups = rows[1:]
+        res = {"group_by": group_by,
+               "totals": aggregate_measures(rows[0][len(group_by):len(group_by) + 3]),
+               "groups": [aggregate_group(group_by, row) for row in groups[:AGGREGATE_MAX_GROUPS]],
+               "truncated": len(groups) > AGGREGATE_MAX_GROUPS}
     return jsonify(res)
 
+@app.route("/stats")
+def stats():
+    """Счётчики внутренних кэшей (попадания, промахи, вытеснения) и пула соединений."""
+    return jsonify({"db_pool": db_pool.stats(),
+                    "autocomplete_cache": autocomplete_cache.stats(),
+                    "count_cache": count_service.stats(),
+                    "response_cache": response_cache.stats(),
+                    "query_shapes": query_compiler.stats(),
+                    "prepared_statements": prepared_statements.stats(),
+                    "replica": replica_store.stats() if replica_store is not None else None})
+
+
 
+@app.route("/metrics")
+def prometheus_metrics():
+    """Метрики в текстовом формате Prometheus: гистограммы маршрутов, фаз и SQL, счётчики пула и кэшей."""
+    extra = render_stats("sales_db_pool", db_pool.stats())
+    for name, cache in (("autocomplete", autocomplete_cache), ("responses", response_cache),
+                        ("counts", count_service)):
+        extra += render_stats("sales_cache", cache.stats(), {"cache": name})
+    extra += render_stats("sales_query_shapes", query_compiler.stats())
+    extra += render_stats("sales_prepared_statements", prepared_statements.stats())
+    return Response(metrics.render(extra), mimetype="text/plain; version=0.0.4")
 
 @app.route("/last_update")
+@cached_response
 @safe_db_call
 def last_update(conn):
     cur = conn.cursor()
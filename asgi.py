@@ -0,0 +1,315 @@
+"""Асинхронный режим (ASGI): те же маршруты и тот же JSON, что у app.py, на Quart
+с асинхронным драйвером PostgreSQL (psycopg 3) и асинхронным пулом соединений.
+
+Пока один запрос ждёт долгий COUNT(*) или выгрузку, остальные (в том числе
+нажатия клавиш в автодополнении) обслуживаются тем же процессом, а не ждут
+свободного потока. SQL, кэши и индексы в памяти общие с app.py. Синхронный
+код (построение снимка вариантов, файлы xlsx/Parquet/Arrow, /facets,
+локальная копия DuckDB) выполняется в потоках через пул соединений app.py.
+
+Нужны пакеты quart, hypercorn и psycopg[binary,pool]:
+
+    hypercorn asgi:app --bind 0.0.0.0:5000 --workers 4
+
+Размер пула — ASYNC_POOL_MIN / ASYNC_POOL_MAX, ожидание соединения —
+ASYNC_POOL_TIMEOUT секунд.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+import zlib
+from functools import wraps
+from urllib.parse import quote
+
+from psycopg import AsyncClientCursor, errors
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from quart import Quart, Response, jsonify, render_template, request
+
+import app as sync_app
+from export import EXPORT_FORMATS, is_available
+
+ASYNC_POOL_MIN = int(os.getenv("ASYNC_POOL_MIN", 2))
+ASYNC_POOL_MAX = int(os.getenv("ASYNC_POOL_MAX", 20))
+ASYNC_POOL_TIMEOUT = float(os.getenv("ASYNC_POOL_TIMEOUT", 30))
+
+app = Quart(__name__, template_folder="templates")
+
+# параметры подставляются на клиенте (AsyncClientCursor), как в psycopg2: SQL из app.py
+# (SET LOCAL ... = %s, EXPLAIN с параметрами) работает без изменений
+db_pool = AsyncConnectionPool(
+    kwargs={
+        "host": sync_app.DB_CONFIG["host"],
+        "port": sync_app.DB_CONFIG["port"],
+        "dbname": sync_app.DB_CONFIG["database"],
+        "user": sync_app.DB_CONFIG["user"],
+        "password": sync_app.DB_CONFIG["password"],
+        "autocommit": True,
+        "cursor_factory": AsyncClientCursor,
+    },
+    min_size=ASYNC_POOL_MIN, max_size=ASYNC_POOL_MAX, timeout=ASYNC_POOL_TIMEOUT, open=False)
+
+
+@app.before_serving
+async def open_pool():
+    await db_pool.open()
+
+
+@app.after_serving
+async def close_pool():
+    await db_pool.close()
+
+
+def with_connection(func):
+    """Асинхронный аналог safe_db_call: соединение из пула и ошибка в JSON."""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            async with db_pool.connection() as conn:
+                try:
+                    return await func(conn, *args, **kwargs)
+                except errors.UndefinedColumn:
+                    # схему поменяли на ходу — как в safe_db_call: повтор по новой схеме
+                    if not await asyncio.to_thread(with_sync_connection, sync_app.recheck_schema):
+                        raise
+                    return await func(conn, *args, **kwargs)
+        except PoolTimeout as e:
+            # все соединения заняты дольше ASYNC_POOL_TIMEOUT — клиенту стоит повторить запрос позже
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+        except errors.QueryCanceled:
+            return jsonify({"error": "запрос к БД прерван по statement_timeout"}), 504
+        except Exception as e:
+            app.logger.exception("ошибка в %s", func.__name__)
+            return jsonify({"error": str(e)}), 500
+    return wrapper
+
+
+async def fetch_rows(conn, query, values=(), replica=None):
+    """Все строки запроса; из локальной копии (DuckDB, синхронно) — в потоке."""
+    if replica is not None:
+        return await asyncio.to_thread(sync_app.fetch_rows, None, replica, query, values)
+    async with conn.cursor() as cur:
+        await cur.execute(query, values)
+        return await cur.fetchall()
+
+
+async def fetch_page(conn, queries, replica=None):
+    """Строки страницы по запросам build_page_queries (как app.fetch_page)."""
+    rows = []
+    for query, values in queries:
+        rows += await fetch_rows(conn, query, values, replica)
+        if len(rows) >= sync_app.PAGE_SIZE:
+            break
+    return rows[:sync_app.PAGE_SIZE]
+
+
+def with_sync_connection(func, *args):
+    """func(conn, *args) на соединении из синхронного пула app.py (вызывается в потоке)."""
+    conn = sync_app.get_connection()
+    try:
+        return func(conn, *args)
+    finally:
+        sync_app.release_connection(conn)
+
+
+async def get_data_version(conn):
+    """То же, что app.get_data_version, и то же общее состояние (метка и время проверки)."""
+    state = sync_app._data_version
+    now = time.time()
+    if now - state["checked"] >= sync_app.DATA_VERSION_TTL:
+        version = (await fetch_rows(conn, 'SELECT MAX("datetime") FROM service_toolkit.upd_t'))[0][0]
+        if version != state["value"]:
+            await asyncio.to_thread(with_sync_connection, sync_app.on_data_version_changed, version)
+        state["value"] = version
+        state["checked"] = now
+    return state["value"]
+
+
+async def count_total(conn, params, where_clause, values, version, force_exact=False, timeout_ms=None):
+    """(total, exact) в том же порядке источников, что в app.py: локальная копия,
+       сводная таблица, кэш точных значений, затем COUNT(*) с таймаутом или оценка."""
+    replica = sync_app.get_replica(version)
+    if replica is not None:
+        return await asyncio.to_thread(replica.count, where_clause, values), True
+    rollup_query = sync_app.rollup_count_query(params, version)
+    if rollup_query is not None:
+        return (await fetch_rows(conn, *rollup_query))[0][0], True
+
+    service = sync_app.count_service
+    cached = service.get_cached(where_clause, values, version)
+    if cached is not None:
+        return cached, True
+    # оценка по плану запроса, как CountService.estimate
+    plan = (await fetch_rows(conn, f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {service.table} {where_clause}", values))[0][0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]["Plan"]["Plan Rows"])
+    if not force_exact and estimate > service.exact_max_rows:
+        return estimate, False
+    try:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms or service.timeout_ms),))
+                await cur.execute(f"SELECT COUNT(*) FROM {service.table} {where_clause}", values)
+                total = (await cur.fetchone())[0]
+    except errors.QueryCanceled:
+        return estimate, False
+    service.store(where_clause, values, version, total)
+    return total, True
+
+
+# -------------------------
+# Маршруты
+# -------------------------
+@app.route("/")
+@with_connection
+async def index(conn):
+    # как в app.py: пока снимок этой загрузки строится в фоне — снимок прошлой (или без списков)
+    options = sync_app.filter_options.get_latest(await get_data_version(conn)) or {}
+    inline = {f: vals for f, vals in options.items() if len(vals) <= sync_app.OPTIONS_INLINE_LIMIT}
+    return await render_template("index_final.html", options=inline, fields=sync_app.FIELDS,
+                                 column_order=sync_app.COLUMN_ORDER)
+
+
+@app.route("/data")
+@with_connection
+async def data(conn):
+    try:
+        page, sort_col, sort_dir, seek = sync_app.parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    where_clause, values = sync_app.build_filter_query(request.args)
+    # сначала версия: после новой загрузки схема (ctid или row_id) проверяется до построения запроса
+    version = await get_data_version(conn)
+    queries = sync_app.build_page_queries(where_clause, values, sort_col, sort_dir, page=page, seek=seek)
+    # курсор keyset-пагинации содержит номер строки в PostgreSQL (ctid или row_id) — такие страницы только оттуда
+    replica = sync_app.get_replica(version) if seek is None else None
+    rows = await fetch_page(conn, queries, replica)
+
+    # count=async: страницу отдаём сразу, если число строк нельзя получить дёшево
+    if (request.args.get("count") == "async" and replica is None
+            and sync_app.rollup_count_query(request.args, version) is None):
+        total_rows = sync_app.count_service.get_cached(where_clause, values, version)
+        total_exact = total_rows is not None
+    else:
+        total_rows, total_exact = await count_total(conn, request.args, where_clause, values, version)
+    payload = sync_app.page_payload(rows, sort_col, sort_dir, total_rows, total_exact, keyset=replica is None,
+                                    columns=request.args.get("layout") == "columns")
+    return Response(sync_app.json_body(payload), mimetype="application/json")
+
+
+@app.route("/count")
+@with_connection
+async def count_rows(conn):
+    where_clause, values = sync_app.build_filter_query(request.args)
+    version = await get_data_version(conn)
+    total_rows, total_exact = await count_total(conn, request.args, where_clause, values, version,
+                                                force_exact=True, timeout_ms=sync_app.COUNT_ASYNC_TIMEOUT_MS)
+    return jsonify({"total_rows": total_rows, "total_pages": sync_app.total_pages_for(total_rows),
+                    "total_exact": total_exact})
+
+
+@app.route("/autocomplete/<field>")
+@with_connection
+async def autocomplete(conn, field):
+    if field not in sync_app.AUTOCOMPLETE_FIELDS:
+        return jsonify([])
+
+    q = request.args.get("q", "").strip()
+    cache_key = sync_app.get_cache_key(field, request.args)
+    version = await get_data_version(conn)
+    cached = sync_app.get_from_cache(cache_key, version)
+    if cached is not None:
+        return jsonify(cached)
+
+    res = sync_app.autocomplete_in_memory(field, q, request.args, version,
+                                          lambda: sync_app.filter_options.get_ready(version))
+    if res is None:
+        query, values = sync_app.autocomplete_query(field, q, request.args)
+        res = sync_app.autocomplete_result(field, q, await fetch_rows(conn, query, values,
+                                                                      sync_app.get_replica(version)))
+
+    sync_app.set_to_cache(cache_key, res, version)
+    return jsonify(res)
+
+
+@app.route("/facets")
+@with_connection
+async def all_facets(conn):
+    version = await get_data_version(conn)
+    args = request.args.copy()
+    res = await asyncio.to_thread(with_sync_connection, sync_app.facet_suggestions, args, version)
+    return jsonify(res)
+
+
+def write_export_tempfile(fmt, where_clause, values):
+    """Файл выгрузки синхронным кодом app.py (вызывается в потоке); возвращает путь."""
+    fd, path = tempfile.mkstemp(suffix="." + EXPORT_FORMATS[fmt][0])
+    try:
+        with os.fdopen(fd, "wb") as f:
+            def write(conn):
+                replica = sync_app.get_replica(sync_app.get_data_version(conn))
+                sync_app.write_export_file(conn, fmt, f, where_clause, values, replica=replica)
+            with_sync_connection(write)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+async def file_body(path, chunk_size=1 << 16):
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+async def csv_body(query, values, compress=False):
+    """CSV из COPY ... TO STDOUT по мере выполнения; соединение занято до конца передачи."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    async with db_pool.connection() as conn:
+        async with conn.cursor() as cur:
+            async with cur.copy(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", values) as copy:
+                async for chunk in copy:
+                    chunk = bytes(chunk)
+                    if compressor:
+                        chunk = compressor.compress(chunk)
+                        if not chunk:
+                            continue
+                    yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+@app.route("/export")
+async def export_data():
+    fmt = request.args.get("format", "xlsx")
+    if not is_available(fmt):
+        return jsonify({"error": f"формат выгрузки недоступен: {fmt}"}), 400
+    where_clause, values = sync_app.build_filter_query(request.args)
+    if fmt in ("csv", "csv.gz"):
+        query = sync_app.build_export_query(where_clause, region_in_db=True)
+        body = csv_body(query, values, compress=fmt == "csv.gz")
+    else:
+        try:
+            path = await asyncio.to_thread(write_export_tempfile, fmt, where_clause, values)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        body = file_body(path)
+    response = Response(body, mimetype=EXPORT_FORMATS[fmt][1])
+    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(sync_app.export_download_name(fmt))}"
+    return response
+
+
+@app.route("/last_update")
+@with_connection
+async def last_update(conn):
+    last = (await fetch_rows(conn, 'SELECT MAX("datetime") FROM service_toolkit.upd_t'))[0][0]
+    return jsonify({"last_update": last.strftime("%Y-%m-%d %H:%M:%S") if last else "нет данных"})
@@ -0,0 +1,65 @@
+"""Автодополнение: SELECT DISTINCT ... ILIKE '%q%' против индекса подстрок в памяти.
+
+Запуск из корня репозитория (нужна БД из .env):
+
+    python -m benchmarks.bench_autocomplete --field doc_counterparty_name --repeat 20
+"""
+import argparse
+import statistics
+import time
+
+import psycopg2
+
+import app
+from search_index import SubstringIndex
+
+
+def sql_search(cur, field, q):
+    cur.execute(f'SELECT DISTINCT "{field}" FROM {app.SALES_TABLE} '
+                f'WHERE "{field}" ILIKE %s ORDER BY 1 LIMIT 50', (f"%{q}%",))
+    return [r[0] for r in cur.fetchall()]
+
+
+def median_ms(func, *args, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--field", default="inside_doc_item_name", choices=app.FIELDS)
+    parser.add_argument("--queries", nargs="+", default=None,
+                        help="по умолчанию — кусочки реальных значений длиной 1..6")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**app.DB_CONFIG)
+    cur = conn.cursor()
+    cur.execute(f'SELECT DISTINCT "{args.field}" FROM {app.SALES_TABLE} '
+                f'WHERE "{args.field}" IS NOT NULL ORDER BY 1')
+    values = [r[0] for r in cur.fetchall() if r[0]]
+
+    start = time.perf_counter()
+    index = SubstringIndex(values)
+    print(f"{args.field}: {len(values)} значений, индекс построен за {time.perf_counter() - start:.2f} с")
+
+    queries = args.queries
+    if not queries:
+        sample = values[len(values) // 2] if values else ""
+        mid = len(sample) // 2
+        queries = [sample[mid:mid + n] for n in (1, 2, 3, 4, 6) if sample[mid:mid + n]]
+
+    print(f"{'q':<16}{'sql ms':>10}{'index ms':>12}{'speedup':>10}")
+    for q in queries:
+        t_sql = median_ms(sql_search, cur, args.field, q, repeat=max(1, args.repeat // 4))
+        t_index = median_ms(index.search, q, repeat=args.repeat)
+        print(f"{q!r:<16}{t_sql:>10.2f}{t_index:>12.3f}{t_sql / t_index:>9.0f}x")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""/data: страница и подсчёт строк последовательно против параллельно (p50/p95).
+
+Перед каждым запросом кэш точных подсчётов сбрасывается, чтобы COUNT(*)
+выполнялся каждый раз. Замеряется время до ответа /data (page) и до момента,
+когда известно и число страниц (total): с count=async, если /data вернул
+страницу без него, — вместе с последующим запросом /count, как на странице. Режимы:
+
+    sequential  — DATA_PARALLEL_COUNT=0: COUNT(*) после страницы на том же соединении
+    parallel    — COUNT(*) на втором соединении из пула одновременно со страницей
+
+Запуск из корня репозитория (нужна БД из .env):
+
+    python -m benchmarks.bench_data --repeat 30
+"""
+import argparse
+import statistics
+import time
+from urllib.parse import urlencode
+
+import app
+from counts import CountService
+
+SCENARIOS = {
+    "без фильтров": {},
+    "период": {"date_from": "2024-01-01", "date_to": "2024-06-30"},
+    "поиск по названию": {"inside_doc_item_name[]": []},
+    "сортировка по цене": {"sort_col": "inside_doc_item_full_item_price", "sort_dir": "asc", "page": 100},
+}
+
+
+def get(client, path, params):
+    response = client.get(path + "?" + urlencode(params, doseq=True))
+    if response.status_code != 200:
+        raise SystemExit(f"{path}: {response.status_code} {response.get_data(as_text=True)[:200]}")
+    return response.json
+
+
+def p50_p95(timings):
+    timings = sorted(timings)
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+
+def measure(client, params, repeat):
+    page_timings, total_timings = [], []
+    for _ in range(repeat):
+        app.count_service = CountService(app.SALES_TABLE, app.COUNT_EXACT_MAX_ROWS, app.COUNT_TIMEOUT_MS)
+        start = time.perf_counter()
+        res = get(client, "/data", params)
+        page_timings.append((time.perf_counter() - start) * 1000)
+        if res["total_pages"] is None:
+            get(client, "/count", {k: v for k, v in params.items() if k not in ("page", "count")})
+        total_timings.append((time.perf_counter() - start) * 1000)
+    return p50_p95(page_timings) + p50_p95(total_timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    # без сводных таблиц: иначе фильтры по датам считаются по ним и COUNT(*) не выполняется
+    app.ROLLUPS_ENABLED = False
+    client = app.app.test_client()
+    # значение для фильтра по названию — первое из снимка вариантов
+    conn = app.get_connection()
+    try:
+        options = app.filter_options.get(conn, app.get_data_version(conn))
+    finally:
+        app.release_connection(conn)
+    SCENARIOS["поиск по названию"]["inside_doc_item_name[]"] = options["inside_doc_item_name"][:1]
+
+    print(f"{'scenario':<22}{'count':<7}{'mode':<12}{'page p50':>10}{'page p95':>10}{'total p50':>11}{'total p95':>11}")
+    for name, params in SCENARIOS.items():
+        for count_mode in ("sync", "async"):
+            query = dict(params, count=count_mode) if count_mode == "async" else params
+            for mode in ("sequential", "parallel"):
+                app.DATA_PARALLEL_COUNT = mode == "parallel"
+                page50, page95, total50, total95 = measure(client, query, args.repeat)
+                print(f"{name:<22}{count_mode:<7}{mode:<12}{page50:>10.1f}{page95:>10.1f}{total50:>11.1f}{total95:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
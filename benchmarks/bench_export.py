@@ -0,0 +1,80 @@
+"""Пропускная способность (строк/с) и пиковая память выгрузки по форматам.
+
+Каждый формат запускается в отдельном процессе, чтобы пиковый RSS одного
+формата не влиял на другой. Запуск из корня репозитория (нужна БД из .env):
+
+    python -m benchmarks.bench_export --formats xlsx csv csv.gz parquet arrow
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ALL_FORMATS = ["xlsx", "csv", "csv.gz", "parquet", "arrow"]
+
+
+def run_one(fmt, filters):
+    """Выгрузка одного формата в /dev/null-подобный файл; печатает JSON с метриками."""
+    import psycopg2
+    from werkzeug.datastructures import MultiDict
+
+    import app
+
+    where_clause, values = app.build_filter_query(MultiDict(filters))
+    conn = psycopg2.connect(**app.DB_CONFIG)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rows = {"n": 0}
+
+    def progress(n):
+        rows["n"] = n
+
+    start = time.perf_counter()
+    with open(os.devnull, "wb") as f:
+        app.write_export_file(conn, fmt, f, where_clause, values, progress=progress)
+    elapsed = time.perf_counter() - start
+    if not rows["n"]:
+        # CSV пишется через COPY без колбэка прогресса — считаем отдельно
+        cur = conn.cursor()
+        cur.execute(f"SELECT COUNT(*) FROM {app.SALES_TABLE} {where_clause}", values)
+        rows["n"] = cur.fetchone()[0]
+        cur.close()
+    conn.close()
+    print(json.dumps({
+        "format": fmt,
+        "rows": rows["n"],
+        "seconds": elapsed,
+        "rows_per_s": rows["n"] / elapsed if elapsed else 0,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--formats", nargs="+", default=ALL_FORMATS, choices=ALL_FORMATS)
+    parser.add_argument("--filter", action="append", default=[], metavar="FIELD[]=VALUE",
+                        help="фильтр в формате параметров /export, можно несколько раз")
+    parser.add_argument("--one", choices=ALL_FORMATS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    filters = [tuple(f.split("=", 1)) for f in args.filter]
+
+    if args.one:
+        run_one(args.one, filters)
+        return
+
+    print(f"{'format':<10}{'rows':>12}{'sec':>10}{'rows/s':>12}{'peak RSS MB':>14}{'growth MB':>12}")
+    for fmt in args.formats:
+        cmd = [sys.executable, "-m", "benchmarks.bench_export", "--one", fmt]
+        for f in args.filter:
+            cmd += ["--filter", f]
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f"{r['format']:<10}{r['rows']:>12}{r['seconds']:>10.2f}{r['rows_per_s']:>12.0f}"
+              f"{r['peak_rss_mb']:>14.1f}{r['rss_growth_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
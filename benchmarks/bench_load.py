@@ -0,0 +1,93 @@
+"""Нагрузочный тест HTTP: пропускная способность и задержки при N одновременных клиентах.
+
+Сервер запускается отдельно (синхронный и асинхронный режимы на одной БД):
+
+    gunicorn app:app -w 4 --threads 8 -b 127.0.0.1:5000
+    hypercorn asgi:app -w 4 -b 127.0.0.1:5001
+
+    python -m benchmarks.bench_load --url http://127.0.0.1:5000 --clients 10 100 500
+    python -m benchmarks.bench_load --url http://127.0.0.1:5001 --clients 10 100 500
+
+Каждый клиент — поток с keep-alive соединением, который по кругу запрашивает
+пути из --paths. Результат по каждому уровню нагрузки — одна строка таблицы.
+"""
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+DEFAULT_PATHS = [
+    "/data?page=1",
+    "/data?page=20&sort_col=inside_doc_item_name&sort_dir=asc",
+    "/autocomplete/inside_doc_item_name?q=" + quote("бол"),
+    "/autocomplete/doc_counterparty_full_name?q=" + quote("ооо"),
+    "/last_update",
+]
+
+
+def client(host, port, paths, deadline, results, start_at):
+    conn = http.client.HTTPConnection(host, port, timeout=120)
+    i = start_at
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            ok = response.status < 500
+        except (OSError, http.client.HTTPException):
+            ok = False
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=120)
+        results.append((time.perf_counter() - start, ok))
+    conn.close()
+
+
+def run_level(host, port, paths, clients, duration):
+    results = []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(host, port, paths, deadline, results, n), daemon=True)
+               for n in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    timings = sorted(t for t, ok in results if ok)
+    errors = sum(1 for _, ok in results if not ok)
+    if not timings:
+        return {"clients": clients, "rps": 0.0, "errors": errors}
+
+    def pct(p):
+        return timings[min(len(timings) - 1, int(len(timings) * p))] * 1000
+
+    return {"clients": clients, "rps": len(timings) / elapsed, "p50": statistics.median(timings) * 1000,
+            "p95": pct(0.95), "p99": pct(0.99), "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--duration", type=float, default=30, help="секунд на уровень нагрузки")
+    parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS)
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    print(f"{args.url}, {args.duration:.0f} с на уровень")
+    print(f"{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for clients in args.clients:
+        r = run_level(url.hostname, url.port or 80, args.paths, clients, args.duration)
+        if "p50" not in r:
+            print(f"{clients:>8}{0:>10.1f}{'-':>10}{'-':>10}{'-':>10}{r['errors']:>8}")
+            continue
+        print(f"{clients:>8}{r['rps']:>10.1f}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
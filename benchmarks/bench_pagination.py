@@ -0,0 +1,73 @@
+"""Сравнение OFFSET- и keyset-пагинации /data: первая и глубокая страница в обе стороны сортировки.
+
+Запуск из корня репозитория (нужна БД из .env):
+
+    python -m benchmarks.bench_pagination --deep-page 10000 --repeat 5
+    python -m benchmarks.bench_pagination --sort-col inside_doc_item_full_item_price --sort-dir ASC
+"""
+import argparse
+import statistics
+import time
+
+import psycopg2
+
+import app
+
+
+def run_page(cur, where_clause, values, sort_col, sort_dir, page=1, seek=None):
+    queries = app.build_page_queries(where_clause, values, sort_col, sort_dir, page=page, seek=seek)
+    start = time.perf_counter()
+    rows = app.fetch_page(cur.connection, None, queries)
+    return time.perf_counter() - start, rows
+
+
+def seek_for_page(cur, where_clause, values, sort_col, sort_dir, page):
+    """Курсор, указывающий на начало страницы page (берём последнюю строку page-1)."""
+    if page <= 1:
+        return None
+    _, rows = run_page(cur, where_clause, values, sort_col, sort_dir, page=page - 1)
+    if not rows:
+        return None
+    last = rows[-1]
+    sort_value = last[app.DB_COLUMNS.index(app.sort_db_column(sort_col))]
+    return app.decode_cursor(app.encode_cursor(sort_col, sort_dir, sort_value, last[-1]), sort_col, sort_dir)
+
+
+def measure(cur, where_clause, values, sort_col, sort_dir, page, mode, repeat):
+    seek = seek_for_page(cur, where_clause, values, sort_col, sort_dir, page) if mode == "keyset" else None
+    if mode == "keyset" and page > 1 and seek is None:
+        return None
+    timings = []
+    for _ in range(repeat):
+        elapsed, _ = run_page(cur, where_clause, values, sort_col, sort_dir, page=page, seek=seek)
+        timings.append(elapsed)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--deep-page", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sort-col", default="Дата")
+    parser.add_argument("--sort-dir", nargs="+", default=["ASC", "DESC"], choices=["ASC", "DESC"])
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**app.DB_CONFIG)
+    cur = conn.cursor()
+    where_clause, values = "", []
+
+    app.check_schema(conn)
+    print(f"sort: {args.sort_col}, page size {app.PAGE_SIZE}, median of {args.repeat}")
+    print(f"{'dir':<6}{'mode':<8}{'page':>8}{'ms':>12}")
+    for sort_dir in args.sort_dir:
+        for mode in ("offset", "keyset"):
+            for page in (1, args.deep_page):
+                t = measure(cur, where_clause, values, args.sort_col, sort_dir, page, mode, args.repeat)
+                shown = "n/a" if t is None else f"{t * 1000:.2f}"
+                print(f"{sort_dir:<6}{mode:<8}{page:>8}{shown:>12}")
+    cur.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Нагрузочный тест пула соединений: N потоков делят пул из --max соединений.
+
+Каждый поток по кругу берёт соединение, выполняет SELECT pg_sleep(--hold)
+(имитация запроса маршрута) и возвращает его. Для сравнения тот же сценарий
+прогоняется на psycopg2.pool.ThreadedConnectionPool, который при занятом пуле
+сразу бросает PoolError (в app.py это был ответ 500).
+
+    python -m benchmarks.bench_pool --threads 10 50 200 --max 10 --hold 0.02
+
+Параметры БД — из .env, как у приложения.
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2 import pool
+
+from dbpool import ConnectionPool, PoolError
+
+
+def worker(acquire, release, hold, deadline, results):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            conn = acquire()
+        except (PoolError, pool.PoolError):
+            results.append((time.perf_counter() - start, False))
+            # без паузы отказавший поток крутился бы в цикле отказов
+            time.sleep(hold)
+            continue
+        waited = time.perf_counter() - start
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_sleep(%s)", (hold,))
+            cur.close()
+        finally:
+            release(conn)
+        results.append((waited, True))
+
+
+def run(acquire, release, threads, hold, duration):
+    results = []
+    deadline = time.perf_counter() + duration
+    workers = [threading.Thread(target=worker, args=(acquire, release, hold, deadline, results), daemon=True)
+               for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    waits = sorted(w for w, ok in results if ok)
+    errors = sum(1 for _, ok in results if not ok)
+    if not waits:
+        return {"rps": 0.0, "errors": errors}
+
+    def pct(p):
+        return waits[min(len(waits) - 1, int(len(waits) * p))] * 1000
+
+    return {"rps": len(waits) / elapsed, "p50": statistics.median(waits) * 1000,
+            "p99": pct(0.99), "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--max", type=int, default=10, help="размер пула")
+    parser.add_argument("--hold", type=float, default=0.02, help="секунд на запрос")
+    parser.add_argument("--timeout", type=float, default=10, help="ожидание соединения в dbpool, сек")
+    parser.add_argument("--duration", type=float, default=10, help="секунд на прогон")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db_config = {
+        "host": os.getenv("DB_HOST"),
+        "port": int(os.getenv("DB_PORT", 5432)),
+        "database": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+    }
+
+    print(f"пул {args.max}, запрос {args.hold * 1000:.0f} мс, {args.duration:.0f} с на прогон")
+    print(f"{'pool':>10}{'threads':>9}{'acq/s':>10}{'wait p50':>10}{'wait p99':>10}{'errors':>8}")
+    for threads in args.threads:
+        pools = [
+            ("psycopg2", pool.ThreadedConnectionPool(1, args.max, **db_config)),
+            ("dbpool", ConnectionPool(1, args.max, timeout=args.timeout, max_waiting=threads, **db_config)),
+        ]
+        for name, p in pools:
+            r = run(p.getconn, p.putconn, threads, args.hold, args.duration)
+            p.closeall()
+            if "p50" not in r:
+                print(f"{name:>10}{threads:>9}{0:>10.1f}{'-':>10}{'-':>10}{r['errors']:>8}")
+                continue
+            print(f"{name:>10}{threads:>9}{r['rps']:>10.1f}{r['p50']:>10.1f}{r['p99']:>10.1f}{r['errors']:>8}")
+            if name == "dbpool":
+                stats = p.stats()
+                print(f"{'':>10}{'':>9}  max wait {stats['max_wait_seconds'] * 1000:.0f} мс, "
+                      f"таймаутов {stats['timeouts']}, отказов {stats['rejected']}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except psycopg2.OperationalError as e:
+        raise SystemExit(f"нет соединения с БД: {e}")
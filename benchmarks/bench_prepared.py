@@ -0,0 +1,67 @@
+"""Страница /data: обычный запрос против подготовленного оператора (p50/p95, мс).
+
+Один и тот же текст запроса (одна форма) с разными страницами выполняется
+на одном соединении: обычным execute — разбор и планирование каждый раз —
+и через PreparedStatements (PREPARE один раз, дальше EXECUTE).
+
+    python -m benchmarks.bench_prepared --repeat 500
+"""
+import argparse
+import statistics
+import time
+
+import psycopg2
+from werkzeug.datastructures import MultiDict
+
+import app
+from prepared import PreparedStatements, PreparingConnection
+
+SHAPES = {
+    "без фильтров, по дате": ({}, "Дата"),
+    "период, по цене": ({"date_from": "2024-01-01", "date_to": "2024-06-30"}, "inside_doc_item_full_item_price"),
+}
+
+
+def measure(cur, run, query_for, repeat):
+    timings = []
+    for i in range(repeat):
+        query, values = query_for(i)
+        start = time.perf_counter()
+        run(cur, query, values)
+        cur.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=20, help="страницы перебираются по кругу")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(connection_factory=PreparingConnection, **app.DB_CONFIG)
+    conn.autocommit = True
+    cur = conn.cursor()
+    statements = PreparedStatements()
+    modes = {
+        "execute": lambda cur, query, values: cur.execute(query, values),
+        "prepared": statements.execute,
+    }
+
+    print(f"{'shape':<26}{'mode':<10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, (params, sort_col) in SHAPES.items():
+        where_clause, values = app.build_filter_query(MultiDict(params))
+
+        def query_for(i):
+            return app.build_page_query(where_clause, values, sort_col, "DESC", page=1 + i % args.pages)
+
+        for mode, run in modes.items():
+            p50, p95 = measure(cur, run, query_for, args.repeat)
+            print(f"{name:<26}{mode:<10}{p50:>10.3f}{p95:>10.3f}")
+    print(statements.stats())
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Микробенчмарк определения региона: построчный apply против табличного поиска.
+
+    python -m benchmarks.bench_region --sizes 10000 1000000 10000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from regions import REGION_MAP, region_names, region_names_arrow
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+def extract_region_from_inn(inn):
+    """Прежняя построчная реализация — эталон для сравнения."""
+    try:
+        s = str(inn)
+        if not s:
+            return "Неизвестный регион"
+        code = int(s[:2])
+        return REGION_MAP.get(code, "Неизвестный регион")
+    except Exception:
+        return "Неизвестный регион"
+
+
+def make_inns(n, seed=0):
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(1, 100, n)
+    tails = rng.integers(0, 10**8, n)
+    inns = pd.Series([f"{c:02d}{t:08d}" for c, t in zip(codes, tails)], dtype=object)
+    inns[rng.random(n) < 0.01] = None
+    return inns
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 1_000_000, 10_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10}{'apply s':>12}{'numpy s':>12}{'arrow s':>12}{'speedup':>10}")
+    for n in args.sizes:
+        inns = make_inns(n)
+        t_apply = timed(lambda s: s.apply(extract_region_from_inn), inns)
+        t_numpy = timed(region_names, inns)
+        t_arrow = float("nan")
+        if pa is not None:
+            arr = pa.array(inns, type=pa.string())
+            t_arrow = timed(region_names_arrow, arr)
+        print(f"{n:>10}{t_apply:>12.3f}{t_numpy:>12.3f}{t_arrow:>12.3f}{t_apply / t_numpy:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""/data и автодополнение: PostgreSQL против локальной копии в DuckDB (p50/p99).
+
+Копия синхронизируется перед замером (первый запуск — полная загрузка).
+Запуск из корня репозитория (нужна БД из .env и пакет duckdb):
+
+    python -m benchmarks.bench_replica --path /tmp/sales_replica.duckdb --repeat 50
+"""
+import argparse
+import statistics
+import time
+
+import psycopg2
+from werkzeug.datastructures import MultiDict
+
+import app
+from replica import LocalReplica
+
+
+def percentiles(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default="/tmp/sales_replica.duckdb")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--date-from", default=None, help="фильтр date_from для всех сценариев")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**app.DB_CONFIG)
+    replica = LocalReplica(args.path, app.SALES_TABLE, app.DB_COLUMNS, "doc_counterparty_inn", "Дата")
+    cur = conn.cursor()
+    cur.execute('SELECT MAX("datetime") FROM service_toolkit.upd_t')
+    version = cur.fetchone()[0]
+    replica.sync(conn, version)
+    print(f"синхронизация: {replica.stats()}")
+
+    filters = MultiDict({"date_from": args.date_from} if args.date_from else {})
+    where_clause, values = app.build_filter_query(filters)
+    field = "inside_doc_item_name"
+    field_where, field_values = app.build_filter_query(filters, exclude=field)
+    scenarios = {
+        "page 1": app.build_page_query(where_clause, values, "Дата", "DESC", page=1),
+        "page 1000": app.build_page_query(where_clause, values, "Дата", "DESC", page=1000),
+        "count": (f"SELECT COUNT(*) FROM {app.SALES_TABLE} {where_clause}", values),
+        "distinct": (f'SELECT DISTINCT "{field}" FROM {app.SALES_TABLE} {field_where} ORDER BY 1 LIMIT 50',
+                     field_values),
+    }
+
+    def on_postgres(query, params):
+        cur.execute(query, params)
+        cur.fetchall()
+
+    def on_replica(query, params):
+        replica.execute(query, params).fetchall()
+
+    print(f"{'scenario':<12}{'pg p50':>10}{'pg p99':>10}{'local p50':>12}{'local p99':>12}")
+    for name, (query, params) in scenarios.items():
+        pg = percentiles(lambda: on_postgres(query, params), args.repeat)
+        local = percentiles(lambda: on_replica(query, params), args.repeat)
+        print(f"{name:<12}{pg[0]:>10.2f}{pg[1]:>10.2f}{local[0]:>12.2f}{local[1]:>12.2f}")
+    cur.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
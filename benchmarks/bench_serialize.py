@@ -0,0 +1,72 @@
+"""CPU на сериализацию одной страницы /data: прежний путь через pandas против кортежей.
+
+Страница читается из БД один раз; дальше замеряется только работа процесса
+(time.process_time) на построение ответа и кодирование в JSON.
+
+    python -m benchmarks.bench_serialize --repeat 2000
+"""
+import argparse
+import json
+import time
+
+import pandas as pd
+import psycopg2
+
+import app
+from regions import region_names
+
+
+def pandas_payload(rows):
+    """Ответ /data так, как он строился через pandas (read_sql -> to_dict)."""
+    df = pd.DataFrame.from_records(rows, columns=app.DB_COLUMNS + ["__tiebreaker"], coerce_float=True)
+    df = df.drop(columns=["__tiebreaker"])
+    df["Регион"] = region_names(df["doc_counterparty_inn"])
+    df["Дата"] = pd.to_datetime(df["Дата"], errors="coerce").dt.strftime("%Y-%m-%d")
+    df = df[[c for c in app.COLUMN_ORDER if c in df.columns]]
+    return {"data": df.to_dict(orient="records"), "total_pages": 1, "total_exact": True, "next_cursor": None}
+
+
+def cpu_us(func, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        func()
+    return (time.process_time() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**app.DB_CONFIG)
+    query, params = app.build_page_query("", [], "Дата", "DESC")
+    cur = conn.cursor()
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    def dumps(payload):
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+    cases = [
+        ("pandas + json", lambda: dumps(pandas_payload(rows))),
+        ("tuples + json", lambda: dumps(app.page_payload(rows, "Дата", "DESC", 1, True))),
+        ("tuples columns + json", lambda: dumps(app.page_payload(rows, "Дата", "DESC", 1, True, columns=True))),
+    ]
+    if app.orjson is not None:
+        cases += [
+            ("tuples + orjson", lambda: app.orjson.dumps(app.page_payload(rows, "Дата", "DESC", 1, True))),
+            ("tuples columns + orjson",
+             lambda: app.orjson.dumps(app.page_payload(rows, "Дата", "DESC", 1, True, columns=True))),
+        ]
+
+    print(f"{len(rows)} строк, среднее по {args.repeat} повторам")
+    print(f"{'path':<26}{'cpu us':>10}{'bytes':>10}")
+    for name, func in cases:
+        size = len(func())
+        print(f"{name:<26}{cpu_us(func, args.repeat):>10.0f}{size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Синтетическая таблица продаж для замеров: intermediate_scheme.sbis_coll_sell_upd_for_flask.
+
+Распределения похожи на настоящие данные:
+  * ИНН контрагентов начинаются с кодов всех регионов из REGION_MAP (крупные
+    регионы встречаются чаще), немного строк с пустым и нецифровым ИНН;
+  * покупатели и номенклатура неравномерны: немногие контрагенты и позиции
+    дают большую часть строк;
+  * номенклатура разбита на коды ГАУ и группы ГАУ, менеджеры — на отделы;
+  * документ (УПД) — несколько строк с общими датой, контрагентом и менеджером;
+    даты за последние --years лет, ближе к сегодняшнему дню — гуще.
+
+Генерация идёт в PostgreSQL (generate_series), с фиксированным --seed
+результат повторяется. После загрузки в service_toolkit.upd_t добавляется
+новая метка, так что приложение перестроит снимки и сводные таблицы.
+
+    python -m benchmarks.generate --rows 100k
+    python -m benchmarks.generate --rows 10M --replace
+
+Параметры БД — из .env (как у migrate.py: DB_ADMIN_USER, если задан).
+Существующая таблица без --replace не трогается; с --replace она очищается
+(TRUNCATE), а колонки и индексы из migrations/ сохраняются. Если применена
+migrations/005_sales_partitioned.sql, очищается секционированная таблица под
+представлением, а секции месяцев создаются до вставки строк.
+"""
+import argparse
+import time
+
+import psycopg2
+
+from migrate import admin_db_config
+from regions import REGION_MAP
+
+TABLE = "intermediate_scheme.sbis_coll_sell_upd_for_flask"
+# секционированная таблица под представлением TABLE (migrations/005)
+PARTITIONED_TABLE = "intermediate_scheme.sbis_coll_sell_upd_partitioned"
+
+# самые частые регионы — в начале списка (выбор смещён к началу)
+LEADING_REGIONS = [77, 50, 78, 66, 16, 23, 54, 52, 61, 74, 63, 2, 24, 59, 36, 38, 34, 55, 42, 72]
+REGION_CODES = LEADING_REGIONS + [c for c in sorted(REGION_MAP) if c not in LEADING_REGIONS]
+
+NAME_WORDS = ["Альфа", "Вектор", "Гарант", "Деловые линии", "Импульс", "Квант", "Магистраль", "Меридиан",
+              "Монолит", "Октава", "Партнёр", "Прогресс", "Ресурс", "Сибирь", "Спектр", "Стройком",
+              "Техника", "Урал", "Феникс", "Энергия"]
+ITEM_WORDS = ["Болт", "Гайка", "Шайба", "Кабель", "Провод", "Автомат", "Розетка", "Труба", "Фитинг",
+              "Кран", "Насос", "Фильтр", "Подшипник", "Ремень", "Лампа", "Светильник", "Краска",
+              "Грунтовка", "Лист", "Уголок"]
+ITEM_SPECS = ["М6", "М8", "М10", "М12", "3x1,5", "3x2,5", "16А", "25А", "DN15", "DN20", "DN25",
+              "1 л", "5 л", "2 мм", "4 мм", "50x50"]
+GAU_GROUPS = ["Метизы", "Кабельная продукция", "Электрооборудование", "Трубопроводная арматура",
+              "Насосное оборудование", "Подшипники", "РТИ", "Светотехника", "ЛКМ", "Металлопрокат",
+              "Инструмент", "Спецодежда", "Хозтовары", "Сантехника", "Крепёж"]
+SALE_TYPES = ["опт", "опт", "опт", "розница", "маркетплейс"]
+
+COLUMNS = '''
+    doc_counterparty_inn text,
+    doc_counterparty_full_name text,
+    "Дата" date,
+    doc_number text,
+    doc_department text,
+    doc_assigned_manager text,
+    inside_doc_author text,
+    inside_doc_item_code text,
+    inside_doc_item_name text,
+    inside_doc_item_quantity numeric,
+    inside_doc_item_full_item_price numeric,
+    "Номенклатура.ГАУ" text,
+    "Номенклатура.ГАУ.Группа" text,
+    "Sale_type" text
+'''
+
+INSERT_COLUMNS = ('doc_counterparty_inn, doc_counterparty_full_name, "Дата", doc_number, doc_department, '
+                  'doc_assigned_manager, inside_doc_author, inside_doc_item_code, inside_doc_item_name, '
+                  'inside_doc_item_quantity, inside_doc_item_full_item_price, "Номенклатура.ГАУ", '
+                  '"Номенклатура.ГАУ.Группа", "Sale_type"')
+
+
+def parse_rows(value):
+    """100k, 1M, 10M или число."""
+    value = value.strip().lower()
+    for suffix, factor in (("k", 1_000), ("m", 1_000_000)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
+
+
+def generate(cur, rows, years, lines_per_doc):
+    params = {
+        "rows": rows,
+        "n_docs": max(1, rows // lines_per_doc),
+        "lines_per_doc": lines_per_doc,
+        "n_cp": max(1000, rows // 100),
+        "n_items": max(500, rows // 200),
+        "n_gau": 300,
+        "days": int(years * 365),
+        "codes": REGION_CODES,
+        "name_words": NAME_WORDS,
+        "item_words": ITEM_WORDS,
+        "item_specs": ITEM_SPECS,
+        "gau_groups": GAU_GROUPS,
+        "sale_types": SALE_TYPES,
+    }
+    # контрагенты: регион смещён к началу REGION_CODES; 0,5% — пустой или нецифровой ИНН
+    cur.execute("""
+        CREATE TEMP TABLE bench_counterparties ON COMMIT DROP AS
+        SELECT id,
+               CASE WHEN r < 0.003 THEN NULL
+                    WHEN r < 0.005 THEN 'ИП' || lpad(id::text, 10, '0')
+                    ELSE lpad(code::text, 2, '0') || lpad(floor(random() * 1e8)::bigint::text, 8, '0') END AS inn,
+               (ARRAY['ООО', 'ООО', 'АО', 'ИП', 'ПАО'])[1 + floor(random() * 5)::int] || ' "'
+                   || (%(name_words)s::text[])[1 + floor(random() * cardinality(%(name_words)s::text[]))::int]
+                   || ' ' || id || '"' AS name
+        FROM (SELECT id, random() AS r,
+                     (%(codes)s::int[])[1 + floor(cardinality(%(codes)s::int[]) * power(random(), 2))::int] AS code
+              FROM generate_series(1, %(n_cp)s) id) c
+    """, params)
+    # номенклатура: код ГАУ неравномерен, группа — по коду ГАУ; базовая цена от 10 до ~11 000
+    cur.execute("""
+        CREATE TEMP TABLE bench_items ON COMMIT DROP AS
+        SELECT id,
+               'ТМЦ-' || lpad(id::text, 6, '0') AS code,
+               (%(item_words)s::text[])[1 + floor(random() * cardinality(%(item_words)s::text[]))::int] || ' '
+                   || (%(item_specs)s::text[])[1 + floor(random() * cardinality(%(item_specs)s::text[]))::int]
+                   || ' арт. ' || id AS name,
+               gau,
+               'ГАУ-' || lpad(gau::text, 3, '0') AS gau_code,
+               (%(gau_groups)s::text[])[1 + gau %% cardinality(%(gau_groups)s::text[])] AS gau_group,
+               round((10 + exp(random() * 9.3))::numeric, 2) AS price
+        FROM (SELECT id, 1 + floor(%(n_gau)s * power(random(), 1.5))::int AS gau
+              FROM generate_series(1, %(n_items)s) id) i
+    """, params)
+    # документы: крупные покупатели чаще, свежие даты гуще, менеджер определяет отдел
+    cur.execute("""
+        CREATE TEMP TABLE bench_docs ON COMMIT DROP AS
+        SELECT id,
+               'УПД-' || lpad(id::text, 8, '0') AS number,
+               1 + floor(%(n_cp)s * power(random(), 3))::int AS cp,
+               current_date - floor(%(days)s * power(random(), 1.6))::int AS day,
+               manager,
+               'Отдел продаж ' || (1 + manager %% 8) AS department,
+               'Оператор ' || (1 + floor(random() * 25)::int) AS author,
+               (%(sale_types)s::text[])[1 + floor(random() * cardinality(%(sale_types)s::text[]))::int] AS sale_type
+        FROM (SELECT id, 1 + floor(60 * power(random(), 1.5))::int AS manager
+              FROM generate_series(1, %(n_docs)s) id) d
+    """, params)
+    cur.execute("ALTER TABLE bench_docs ADD PRIMARY KEY (id)")
+    cur.execute("ALTER TABLE bench_items ADD PRIMARY KEY (id)")
+    cur.execute("ALTER TABLE bench_counterparties ADD PRIMARY KEY (id)")
+    cur.execute(f"""
+        INSERT INTO {TABLE} ({INSERT_COLUMNS})
+        SELECT c.inn, c.name, d.day, d.number, d.department, 'Менеджер ' || d.manager, d.author,
+               t.code, t.name, l.qty, round(t.price * l.qty, 2), t.gau_code, t.gau_group, d.sale_type
+        FROM (SELECT i,
+                     1 + (i - 1) %% %(n_docs)s AS doc,
+                     1 + floor(%(n_items)s * power(random(), 2.5))::int AS item,
+                     1 + floor(20 * power(random(), 3))::int AS qty
+              FROM generate_series(1, %(rows)s) i) l
+        JOIN bench_docs d ON d.id = l.doc
+        JOIN bench_counterparties c ON c.id = d.cp
+        JOIN bench_items t ON t.id = l.item
+    """, params)
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=parse_rows, default=parse_rows("100k"), help="100k, 1M, 10M или число строк")
+    parser.add_argument("--years", type=float, default=3, help="период дат, лет")
+    parser.add_argument("--lines-per-doc", type=int, default=4)
+    parser.add_argument("--seed", type=float, default=0.42, help="setseed() для повторяемости, от -1 до 1")
+    parser.add_argument("--replace", action="store_true", help="очистить существующую таблицу")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**admin_db_config())
+    cur = conn.cursor()
+    cur.execute("CREATE SCHEMA IF NOT EXISTS intermediate_scheme")
+    cur.execute("CREATE SCHEMA IF NOT EXISTS service_toolkit")
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL, to_regclass(%s) IS NOT NULL", (TABLE, PARTITIONED_TABLE))
+    exists, partitioned = cur.fetchone()
+    storage = PARTITIONED_TABLE if partitioned else TABLE
+    if exists:
+        if not args.replace:
+            raise SystemExit(f"{TABLE} уже существует — запустите с --replace, чтобы заменить данные")
+        cur.execute(f"TRUNCATE {storage} RESTART IDENTITY")
+    else:
+        cur.execute(f"CREATE TABLE {TABLE} ({COLUMNS})")
+    if partitioned:
+        # строки сразу в секции своих месяцев, а не в секцию по умолчанию
+        cur.execute("SELECT service_toolkit.ensure_sales_partitions(current_date - %s, current_date)",
+                    (int(args.years * 365),))
+
+    start = time.perf_counter()
+    cur.execute("SELECT setseed(%s)", (args.seed,))
+    params = generate(cur, args.rows, args.years, args.lines_per_doc)
+    cur.execute('CREATE TABLE IF NOT EXISTS service_toolkit.upd_t ("datetime" timestamp)')
+    cur.execute('INSERT INTO service_toolkit.upd_t ("datetime") VALUES (date_trunc(\'second\', now()::timestamp))')
+    conn.commit()
+    print(f"{args.rows} строк, {params['n_docs']} документов, {params['n_cp']} контрагентов, "
+          f"{params['n_items']} позиций за {time.perf_counter() - start:.1f} с")
+
+    conn.autocommit = True
+    cur.execute(f"VACUUM ANALYZE {storage}")
+    conn.close()
+    print("миграции (индексы, сводные таблицы): python migrate.py")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Сценарии нагрузки на маршруты приложения: запросов/с, p50/p95/p99 и пиковый RSS.
+
+Сценарии (запросы идут через тестовый клиент Flask, без HTTP-сервера):
+
+    data_shallow  — /data, первые страницы по каждой колонке сортировки в обе стороны
+    data_deep     — /data, страницы в середине, ближе к концу и последняя (OFFSET)
+    autocomplete  — /autocomplete/<поле>, ввод по буквам: префиксы значений из снимка
+    export        — /export в xlsx и csv за последние --export-days дней данных
+    index         — / (страница с вариантами фильтров)
+
+Каждый сценарий выполняется в отдельном процессе (пиковый RSS — его собственный),
+первый проход прогревает снимки и индексы и в замер не входит. Кэш готовых
+ответов (http_cache.py) по умолчанию выключен, а кэш подсказок сбрасывается
+перед каждым запросом — иначе повторы отдаются из них; --warm-cache оставляет
+оба кэша включёнными. Результаты пишутся в benchmarks/results/ в JSON
+вместе с числом строк таблицы и коммитом — прогоны можно сравнить.
+
+    python -m benchmarks.generate --rows 1M --replace
+    python -m benchmarks.scenarios --label 1M-baseline --repeat 3
+    python -m benchmarks.scenarios --compare benchmarks/results/A.json benchmarks/results/B.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from urllib.parse import quote, urlencode
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ALL_SCENARIOS = ["data_shallow", "data_deep", "autocomplete", "export", "index"]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def data_url(**params):
+    return "/data?" + urlencode(dict(params, count="async", layout="columns"))
+
+
+def data_shallow(app, ctx):
+    return [data_url(sort_col=col, sort_dir=direction, page=page)
+            for col in app.COLUMN_ORDER for direction in ("asc", "desc") for page in (1, 2, 3)]
+
+
+def data_deep(app, ctx):
+    last = max(ctx["total_pages"], 1)
+    pages = sorted({max(1, last // 2), max(1, last * 9 // 10), last})
+    return [data_url(sort_col=col, sort_dir="desc", page=page) for col in app.COLUMN_ORDER for page in pages]
+
+
+def autocomplete(app, ctx):
+    rng = random.Random(ctx["seed"])
+    urls = []
+    for field in app.FIELDS:
+        values = [str(v) for v in ctx["options"].get(field, []) if v]
+        for value in rng.sample(values, min(2, len(values))):
+            urls += [f"/autocomplete/{quote(field)}?" + urlencode({"q": value[:n]})
+                     for n in range(1, min(len(value), 6) + 1)]
+    return urls
+
+
+def export(app, ctx):
+    return ["/export?" + urlencode({"format": fmt, "date_from": ctx["date_from"]}) for fmt in ("xlsx", "csv")]
+
+
+def index(app, ctx):
+    return ["/"] * 10
+
+
+SCENARIOS = {"data_shallow": data_shallow, "data_deep": data_deep, "autocomplete": autocomplete,
+             "export": export, "index": index}
+
+
+def scenario_context(app, seed, export_days):
+    """Данные для построения запросов: число страниц, снимок вариантов, начало периода выгрузки."""
+    conn = app.get_connection()
+    try:
+        version = app.get_data_version(conn)
+        options = app.filter_options.get(conn, version)
+        cur = conn.cursor()
+        cur.execute(f'SELECT COUNT(*), MAX("Дата") FROM {app.SALES_TABLE}')
+        total_rows, max_date = cur.fetchone()
+        cur.close()
+    finally:
+        app.release_connection(conn)
+    date_from = (max_date.toordinal() - export_days) if max_date else None
+    return {
+        "seed": seed,
+        "options": options,
+        "total_rows": total_rows,
+        "total_pages": app.total_pages_for(total_rows),
+        "date_from": datetime.fromordinal(date_from).strftime("%Y-%m-%d") if date_from else "",
+    }
+
+
+def run_one(name, repeat, seed, export_days, warm_cache):
+    """Один сценарий в этом процессе; печатает JSON с результатом."""
+    import app
+
+    ctx = scenario_context(app, seed, export_days)
+    urls = SCENARIOS[name](app, ctx)
+    client = app.app.test_client()
+    # без сброса после прогрева все подсказки — попадания в кэш
+    reset = app.autocomplete_cache.backend.clear if not warm_cache else None
+
+    def get(url):
+        if reset is not None:
+            reset()
+        response = client.get(url)
+        size = len(response.get_data())
+        response.close()
+        return response.status_code, size
+
+    for url in urls:  # прогрев: снимки, индексы подсказок, локальная копия
+        get(url)
+    timings, errors, size = [], 0, 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url in urls:
+            t = time.perf_counter()
+            status, n = get(url)
+            timings.append((time.perf_counter() - t) * 1000)
+            errors += status >= 400
+            size += n
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    print(json.dumps({
+        "scenario": name,
+        "requests": len(timings),
+        "errors": errors,
+        "seconds": elapsed,
+        "rps": len(timings) / elapsed if elapsed else 0,
+        "p50_ms": percentile(timings, 0.5),
+        "p95_ms": percentile(timings, 0.95),
+        "p99_ms": percentile(timings, 0.99),
+        "max_ms": timings[-1] if timings else 0,
+        "mb_sent": size / 1024 / 1024,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "table_rows": ctx["total_rows"],
+    }))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(f"{'scenario':<14}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'max ms':>10}{'peak RSS MB':>13}")
+    for r in results.values():
+        print(f"{r['scenario']:<14}{r['requests']:>9}{r['errors']:>8}{r['rps']:>9.1f}{r['p50_ms']:>9.1f}"
+              f"{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>10.1f}{r['peak_rss_mb']:>13.1f}")
+
+
+def compare(path_a, path_b):
+    with open(path_a, encoding="utf-8") as f:
+        a = json.load(f)
+    with open(path_b, encoding="utf-8") as f:
+        b = json.load(f)
+    for run, path in ((a, path_a), (b, path_b)):
+        print(f"{os.path.basename(path)}: {run['label'] or '-'}, коммит {run['commit']}, "
+              f"{run['table_rows']} строк, {run['created']}")
+
+    def delta(old, new):
+        return f"{(new - old) / old * 100:+.0f}%" if old else "-"
+
+    print(f"{'scenario':<14}{'req/s A':>9}{'req/s B':>9}{'Δ':>7}{'p95 A':>9}{'p95 B':>9}{'Δ':>7}"
+          f"{'p99 A':>9}{'p99 B':>9}{'Δ':>7}{'RSS A':>8}{'RSS B':>8}")
+    for name in a["scenarios"]:
+        if name not in b["scenarios"]:
+            continue
+        ra, rb = a["scenarios"][name], b["scenarios"][name]
+        print(f"{name:<14}{ra['rps']:>9.1f}{rb['rps']:>9.1f}{delta(ra['rps'], rb['rps']):>7}"
+              f"{ra['p95_ms']:>9.1f}{rb['p95_ms']:>9.1f}{delta(ra['p95_ms'], rb['p95_ms']):>7}"
+              f"{ra['p99_ms']:>9.1f}{rb['p99_ms']:>9.1f}{delta(ra['p99_ms'], rb['p99_ms']):>7}"
+              f"{ra['peak_rss_mb']:>8.0f}{rb['peak_rss_mb']:>8.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=ALL_SCENARIOS, choices=ALL_SCENARIOS)
+    parser.add_argument("--repeat", type=int, default=3, help="проходов по списку запросов сценария")
+    parser.add_argument("--seed", type=int, default=42, help="выбор значений для автоподсказок")
+    parser.add_argument("--export-days", type=int, default=30)
+    parser.add_argument("--warm-cache", action="store_true", help="не выключать кэш готовых ответов и подсказок")
+    parser.add_argument("--label", default="", help="метка прогона в имени файла результатов")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--compare", nargs=2, metavar=("A.json", "B.json"))
+    parser.add_argument("--one", choices=ALL_SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.one:
+        run_one(args.one, args.repeat, args.seed, args.export_days, args.warm_cache)
+        return
+
+    env = dict(os.environ)
+    if not args.warm_cache:
+        env["RESPONSE_CACHE_ENABLED"] = "0"
+    results = {}
+    for name in args.scenarios:
+        cmd = [sys.executable, "-m", "benchmarks.scenarios", "--one", name, "--repeat", str(args.repeat),
+               "--seed", str(args.seed), "--export-days", str(args.export_days)] + ["--warm-cache"] * args.warm_cache
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True, env=env).stdout
+        results[name] = json.loads(out.strip().splitlines()[-1])
+    print_results(results)
+
+    if args.no_save:
+        return
+    created = datetime.now()
+    run = {
+        "label": args.label,
+        "created": created.isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "table_rows": next(iter(results.values()))["table_rows"] if results else None,
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "warm_cache": args.warm_cache,
+        "scenarios": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, created.strftime("%Y%m%d-%H%M%S") + (f"-{args.label}" if args.label else "") + ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(run, f, ensure_ascii=False, indent=2)
+    print(f"результаты: {os.path.relpath(path)}")
+
+
+if __name__ == "__main__":
+    main()
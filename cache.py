@@ -0,0 +1,223 @@
+"""Кэш с ограничением размера (LRU), временем жизни и счётчиками.
+
+Бэкенды:
+  memory — словарь в памяти процесса (по умолчанию);
+  sqlite — файл SQLite, общий для всех воркеров gunicorn на одной машине
+           (у каждого кэша — своя таблица, так что один файл можно делить);
+  redis  — Redis-совместимый сервер (нужен пакет redis; вытеснение — политикой
+           сервера, например maxmemory-policy allkeys-lru).
+
+Записи привязаны к версии данных (метке загрузки из service_toolkit.upd_t):
+как только кэш видит новую версию, старые записи сбрасываются.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # redis нужен только для бэкенда redis
+    redis = None
+
+
+class MemoryBackend:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(value, expired) — value is None при промахе."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None, False
+            expires, value = item
+            if expires < time.time():
+                del self._data[key]
+                return None, True
+            self._data.move_to_end(key)
+            return value, False
+
+    def set(self, key, value, ttl):
+        """Возвращает число вытесненных записей."""
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            evicted = 0
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def size(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    # время последнего чтения (для LRU) пишется пачкой: UPDATE на каждое попадание
+    # выстраивал бы читателей в очередь за блокировкой записи SQLite
+    ACCESS_FLUSH_SECONDS = 5.0
+    ACCESS_FLUSH_ENTRIES = 500
+
+    def __init__(self, path, max_entries, namespace="cache"):
+        self.path = path
+        self.max_entries = max_entries
+        self.table = "cache_" + re.sub(r"[^A-Za-z0-9_]", "_", namespace)
+        self._local = threading.local()
+        self._accessed = {}
+        self._accessed_lock = threading.Lock()
+        self._flushed = time.time()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} "
+                         "(key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed)")
+            self._local.conn = conn
+        return conn
+
+    def _touch(self, key, now):
+        with self._accessed_lock:
+            self._accessed[key] = now
+            if len(self._accessed) < self.ACCESS_FLUSH_ENTRIES and now - self._flushed < self.ACCESS_FLUSH_SECONDS:
+                return
+        self._flush_accessed()
+
+    def _flush_accessed(self):
+        with self._accessed_lock:
+            pending, self._accessed, self._flushed = self._accessed, {}, time.time()
+        if not pending:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(f"UPDATE {self.table} SET accessed = ? WHERE key = ?",
+                             [(t, k) for k, t in pending.items()])
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute(f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, False
+        now = time.time()
+        if row[1] < now:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            return None, True
+        self._touch(key, now)
+        return json.loads(row[0]), False
+
+    def set(self, key, value, ttl):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                     (key, json.dumps(value, ensure_ascii=False, default=str), now + ttl, now))
+        over = self.size() - self.max_entries
+        if over > 0:
+            # перед вытеснением — накопленные времена чтения, иначе уйдут недавно читавшиеся записи
+            self._flush_accessed()
+            conn.execute(f"DELETE FROM {self.table} WHERE key IN "
+                         f"(SELECT key FROM {self.table} ORDER BY accessed LIMIT ?)", (over,))
+            return over
+        return 0
+
+    def clear(self):
+        with self._accessed_lock:
+            self._accessed.clear()
+        self._conn().execute(f"DELETE FROM {self.table}")
+
+    def size(self):
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class RedisBackend:
+    def __init__(self, url, prefix):
+        if redis is None:
+            raise RuntimeError("для CACHE_BACKEND=redis установите пакет redis")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return (json.loads(raw), False) if raw is not None else (None, False)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False, default=str), ex=int(ttl))
+        return 0
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + "*", count=1000):
+            self.client.delete(key)
+
+    def size(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*", count=1000))
+
+
+class Cache:
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self._version = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _check_version(self, version):
+        if version is None or version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            self._version = version
+            self._counters["invalidations"] += 1
+        self.backend.clear()
+
+    def get(self, key, version=None):
+        self._check_version(version)
+        value, expired = self.backend.get(f"{version}|{key}")
+        if expired:
+            self._count("expired")
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key, value, version=None):
+        self._check_version(version)
+        evicted = self.backend.set(f"{version}|{key}", value, self.ttl)
+        if evicted:
+            self._count("evictions", evicted)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["size"] = self.backend.size()
+        return stats
+
+
+def make_cache(kind, max_entries, ttl, url=None, namespace="cache"):
+    """Кэш по имени бэкенда из конфигурации (memory / sqlite / redis)."""
+    if kind == "sqlite":
+        backend = SQLiteBackend(url or f"{namespace}.sqlite3", max_entries, namespace)
+    elif kind == "redis":
+        backend = RedisBackend(url or "redis://localhost:6379/0", prefix=f"sales:{namespace}:")
+    else:
+        backend = MemoryBackend(max_entries)
+    return Cache(backend, ttl)
@@ -0,0 +1,84 @@
+"""Подсчёт строк для /data: кэш точных COUNT(*) и оценка планировщика.
+
+Точные значения живут до следующей загрузки данных (смена версии из
+service_toolkit.upd_t) в LRU-кэше (cache.py) не больше чем на max_entries наборов фильтров. Если по оценке планировщика фильтр затрагивает
+слишком много строк или COUNT(*) не укладывается в таймаут, отдаём оценку.
+"""
+import json
+
+from psycopg2 import errors
+
+from cache import Cache, MemoryBackend
+
+
+def normalize_filter_key(where_clause, values):
+    """Ключ набора фильтров: порядок значений внутри ANY(...) не важен."""
+    norm = [sorted(map(str, v)) if isinstance(v, (list, tuple)) else str(v) for v in values]
+    return json.dumps([where_clause, norm], ensure_ascii=False)
+
+
+class CountService:
+    def __init__(self, table, exact_max_rows=1_000_000, timeout_ms=2000, max_entries=10000, ttl=86400):
+        self.table = table
+        self.exact_max_rows = exact_max_rows
+        self.timeout_ms = timeout_ms
+        self._cache = Cache(MemoryBackend(max_entries), ttl)
+
+    def get_cached(self, where_clause, values, version):
+        """Точное значение из кэша или None."""
+        return self._cache.get(normalize_filter_key(where_clause, values), version)
+
+    def store(self, where_clause, values, version, total):
+        self._cache.set(normalize_filter_key(where_clause, values), total, version)
+
+    def stats(self):
+        """Счётчики кэша точных значений (как у кэшей cache.py)."""
+        return self._cache.stats()
+
+    def estimate(self, conn, where_clause, values):
+        """Оценка числа строк по плану запроса (без выполнения)."""
+        cur = conn.cursor()
+        cur.execute(f'EXPLAIN (FORMAT JSON) SELECT 1 FROM {self.table} {where_clause}', values)
+        plan = cur.fetchone()[0]
+        cur.close()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def exact(self, conn, where_clause, values, timeout_ms=None):
+        """COUNT(*) с ограничением по времени; None, если не уложились.
+           Отмена откатывает только точку сохранения, а не транзакцию запроса,
+           и после подсчёта возвращается прежний statement_timeout (таймаут маршрута)."""
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT current_setting('statement_timeout')")
+            previous = cur.fetchone()[0]
+            cur.execute("SAVEPOINT count_exact")
+            cur.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms or self.timeout_ms),))
+            try:
+                cur.execute(f'SELECT COUNT(*) FROM {self.table} {where_clause}', values)
+                total = cur.fetchone()[0]
+            except errors.QueryCanceled:
+                cur.execute("ROLLBACK TO SAVEPOINT count_exact")
+                total = None
+            else:
+                cur.execute("RELEASE SAVEPOINT count_exact")
+            cur.execute("SELECT set_config('statement_timeout', %s, true)", (previous,))
+            return total
+        finally:
+            cur.close()
+
+    def count(self, conn, where_clause, values, version, force_exact=False, timeout_ms=None):
+        """Возвращает (total, exact). Точный подсчёт запускается, только если
+           оценка не превышает exact_max_rows (или force_exact)."""
+        cached = self.get_cached(where_clause, values, version)
+        if cached is not None:
+            return cached, True
+
+        estimate = self.estimate(conn, where_clause, values)
+        if force_exact or estimate <= self.exact_max_rows:
+            total = self.exact(conn, where_clause, values, timeout_ms)
+            if total is not None:
+                self.store(where_clause, values, version, total)
+                return total, True
+        return estimate, False
@@ -0,0 +1,219 @@
+"""Потокобезопасный пул соединений PostgreSQL для потоков Flask/gunicorn.
+
+psycopg2.pool.SimpleConnectionPool не рассчитан на потоки и, когда все
+соединения заняты, сразу бросает PoolError. Здесь:
+
+  * выдача и возврат идут под одной блокировкой; если свободных соединений
+    нет и пул уже максимального размера, запрос встаёт в очередь (FIFO:
+    возвращённое соединение отдаётся первому ожидающему) и ждёт не дольше
+    timeout (PoolTimeout), а при max_waiting ожидающих сразу получает PoolFull;
+  * при выдаче закрытое соединение или соединение старше max_lifetime
+    пересоздаётся, простаивавшее дольше check_idle — проверяется SELECT 1;
+  * при возврате незавершённая транзакция откатывается, сломанное
+    соединение закрывается;
+  * statement_timeout задаётся при каждой выдаче (свой у каждого маршрута),
+    SET выполняется, только если значение у соединения другое;
+  * счётчики (занято, ожидают, время ожидания) — для /stats.
+
+Интерфейс getconn/putconn совпадает с psycopg2.pool.
+"""
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolError(Exception):
+    pass
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class PoolFull(PoolError):
+    pass
+
+
+class _Waiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.conn = None
+        self.slot = False      # вместо соединения — место под новое
+
+
+class ConnectionPool:
+    def __init__(self, minconn, maxconn, timeout=10.0, max_waiting=50, max_lifetime=3600.0,
+                 check_idle=30.0, statement_timeout_ms=0, **kwargs):
+        """kwargs — параметры psycopg2.connect; statement_timeout_ms — значение
+           при выдаче без явного таймаута (0 — без ограничения)."""
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_waiting = max_waiting
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self.statement_timeout_ms = statement_timeout_ms
+        self.kwargs = kwargs
+
+        self._idle = deque()
+        self._meta = {}        # conn -> {"created", "used", "statement_timeout"}
+        self._size = 0         # выданные + свободные + создаваемые
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._counters = {"acquired": 0, "timeouts": 0, "rejected": 0, "recycled": 0, "broken": 0,
+                          "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+        for _ in range(minconn):
+            self._idle.append(self._connect())
+            self._size += 1
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.kwargs)
+        now = time.monotonic()
+        self._meta[conn] = {"created": now, "used": now, "statement_timeout": None}
+        return conn
+
+    def _discard(self, conn):
+        self._meta.pop(conn, None)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _release_slot(self):
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.slot = True
+                waiter.event.set()
+            else:
+                self._size -= 1
+
+    def _replace(self, conn, counter):
+        """Новое соединение вместо conn (место в пуле сохраняется)."""
+        self._discard(conn)
+        with self._lock:
+            self._counters[counter] += 1
+        try:
+            return self._connect()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _check(self, conn):
+        meta = self._meta[conn]
+        now = time.monotonic()
+        if conn.closed or now - meta["created"] > self.max_lifetime:
+            return self._replace(conn, "recycled" if not conn.closed else "broken")
+        if now - meta["used"] > self.check_idle:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return self._replace(conn, "broken")
+        return conn
+
+    def _set_statement_timeout(self, conn, timeout_ms):
+        meta = self._meta[conn]
+        if meta["statement_timeout"] == timeout_ms:
+            return
+        cur = conn.cursor()
+        cur.execute("SET statement_timeout = %s", (int(timeout_ms),))
+        cur.close()
+        # SET в транзакции откатился бы вместе с ней при возврате в пул
+        conn.commit()
+        meta["statement_timeout"] = timeout_ms
+
+    def getconn(self, statement_timeout_ms=None, timeout=None):
+        """Свободное соединение; ждёт не дольше timeout секунд (по умолчанию — из пула)."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        conn = None
+        waiter = None
+        with self._lock:
+            if self._idle:
+                conn = self._idle.pop()
+            elif self._size < self.maxconn:
+                self._size += 1
+            elif len(self._waiters) >= self.max_waiting:
+                self._counters["rejected"] += 1
+                raise PoolFull(f"все {self.maxconn} соединений с БД заняты, очередь ожидания заполнена")
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+
+        if waiter is not None:
+            waiter.event.wait(timeout)
+            with self._lock:
+                # соединение могли отдать одновременно с истечением таймаута
+                if waiter.conn is None and not waiter.slot:
+                    self._waiters.remove(waiter)
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeout(f"нет свободного соединения с БД за {timeout:g} с")
+            conn = waiter.conn
+
+        with self._lock:
+            waited = time.monotonic() - start
+            self._counters["acquired"] += 1
+            self._counters["wait_seconds"] += waited
+            self._counters["max_wait_seconds"] = max(self._counters["max_wait_seconds"], waited)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._release_slot()
+                raise
+        else:
+            conn = self._check(conn)
+        try:
+            self._set_statement_timeout(conn, self.statement_timeout_ms if statement_timeout_ms is None
+                                        else statement_timeout_ms)
+        except psycopg2.Error:
+            self.putconn(conn, close=True)
+            raise
+        return conn
+
+    def putconn(self, conn, close=False):
+        meta = self._meta.get(conn)
+        if meta is None:
+            raise PoolError("соединение не из этого пула")
+        if not close and not conn.closed:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+        if close or conn.closed:
+            self._discard(conn)
+            self._release_slot()
+            return
+        meta["used"] = time.monotonic()
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.conn = conn
+                waiter.event.set()
+            else:
+                self._idle.append(conn)
+
+    def closeall(self):
+        with self._lock:
+            while self._idle:
+                self._discard(self._idle.pop())
+                self._size -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update(size=self._size, idle=len(self._idle), in_use=self._size - len(self._idle),
+                         waiting=len(self._waiters), min=self.minconn, max=self.maxconn)
+        stats["avg_wait_ms"] = stats["wait_seconds"] * 1000 / stats["acquired"] if stats["acquired"] else 0.0
+        return stats
@@ -0,0 +1,277 @@
+"""Выгрузка продаж без загрузки всего результата в память.
+
+Строки читаются из серверного (именованного) курсора пачками и сразу
+пишутся в файл (xlsx в режиме XlsxWriter constant_memory, Parquet и
+Arrow IPC — record batch'ами), поэтому пиковое потребление памяти
+определяется размером пачки, а не числом строк. CSV отдаётся потоком
+прямо из COPY ... TO STDOUT.
+"""
+import datetime
+import decimal
+import queue
+import threading
+import uuid
+import zlib
+
+import psycopg2.extensions
+import xlsxwriter
+
+from regions import region_names_arrow
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet/Arrow доступны только при установленном pyarrow
+    pa = pq = None
+
+EXPORT_FORMATS = {
+    # формат: (расширение, mimetype)
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("csv", "text/csv; charset=utf-8"),
+    "csv.gz": ("csv.gz", "application/gzip"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+ARROW_FORMATS = ("parquet", "arrow")
+
+EXPORT_BATCH_SIZE = 10000
+# сколько строк из каждой пачки смотреть при подборе ширины колонок
+WIDTH_SAMPLE_ROWS = 500
+
+
+# numeric из БД читаем сразу как float: все форматы выгрузки пишут его числом
+NUMERIC_AS_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values, "NUMERIC_AS_FLOAT",
+    lambda value, cur: float(value) if value is not None else None)
+
+# OID типов PostgreSQL -> тип колонки Arrow
+_ARROW_TYPES_BY_OID = {
+    16: "bool", 20: "int64", 21: "int64", 23: "int64", 700: "float64", 701: "float64",
+    1700: "float64", 1082: "date32", 1114: "timestamp", 1184: "timestamp",
+}
+
+
+def is_available(fmt):
+    return fmt in EXPORT_FORMATS and (fmt not in ARROW_FORMATS or pa is not None)
+
+
+def iter_batches(conn, query, values, batch_size=EXPORT_BATCH_SIZE, description=None):
+    """Генератор пачек строк (списков кортежей) из серверного курсора.
+       Если передан список description, в него кладётся cursor.description."""
+    cur = conn.cursor(name=f"export_{uuid.uuid4().hex}")
+    cur.itersize = batch_size
+    psycopg2.extensions.register_type(NUMERIC_AS_FLOAT, cur)
+    try:
+        cur.execute(query, values)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if description is not None and not description:
+                description.extend(cur.description or [])
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+def _sample(rows):
+    if len(rows) <= WIDTH_SAMPLE_ROWS:
+        return rows
+    return rows[::len(rows) // WIDTH_SAMPLE_ROWS]
+
+
+def write_xlsx(fileobj, columns, batches, sheet_name="Продажи", progress=None):
+    """Пишет пачки строк (порядок значений = columns) в xlsx-файл fileobj.
+       progress(rows_written) вызывается после каждой пачки. Возвращает число строк."""
+    workbook = xlsxwriter.Workbook(fileobj, {"constant_memory": True})
+    worksheet = workbook.add_worksheet(sheet_name)
+
+    header_format = workbook.add_format({'bold': True, 'align': 'center', 'valign': 'vcenter', 'fg_color': '#DDEBF7', 'border': 1})
+    number_format = workbook.add_format({'num_format': '#,##0.00', 'border': 1})
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd', 'border': 1})
+    row_formats = [workbook.add_format({'bg_color': '#FFFFFF', 'border': 1}),
+                   workbook.add_format({'bg_color': '#F3F3F3', 'border': 1})]
+
+    # в constant_memory строки пишутся строго по порядку, а ширину колонок
+    # можно задать в конце — поэтому считаем её по ходу, по выборке из пачек
+    widths = [len(str(c)) for c in columns]
+    for col_num, value in enumerate(columns):
+        worksheet.write_string(0, col_num, value, header_format)
+
+    row_num = 0
+    for rows in batches:
+        for row in rows:
+            row_num += 1
+            fmt = row_formats[row_num % 2]
+            for col_num, cell in enumerate(row):
+                if cell is None:
+                    worksheet.write_blank(row_num, col_num, None, fmt)
+                elif isinstance(cell, (int, float, decimal.Decimal)) and not isinstance(cell, bool):
+                    worksheet.write_number(row_num, col_num, float(cell), number_format)
+                elif isinstance(cell, (datetime.date, datetime.datetime)):
+                    worksheet.write_datetime(row_num, col_num, cell, date_format)
+                else:
+                    worksheet.write_string(row_num, col_num, str(cell), fmt)
+        for row in _sample(rows):
+            for col_num, cell in enumerate(row):
+                if cell is not None:
+                    width = len(str(cell))
+                    if width > widths[col_num]:
+                        widths[col_num] = width
+        if progress:
+            progress(row_num)
+
+    for i, width in enumerate(widths):
+        worksheet.set_column(i, i, width + 2)
+    worksheet.freeze_panes(1, 0)
+    workbook.close()
+    return row_num
+
+
+def _arrow_type(type_code):
+    name = _ARROW_TYPES_BY_OID.get(type_code, "string")
+    if name == "timestamp":
+        return pa.timestamp("us")
+    return getattr(pa, name)()
+
+
+def write_arrow(fileobj, fmt, batches, description, progress=None, region_at=None):
+    """Пишет пачки строк в Parquet или Arrow IPC (file format) record batch'ами.
+       Схема берётся из cursor.description (description заполняется iter_batches).
+       region_at — позиция, куда вставить колонку "Регион", вычисленную по ИНН."""
+    writer = schema = None
+    row_num = 0
+
+    def make_schema():
+        fields = [pa.field(d[0], _arrow_type(d[1])) for d in description]
+        if region_at is not None:
+            fields.insert(region_at, pa.field("Регион", pa.string()))
+        return pa.schema(fields)
+
+    def open_writer():
+        if fmt == "parquet":
+            return pq.ParquetWriter(fileobj, schema, compression="snappy")
+        return pa.ipc.new_file(fileobj, schema)
+
+    try:
+        for rows in batches:
+            if schema is None:
+                schema = make_schema()
+                writer = open_writer()
+            db_fields = [f for f in schema if region_at is None or f.name != "Регион"]
+            arrays = [pa.array(col, type=field.type) for col, field in zip(zip(*rows), db_fields)]
+            if region_at is not None:
+                inn = arrays[[f.name for f in db_fields].index("doc_counterparty_inn")]
+                arrays.insert(region_at, region_names_arrow(inn))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            row_num += len(rows)
+            if progress:
+                progress(row_num)
+        if writer is None:
+            # пустой результат: файл только со схемой
+            schema = make_schema()
+            writer = open_writer()
+    finally:
+        if writer is not None:
+            writer.close()
+    return row_num
+
+
+def copy_csv_sql(cur, query, values):
+    """COPY для выгрузки в CSV: параметры подставляются на клиенте (mogrify)."""
+    encoding = psycopg2.extensions.encodings.get(cur.connection.encoding, "utf-8")
+    select = cur.mogrify(query, values).decode(encoding)
+    return f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)"
+
+
+class _QueueWriter:
+    """Файлоподобный приёмник для copy_expert: складывает куски в очередь.
+       Если потребитель ушёл (stop), прерывает COPY исключением."""
+
+    def __init__(self, chunks, stop):
+        self.chunks = chunks
+        self.stop = stop
+
+    def write(self, data):
+        if self.stop.is_set():
+            raise IOError("выгрузка прервана клиентом")
+        self.chunks.put(bytes(data) if not isinstance(data, str) else data.encode("utf-8"))
+
+
+class CsvStream:
+    """Байты CSV из COPY ... TO STDOUT. COPY начинается сразу (в фоновом потоке с
+       ограниченной очередью), а не при первом чтении, поэтому close() останавливает
+       его, даже если передача так и не началась: on_finish(ok) вызывается ровно один
+       раз по завершении COPY в любом случае (иначе соединение не вернулось бы в пул)."""
+
+    def __init__(self, conn, query, values, compress=False, on_finish=None):
+        self._chunks = queue.Queue(maxsize=64)
+        self._stop = threading.Event()
+        self._done = object()
+        self._error = None
+        self._finished = threading.Event()
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        threading.Thread(target=self._produce, args=(conn, query, values, on_finish),
+                         name="csv-copy", daemon=True).start()
+
+    def _produce(self, conn, query, values, on_finish):
+        cur = conn.cursor()
+        try:
+            cur.copy_expert(copy_csv_sql(cur, query, values), _QueueWriter(self._chunks, self._stop))
+        except Exception as e:
+            self._error = e
+        finally:
+            cur.close()
+            if on_finish:
+                on_finish(self._error is None)
+            self._finished.set()
+            self._chunks.put(self._done)
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk = self._chunks.get()
+                if chunk is self._done:
+                    break
+                if self._compressor:
+                    chunk = self._compressor.compress(chunk)
+                    if not chunk:
+                        continue
+                yield chunk
+            if self._error is not None:
+                raise self._error
+            if self._compressor:
+                yield self._compressor.flush()
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
+        # освобождаем производителя, если он ждёт места в очереди
+        while not self._chunks.empty():
+            try:
+                self._chunks.get_nowait()
+            except queue.Empty:
+                break
+
+    def wait(self):
+        """Ждёт конца COPY (после close() — его прерывания): до этого соединение занято."""
+        self._finished.wait()
+
+
+def stream_csv(conn, query, values, compress=False, on_finish=None):
+    """CsvStream: байты CSV из COPY ... TO STDOUT; on_finish(ok) — по завершении COPY."""
+    return CsvStream(conn, query, values, compress=compress, on_finish=on_finish)
+
+
+def write_csv(fileobj, conn, query, values, compress=False):
+    """CSV (или csv.gz) в файл целиком, для фоновых выгрузок. Возвращает управление
+       (и при ошибке записи в файл) только после конца COPY в фоновом потоке —
+       после этого соединение можно вернуть в пул."""
+    stream = stream_csv(conn, query, values, compress=compress)
+    try:
+        for chunk in stream:
+            fileobj.write(chunk)
+    finally:
+        stream.close()
+        stream.wait()
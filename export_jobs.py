@@ -0,0 +1,217 @@
+"""Фоновые выгрузки: очередь заданий, пул потоков-исполнителей и хранение результатов.
+
+Состояние задания дублируется в <job_id>.json рядом с файлом результата,
+поэтому статус и скачивание работают из любого воркера gunicorn, а не
+только из процесса, который принял задание. Там же лежат файлы ключей
+<sha1(key)>.key с id активного задания: файл создаётся атомарно (os.link
+завершается ошибкой, если он уже есть), так что одинаковые выгрузки не
+дублируются и между воркерами.
+"""
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ExportJobManager:
+    def __init__(self, run_job, result_dir, workers=2, max_queue=20, result_ttl=3600, cleanup_interval=60):
+        """run_job(job, path, report) строит файл по job["params"]; обновляя
+           job["rows_written"] / job["total_rows"], вызывает report() для сохранения прогресса.
+           Устаревшие результаты удаляются не чаще раза в cleanup_interval секунд: при постановке
+           задания, запросе статуса или скачивании и по таймеру в потоках-исполнителях."""
+        self.run_job = run_job
+        self.result_dir = result_dir
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.cleanup_interval = cleanup_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._last_cleanup = 0.0
+
+    # ---- публичный интерфейс ----
+    def submit(self, key, params, extension="xlsx"):
+        """Ставит задание в очередь. Если такое же (по key) уже в очереди или
+           выполняется — возвращает его. Возвращает (job, created)."""
+        self._start_workers()
+        self._maybe_cleanup()
+        job = {
+            "id": uuid.uuid4().hex, "key": key, "params": params, "status": "queued",
+            "extension": extension, "rows_written": 0, "total_rows": None,
+            "created": time.time(), "finished": None, "error": None,
+        }
+        # состояние пишется до ключа: другой воркер, нашедший ключ, сразу видит статус задания
+        self._save_state(job)
+        for _ in range(3):
+            active_id = self._claim_key(key, job["id"])
+            if active_id is None:
+                break
+            active = self.get(active_id)
+            if active and active["status"] in ACTIVE_STATUSES:
+                self._remove(self._state_path(job["id"]))
+                return active, False
+            # ключ остался от завершённого задания (или от упавшего процесса) — освобождаем его
+            self._release_key(key, active_id)
+        else:
+            self._remove(self._state_path(job["id"]))
+            raise QueueFull("очередь выгрузок переполнена, попробуйте позже")
+        with self._lock:
+            try:
+                self._queue.put_nowait(job["id"])
+            except queue.Full:
+                self._release_key(key, job["id"])
+                self._remove(self._state_path(job["id"]))
+                raise QueueFull("очередь выгрузок переполнена, попробуйте позже")
+            self._jobs[job["id"]] = job
+        return job, True
+
+    def get(self, job_id):
+        """Задание по id (из памяти или из файла состояния) либо None."""
+        if not JOB_ID_RE.match(job_id or ""):
+            return None
+        self._maybe_cleanup()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job:
+            return job
+        try:
+            with open(self._state_path(job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def result_path(self, job):
+        return os.path.join(self.result_dir, f'{job["id"]}.{job["extension"]}')
+
+    def public_state(self, job):
+        return {k: job.get(k) for k in ("id", "status", "rows_written", "total_rows", "created", "finished", "error")}
+
+    def cleanup(self):
+        """Удаляет результаты, состояние и ключи заданий старше result_ttl."""
+        now = time.time()
+        self._last_cleanup = now
+        try:
+            names = os.listdir(self.result_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.result_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.result_ttl:
+                    os.remove(path)
+            except OSError:
+                continue
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job["finished"] and now - job["finished"] > self.result_ttl:
+                    del self._jobs[job_id]
+
+    def _maybe_cleanup(self):
+        if time.time() - self._last_cleanup >= self.cleanup_interval:
+            self.cleanup()
+
+    # ---- ключи активных заданий ----
+    def _key_path(self, key):
+        return os.path.join(self.result_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".key")
+
+    def _claim_key(self, key, job_id):
+        """Создаёт файл ключа с job_id. None — ключ наш, иначе id задания, которому он уже принадлежит."""
+        path = self._key_path(key)
+        tmp = f"{path}.{job_id}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(job_id)
+            try:
+                # link, в отличие от replace, не перезаписывает существующий файл
+                os.link(tmp, path)
+                return None
+            except FileExistsError:
+                pass
+        finally:
+            self._remove(tmp)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            # ключ удалили между link и чтением — пусть вызывающий попробует снова
+            return ""
+
+    def _release_key(self, key, job_id):
+        """Удаляет файл ключа, если он всё ещё принадлежит job_id."""
+        path = self._key_path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                if f.read().strip() != job_id:
+                    return
+        except OSError:
+            return
+        self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # ---- исполнители ----
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            os.makedirs(self.result_dir, exist_ok=True)
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"export-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _worker(self):
+        while True:
+            try:
+                job_id = self._queue.get(timeout=self.cleanup_interval)
+            except queue.Empty:
+                self._maybe_cleanup()
+                continue
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            job["status"] = "running"
+            self._save_state(job)
+            path = self.result_path(job)
+            try:
+                self.run_job(job, path, lambda: self._save_state(job))
+                job["status"] = "done"
+            except Exception as e:
+                job["status"] = "error"
+                job["error"] = str(e)
+                if os.path.exists(path):
+                    os.remove(path)
+            job["finished"] = time.time()
+            self._save_state(job)
+            self._release_key(job["key"], job["id"])
+
+    def _state_path(self, job_id):
+        return os.path.join(self.result_dir, f"{job_id}.json")
+
+    def _save_state(self, job):
+        state = dict(self.public_state(job), extension=job["extension"])
+        tmp = self._state_path(job["id"]) + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp, self._state_path(job["id"]))
+        except OSError:
+            pass
@@ -0,0 +1,187 @@
+"""Зависимые списки фильтров в памяти: «какие значения поля X остались при
+выбранных значениях остальных полей» без DISTINCT по таблице.
+
+Каждая колонка кодируется словарём (отсортированные значения + код строки,
+-1 для NULL). Для каждого значения хранится список номеров строк — сжатый
+вид побитовой маски: строки колонки, упорядоченные по коду (argsort), и
+границы групп (CSR). Маска фильтра по полю собирается из списков выбранных
+значений, маски разных полей пересекаются, а значения поля X берутся из
+его кодов под итоговой маской (bincount).
+
+Индекс неизменяем: при новой загрузке (service_toolkit.upd_t) строится
+новый объект. refresh() перечитывает из БД только последние дни по "Дата",
+если строки до этого окна не изменились, иначе загружает всё заново.
+
+Память (в каждом воркере gunicorn своя копия): на строку — по 8 байт на
+колонку (код и позиция в списке строк, int32) и 8 байт на дату, плюс словари
+различных значений. Для 8 колонок это около 72 байт на строку, то есть
+около 360 МБ при FACETS_MAX_ROWS = 5 млн. Строки читаются пачками по
+FETCH_SIZE и сразу кодируются: пик при загрузке — индекс плюс одна пачка.
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+FETCH_SIZE = 50000
+
+
+class _Column:
+    def __init__(self, dictionary, codes):
+        self.dictionary = dictionary          # np.ndarray(object), отсортированные значения
+        self.codes = codes                    # np.int32, -1 — NULL
+        self.order = np.argsort(codes, kind="stable").astype(np.int32)
+        self.bounds = np.searchsorted(codes[self.order], np.arange(len(dictionary) + 1))
+        self.lookup = {str(v): i for i, v in enumerate(dictionary)}
+
+    def rows(self, code):
+        return self.order[self.bounds[code]:self.bounds[code + 1]]
+
+    def mask(self, values, n):
+        """Маска строк, где колонка равна одному из values (строки из запроса)."""
+        mask = np.zeros(n, dtype=bool)
+        for v in values:
+            code = self.lookup.get(str(v))
+            if code is not None:
+                mask[self.rows(code)] = True
+        return mask
+
+
+def _encode(raw):
+    codes, uniques = pd.factorize(pd.Series(raw, dtype=object), sort=True)
+    return np.asarray(uniques, dtype=object), codes.astype(np.int32)
+
+
+class _Encoder:
+    """Кодирование колонки по пачкам строк: коды пачки — номера значений в порядке
+       появления, в конце словарь сортируется и коды перенумеровываются (как _encode)."""
+
+    def __init__(self):
+        self.ids = {}
+        self.parts = []
+
+    def add(self, raw):
+        codes, uniques = pd.factorize(pd.Series(raw, dtype=object))
+        remap = np.empty(len(uniques) + 1, dtype=np.int32)
+        for i, value in enumerate(uniques):
+            remap[i] = self.ids.setdefault(value, len(self.ids))
+        remap[-1] = -1  # NULL (код -1) остаётся -1
+        self.parts.append(remap[codes])
+
+    def finish(self):
+        dictionary, rank = _encode(list(self.ids))
+        codes = np.concatenate(self.parts) if self.parts else np.empty(0, dtype=np.int32)
+        return dictionary, np.append(rank, -1).astype(np.int32)[codes]
+
+
+def _merge(old_dictionary, old_codes, new_dictionary, new_codes):
+    """Общий отсортированный словарь и перекодированные коды обеих частей."""
+    merged = pd.Index(old_dictionary, dtype=object).union(pd.Index(new_dictionary, dtype=object))
+    parts = []
+    for dictionary, codes in ((old_dictionary, old_codes), (new_dictionary, new_codes)):
+        remap = np.append(merged.get_indexer(pd.Index(dictionary, dtype=object)), -1).astype(np.int32)
+        parts.append(remap[codes])  # код -1 попадает на последний элемент remap, то есть остаётся -1
+    return np.asarray(merged, dtype=object), np.concatenate(parts)
+
+
+def _to_dates(raw):
+    return pd.to_datetime(pd.Series(raw, dtype=object), errors="coerce").to_numpy(dtype="datetime64[us]")
+
+
+def _read(conn, table, columns, date_expr, where="", values=(), max_rows=None):
+    """Закодированные колонки {имя: (словарь, коды)} и даты (datetime64);
+       None, если строк больше max_rows."""
+    names = list(columns)
+    select = ", ".join([columns[name] for name in names] + [date_expr])
+    encoders = {name: _Encoder() for name in names}
+    dates = []
+    n = 0
+    with conn.cursor(name="facets_load") as cur:
+        cur.itersize = FETCH_SIZE
+        cur.execute(f"SELECT {select} FROM {table} {where}", list(values))
+        while True:
+            rows = cur.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            n += len(rows)
+            if max_rows is not None and n > max_rows:
+                return None
+            for i, name in enumerate(names):
+                encoders[name].add([r[i] for r in rows])
+            dates.append(_to_dates([r[-1] for r in rows]))
+    conn.commit()
+    dates = np.concatenate(dates) if dates else np.empty(0, dtype="datetime64[us]")
+    return {name: encoder.finish() for name, encoder in encoders.items()}, dates
+
+
+class FacetIndex:
+    def __init__(self, table, columns, date_expr, encoded, dates):
+        """encoded — {имя: (словарь, коды)}; dates — datetime64 по строкам."""
+        self.table = table
+        self.column_sql = columns
+        self.date_expr = date_expr
+        self.dates = dates
+        self.columns = {name: _Column(*encoded[name]) for name in columns}
+
+    def __len__(self):
+        return len(self.dates)
+
+    @classmethod
+    def load(cls, conn, table, columns, date_expr, max_rows=None):
+        """Полная загрузка; columns — {имя: SQL-выражение}. None, если таблица больше max_rows."""
+        data = _read(conn, table, columns, date_expr, max_rows=max_rows)
+        if data is None:
+            return None
+        return cls(table, columns, date_expr, *data)
+
+    def refresh(self, conn, window_days, max_rows=None):
+        """Новый индекс после загрузки: перечитываем строки с "Дата" не раньше
+           (последняя дата - window_days) и строки без даты."""
+        known = self.dates[~np.isnat(self.dates)]
+        if not len(known):
+            return self.load(conn, self.table, self.column_sql, self.date_expr, max_rows)
+        cutoff = (known.max() - np.timedelta64(window_days, "D")).astype("datetime64[D]").item()
+        keep = self.dates < np.datetime64(cutoff)
+
+        # строки до окна должны остаться теми же, иначе (перезагрузка истории) читаем всё
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM {self.table} WHERE {self.date_expr} < %s", (cutoff,))
+            old_rows = cur.fetchone()[0]
+        if old_rows != int(keep.sum()):
+            return self.load(conn, self.table, self.column_sql, self.date_expr, max_rows)
+
+        limit = None if max_rows is None else max_rows - old_rows
+        data = _read(conn, self.table, self.column_sql, self.date_expr,
+                     f"WHERE {self.date_expr} >= %s OR {self.date_expr} IS NULL", (cutoff,), limit)
+        if data is None:
+            return None
+        window, dates = data
+        encoded = {}
+        for name, column in self.columns.items():
+            encoded[name] = _merge(column.dictionary, column.codes[keep], *window[name])
+        return FacetIndex(self.table, self.column_sql, self.date_expr, encoded,
+                          np.concatenate([self.dates[keep], dates]))
+
+    def mask(self, filters, date_from=None, date_to=None, exclude=None):
+        """Маска строк под фильтрами {поле: [значения]} и датами; None — без ограничений.
+           Фильтр по полю exclude не применяется (значения самого поля не сужаем)."""
+        n = len(self)
+        mask = None
+        for name, values in filters.items():
+            if name == exclude or not values or name not in self.columns:
+                continue
+            m = self.columns[name].mask(values, n)
+            mask = m if mask is None else mask & m
+        for bound, compare in ((date_from, np.greater_equal), (date_to, np.less_equal)):
+            if bound:
+                m = compare(self.dates, np.datetime64(datetime.date.fromisoformat(str(bound)[:10])))
+                mask = m if mask is None else mask & m
+        return mask
+
+    def values(self, field, filters, date_from=None, date_to=None):
+        """Различные непустые значения field (по возрастанию) при фильтрах по остальным полям."""
+        column = self.columns[field]
+        mask = self.mask(filters, date_from, date_to, exclude=field)
+        codes = column.codes if mask is None else column.codes[mask]
+        present = np.flatnonzero(np.bincount(codes + 1, minlength=len(column.dictionary) + 1)[1:])
+        return [v for v in column.dictionary[present] if v]
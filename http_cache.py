@@ -0,0 +1,115 @@
+"""Кэш HTTP-ответов Flask, привязанный к версии данных.
+
+Ответ маршрута зависит только от пути, параметров запроса и метки последней
+загрузки (MAX("datetime") из service_toolkit.upd_t), поэтому:
+
+  * ключ — путь и параметры (отсортированные, значения списков тоже);
+  * ETag — хэш версии и ключа: на If-None-Match с тем же ETag отвечаем 304,
+    не вызывая маршрут и не беря соединение из пула;
+  * тело ответа 200 хранится в кэше из cache.py (ограничен числом записей,
+    сбрасывается при новой версии) вместе со сжатыми вариантами (gzip и,
+    если установлен пакет brotli, br) — повторный запрос с теми же
+    фильтрами отдаётся без обращения к PostgreSQL.
+
+Маршрут может запретить кэширование ответа заголовком Cache-Control: no-store
+(например, когда число строк ещё не посчитано).
+"""
+import base64
+import gzip
+import hashlib
+import threading
+from functools import wraps
+
+from flask import Response, make_response, request
+
+try:
+    import brotli
+except ImportError:  # сжатие br — только при установленном пакете brotli
+    brotli = None
+
+COMPRESSORS = {"gzip": lambda body: gzip.compress(body, 6)}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+
+
+def request_key():
+    """Путь и параметры запроса; порядок параметров и значений внутри списка не важен."""
+    parts = [request.path]
+    for k in sorted(request.args.keys()):
+        parts.append(f"{k}={'|'.join(sorted(request.args.getlist(k)))}")
+    return "|".join(parts)
+
+
+class ResponseCache:
+    def __init__(self, store, version, max_age=0, encodings=("gzip",), min_size=1024):
+        """store — Cache из cache.py; version() — текущая метка загрузки данных;
+           max_age — секунд, которые браузер может не перепроверять ответ;
+           encodings — сжатые варианты тела (для тел от min_size байт)."""
+        self.store = store
+        self.version = version
+        self.max_age = max_age
+        self.encodings = [e for e in encodings if e in COMPRESSORS]
+        self.min_size = min_size
+        self._lock = threading.Lock()
+        self._not_modified = 0
+
+    @staticmethod
+    def etag(version, key):
+        return hashlib.sha1(f"{version}|{key}".encode("utf-8")).hexdigest()
+
+    def _validators(self, response, tag):
+        response.set_etag(tag, weak=True)
+        response.cache_control.private = True
+        response.cache_control.max_age = self.max_age
+        response.cache_control.must_revalidate = True
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def _entry(self, response):
+        body = response.get_data()
+        entry = {"content_type": response.content_type, "body": base64.b64encode(body).decode("ascii"),
+                 "encoded": {}}
+        if len(body) >= self.min_size:
+            for encoding in self.encodings:
+                entry["encoded"][encoding] = base64.b64encode(COMPRESSORS[encoding](body)).decode("ascii")
+        return entry
+
+    def _respond(self, entry, tag):
+        encoding = request.accept_encodings.best_match(list(entry["encoded"]))
+        response = Response(base64.b64decode(entry["encoded"][encoding] if encoding else entry["body"]),
+                            content_type=entry["content_type"])
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return self._validators(response, tag)
+
+    def cached(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                version = self.version()
+            except Exception:
+                # версию не узнать (БД недоступна) — маршрут ответит сам
+                return view(*args, **kwargs)
+            key = request_key()
+            tag = self.etag(version, key)
+            if request.if_none_match.contains_weak(tag):
+                with self._lock:
+                    self._not_modified += 1
+                return self._validators(Response(status=304), tag)
+
+            entry = self.store.get(key, version)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+                        or response.cache_control.no_store):
+                    return response
+                entry = self._entry(response)
+                self.store.set(key, entry, version)
+            return self._respond(entry, tag)
+        return wrapper
+
+    def stats(self):
+        stats = self.store.stats()
+        with self._lock:
+            stats["not_modified"] = self._not_modified
+        return stats
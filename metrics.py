@@ -0,0 +1,248 @@
+"""Метрики приложения в текстовом формате Prometheus (без внешних зависимостей).
+
+  * время запросов по маршрутам и по фазам внутри них (ожидание соединения
+    из пула, SQL, подготовка ответа, сериализация, запись файла выгрузки);
+  * время каждого SQL-запроса по «отпечатку» — тексту запроса, в котором
+    литералы и параметры заменены на ?, — и число возвращённых строк;
+  * журнал медленных запросов (по желанию): запрос дольше порога
+    повторяется в фоне на отдельном соединении под EXPLAIN (ANALYZE, BUFFERS)
+    и пишется в журнал вместе с планом.
+
+SQL замеряет курсор из cursor_factory(): его передают в psycopg2.connect,
+так что время попадает в метрики для всех запросов через conn.cursor().
+Подготовленные операторы (prepared.py) учитываются по исходному тексту
+запроса: EXECUTE — под его отпечатком, PREPARE и DEALLOCATE не замеряются.
+"""
+import bisect
+import hashlib
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
+import psycopg2
+import psycopg2.extensions
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 1000, 10_000, 100_000, 1_000_000)
+
+sql_log = logging.getLogger("sales.sql")
+slow_log = logging.getLogger("sales.slow_queries")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%s|%\(\w+\)s")
+_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def normalize_sql(query):
+    """Текст запроса без значений: строки, числа и параметры — ?, пробелы схлопнуты.
+       Текст запросов с параметрами повторяется — результат кэшируется."""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    query = _STRING.sub("?", str(query))
+    query = _PARAM.sub("?", query)
+    query = _NUMBER.sub("?", query)
+    query = _LIST.sub("?...", query)
+    return _SPACE.sub(" ", query).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        for values, (counts, total, count) in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {count}")
+        return lines
+
+
+def render_stats(name, stats, labels=None):
+    """Счётчики из stats() (пул, кэши) как gauge: name_<ключ>{labels} значение."""
+    lines = []
+    label_str = _labels(list(labels), list(labels.values())) if labels else ""
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines.append(f"{name}_{key}{label_str} {value}")
+    return lines
+
+
+class Metrics:
+    def __init__(self, route, prefix="sales"):
+        """route() — имя текущего маршрута (вне запроса — например "background")."""
+        self.route = route
+        self.prefix = prefix
+        self.requests = Histogram(f"{prefix}_http_request_duration_seconds", "Время ответа по маршрутам",
+                                  ["route", "method", "status"])
+        self.phases = Histogram(f"{prefix}_phase_duration_seconds", "Время фаз обработки запроса",
+                                ["route", "phase"])
+        self.sql = Histogram(f"{prefix}_sql_duration_seconds", "Время SQL-запросов по отпечатку", ["query"])
+        self.rows = Histogram(f"{prefix}_sql_rows", "Строк в результате SQL-запроса", ["route"], ROW_BUCKETS)
+        self._statements = {}
+        self._lock = threading.Lock()
+
+    def observe_request(self, route, method, status, seconds):
+        self.requests.observe(seconds, route or "unknown", method, str(status))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.observe(time.perf_counter() - start, self.route(), name)
+
+    def observe_sql(self, query, seconds, rows):
+        """Возвращает (отпечаток, нормализованный текст)."""
+        normalized = normalize_sql(query)
+        fp = fingerprint(normalized)
+        with self._lock:
+            self._statements.setdefault(fp, normalized[:500])
+        route = self.route()
+        self.sql.observe(seconds, fp)
+        self.phases.observe(seconds, route, "sql")
+        if rows is not None and rows >= 0:
+            self.rows.observe(rows, route)
+        sql_log.debug("%.1f ms rows=%s [%s] %s", seconds * 1000, rows, fp, normalized)
+        return fp, normalized
+
+    def render(self, extra=()):
+        lines = []
+        for histogram in (self.requests, self.phases, self.sql, self.rows):
+            lines += histogram.render()
+        name = f"{self.prefix}_sql_query_info"
+        lines += [f"# HELP {name} Текст запроса по отпечатку", f"# TYPE {name} gauge"]
+        with self._lock:
+            statements = sorted(self._statements.items())
+        lines += [f"{name}{_labels(['query', 'statement'], [fp, text])} 1" for fp, text in statements]
+        lines += list(extra)
+        return "\n".join(lines) + "\n"
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms, acquire, release, explain_timeout_ms=60000, interval=300):
+        """Запросы дольше threshold_ms попадают в журнал sales.slow_queries; план
+           (EXPLAIN ANALYZE, то есть повторное выполнение) для одного и того же
+           отпечатка снимается не чаще раза в interval секунд и только для SELECT."""
+        self.threshold_ms = threshold_ms
+        self.acquire = acquire
+        self.release = release
+        self.explain_timeout_ms = explain_timeout_ms
+        self.interval = interval
+        self._last = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+
+    def offer(self, fp, normalized, statement, seconds):
+        ms = seconds * 1000
+        if ms < self.threshold_ms:
+            return
+        if not normalized.upper().startswith(("SELECT", "WITH")) or statement is None:
+            slow_log.warning("медленный запрос %.0f мс [%s] %s", ms, fp, normalized)
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last.get(fp, -self.interval) < self.interval:
+                slow_log.warning("медленный запрос %.0f мс [%s] %s", ms, fp, normalized)
+                return
+            self._last[fp] = now
+        self._executor.submit(self._explain, fp, normalized, statement, ms)
+
+    def _explain(self, fp, normalized, statement, ms):
+        try:
+            conn = self.acquire()
+        except Exception as e:
+            slow_log.warning("медленный запрос %.0f мс [%s] %s\nплан не снят: %s", ms, fp, normalized, e)
+            return
+        try:
+            cur = conn.cursor()
+            cur.execute("SET LOCAL statement_timeout = %s", (int(self.explain_timeout_ms),))
+            cur.execute(b"EXPLAIN (ANALYZE, BUFFERS) " + statement)
+            plan = "\n".join(row[0] for row in cur.fetchall())
+            cur.close()
+        except psycopg2.Error as e:
+            plan = f"план не снят: {e}"
+        finally:
+            conn.rollback()
+            self.release(conn)
+        slow_log.warning("медленный запрос %.0f мс [%s] %s\n%s", ms, fp, normalized, plan)
+
+
+def cursor_factory(metrics, slow_queries=None):
+    """Класс курсора psycopg2, который замеряет каждый execute."""
+    class TimedCursor(psycopg2.extensions.cursor):
+        # (запрос, значения), которые выполняются через подготовленный оператор (prepared.py)
+        sql_source = None
+
+        def execute(self, query, vars=None):
+            source = self.sql_source
+            if source is not None and query.startswith(("PREPARE ", "DEALLOCATE ")):
+                return super().execute(query, vars)
+            start = time.perf_counter()
+            rows = None
+            try:
+                result = super().execute(query, vars)
+                rows = self.rowcount
+                return result
+            finally:
+                seconds = time.perf_counter() - start
+                fp, normalized = metrics.observe_sql(source[0] if source else query, seconds, rows)
+                if slow_queries is not None and not normalized.upper().startswith("EXPLAIN"):
+                    # план снимается на другом соединении, где оператора нет, — по исходному тексту
+                    if source is None:
+                        statement = self.query
+                    elif seconds * 1000 >= slow_queries.threshold_ms:
+                        statement = self.mogrify(*source)
+                    else:
+                        statement = None
+                    slow_queries.offer(fp, normalized, statement, seconds)
+
+    return TimedCursor
@@ -0,0 +1,117 @@
+"""Миграции схемы БД: применяет по порядку файлы migrations/NNN_*.sql.
+
+Применённые версии записываются в service_toolkit.schema_migrations.
+Запускать под пользователем с правами на DDL (DB_ADMIN_USER / DB_ADMIN_PASSWORD
+в .env, по умолчанию — обычный пользователь приложения):
+
+    python migrate.py            # применить новые миграции
+    python migrate.py --status   # показать, что применено
+
+Файл с первой строкой "-- migrate:no-transaction" выполняется вне транзакции
+по одному оператору (нужно для CREATE INDEX CONCURRENTLY).
+"""
+import argparse
+import os
+import re
+
+import psycopg2
+from dotenv import load_dotenv
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION = "-- migrate:no-transaction"
+
+
+def admin_db_config():
+    load_dotenv()
+    return {
+        "host": os.getenv("DB_HOST"),
+        "port": int(os.getenv("DB_PORT", 5432)),
+        "database": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_ADMIN_USER") or os.getenv("DB_USER"),
+        "password": os.getenv("DB_ADMIN_PASSWORD") or os.getenv("DB_PASSWORD"),
+    }
+
+
+def list_migrations():
+    """[(version, path)] по возрастанию версии."""
+    res = []
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        m = re.match(r"^(\d+)_.*\.sql$", name)
+        if m:
+            res.append((name[:-4], os.path.join(MIGRATIONS_DIR, name)))
+    return res
+
+
+def split_statements(sql):
+    """Простое деление на операторы по ';' в конце строки (без $$-блоков)."""
+    statements, current = [], []
+    for line in sql.splitlines():
+        if line.strip().startswith("--") and not current:
+            continue
+        current.append(line)
+        if line.rstrip().endswith(";"):
+            statements.append("\n".join(current))
+            current = []
+    if "".join(current).strip():
+        statements.append("\n".join(current))
+    return statements
+
+
+def ensure_table(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS service_toolkit.schema_migrations (
+                version text PRIMARY KEY,
+                applied_at timestamp NOT NULL DEFAULT now()
+            )
+        """)
+    conn.commit()
+
+
+def applied_versions(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM service_toolkit.schema_migrations")
+        return {r[0] for r in cur.fetchall()}
+
+
+def apply_migration(conn, version, path):
+    with open(path, encoding="utf-8") as f:
+        sql = f.read()
+    if sql.lstrip().startswith(NO_TRANSACTION):
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for statement in split_statements(sql):
+                    cur.execute(statement)
+                cur.execute("INSERT INTO service_toolkit.schema_migrations (version) VALUES (%s)", (version,))
+        finally:
+            conn.autocommit = False
+        return
+    with conn.cursor() as cur:
+        cur.execute(sql)
+        cur.execute("INSERT INTO service_toolkit.schema_migrations (version) VALUES (%s)", (version,))
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы БД приложения продаж")
+    parser.add_argument("--status", action="store_true", help="только показать состояние")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**admin_db_config())
+    ensure_table(conn)
+    done = applied_versions(conn)
+    for version, path in list_migrations():
+        if version in done:
+            print(f"  [x] {version}")
+        elif args.status:
+            print(f"  [ ] {version}")
+        else:
+            print(f"  ... {version}", flush=True)
+            apply_migration(conn, version, path)
+            print(f"  [x] {version}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+-- Код региона (первые две цифры ИНН) как хранимая вычисляемая колонка.
+-- Выражение то же, что раньше вычислялось в каждом запросе, поэтому
+-- значения совпадают и приложение может переключиться на колонку прозрачно.
+-- ADD COLUMN ... STORED переписывает таблицу: применять вне окна загрузки.
+ALTER TABLE intermediate_scheme.sbis_coll_sell_upd_for_flask
+    ADD COLUMN IF NOT EXISTS region_code int
+    GENERATED ALWAYS AS (
+        COALESCE(NULLIF(regexp_replace(SUBSTRING("doc_counterparty_inn" FROM 1 FOR 2), '[^0-9]', '', 'g'), '')::int, 0)
+    ) STORED;
@@ -0,0 +1,4 @@
+-- migrate:no-transaction
+-- Индекс по коду региона: фильтр region_code[] и DISTINCT по регионам.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sbis_coll_sell_upd_for_flask_region_code_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask (region_code);
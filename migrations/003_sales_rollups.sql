@@ -0,0 +1,36 @@
+-- Сводная таблица итогов продаж по дням, регионам и группам ГАУ.
+-- Колонки "Дата" и "Номенклатура.ГАУ.Группа" названы как в исходной таблице,
+-- поэтому фильтры приложения по датам и группе применяются к ней без изменений.
+-- Первое заполнение читает всю таблицу продаж: применять вне окна загрузки.
+CREATE MATERIALIZED VIEW IF NOT EXISTS intermediate_scheme.sales_daily_rollup AS
+SELECT
+    "Дата",
+    COALESCE(NULLIF(regexp_replace(SUBSTRING("doc_counterparty_inn" FROM 1 FOR 2), '[^0-9]', '', 'g'), '')::int, 0) AS region_code,
+    "Номенклатура.ГАУ.Группа",
+    SUM("inside_doc_item_full_item_price") AS amount,
+    SUM("inside_doc_item_quantity") AS quantity,
+    COUNT(*) AS lines
+FROM intermediate_scheme.sbis_coll_sell_upd_for_flask
+GROUP BY 1, 2, 3;
+
+-- уникальный индекс нужен для REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS sales_daily_rollup_key
+    ON intermediate_scheme.sales_daily_rollup ("Дата", region_code, "Номенклатура.ГАУ.Группа");
+
+-- версия данных (MAX("datetime") из service_toolkit.upd_t), на которой построены сводные таблицы
+CREATE TABLE IF NOT EXISTS service_toolkit.rollup_versions (
+    name text PRIMARY KEY,
+    version text,
+    refreshed_at timestamp NOT NULL DEFAULT now()
+);
+
+-- обновление от имени владельца представления: пользователю приложения хватает права EXECUTE
+CREATE OR REPLACE FUNCTION service_toolkit.refresh_sales_rollups(target_version text) RETURNS void
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = pg_catalog, pg_temp AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY intermediate_scheme.sales_daily_rollup;
+    INSERT INTO service_toolkit.rollup_versions (name, version, refreshed_at)
+    VALUES ('sales_rollups', target_version, now())
+    ON CONFLICT (name) DO UPDATE SET version = EXCLUDED.version, refreshed_at = EXCLUDED.refreshed_at;
+END
+$$;
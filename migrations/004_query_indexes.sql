@@ -0,0 +1,91 @@
+-- migrate:no-transaction
+-- Индексы для форм запросов, у которых plan_guard.py нашёл Seq Scan или Sort
+-- большой таблицы. CREATE INDEX CONCURRENTLY не блокирует запись, но читает
+-- всю таблицу: применять вне окна загрузки.
+
+-- ILIKE '%...%' автодополнения — по триграммам
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- page doc_counterparty_full_name = ANY; count doc_counterparty_full_name = ANY; sort doc_counterparty_full_name ASC; sort doc_counterparty_full_name DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_doc_counterparty_full_name_date_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("doc_counterparty_full_name", "Дата");
+
+-- page doc_counterparty_inn = ANY; count doc_counterparty_inn = ANY; sort doc_counterparty_inn ASC; sort doc_counterparty_inn DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_doc_counterparty_inn_date_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("doc_counterparty_inn", "Дата");
+
+-- page doc_number = ANY; count doc_number = ANY; sort doc_number ASC; sort doc_number DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_doc_number_date_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("doc_number", "Дата");
+
+-- page inside_doc_item_code = ANY; count inside_doc_item_code = ANY; sort inside_doc_item_code ASC; sort inside_doc_item_code DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_inside_doc_item_code_date_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("inside_doc_item_code", "Дата");
+
+-- page inside_doc_item_name = ANY; count inside_doc_item_name = ANY; sort inside_doc_item_name ASC; sort inside_doc_item_name DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_inside_doc_item_name_date_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("inside_doc_item_name", "Дата");
+
+-- page Номенклатура.ГАУ = ANY; count Номенклатура.ГАУ = ANY; sort Номенклатура.ГАУ ASC; sort Номенклатура.ГАУ DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_gau_date_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("Номенклатура.ГАУ", "Дата");
+
+-- page Номенклатура.ГАУ.Группа = ANY; count Номенклатура.ГАУ.Группа = ANY; sort Номенклатура.ГАУ.Группа ASC; sort Номенклатура.ГАУ.Группа DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_gau_group_date_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("Номенклатура.ГАУ.Группа", "Дата");
+
+-- sort Sale_type ASC; sort Sale_type DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_sale_type_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("Sale_type");
+
+-- sort doc_assigned_manager ASC; sort doc_assigned_manager DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_doc_assigned_manager_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("doc_assigned_manager");
+
+-- sort doc_department ASC; sort doc_department DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_doc_department_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("doc_department");
+
+-- sort inside_doc_author ASC; sort inside_doc_author DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_inside_doc_author_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("inside_doc_author");
+
+-- sort inside_doc_item_full_item_price ASC; sort inside_doc_item_full_item_price DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_inside_doc_item_full_item_price_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("inside_doc_item_full_item_price");
+
+-- sort inside_doc_item_quantity ASC; sort inside_doc_item_quantity DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_inside_doc_item_quantity_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("inside_doc_item_quantity");
+
+-- page period; count period; sort Дата ASC; sort Дата DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_date_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask ("Дата");
+
+-- autocomplete doc_counterparty_full_name ILIKE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_doc_counterparty_full_name_trgm_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask USING gin ("doc_counterparty_full_name" gin_trgm_ops);
+
+-- autocomplete doc_counterparty_inn ILIKE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_doc_counterparty_inn_trgm_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask USING gin ("doc_counterparty_inn" gin_trgm_ops);
+
+-- autocomplete doc_number ILIKE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_doc_number_trgm_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask USING gin ("doc_number" gin_trgm_ops);
+
+-- autocomplete inside_doc_item_code ILIKE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_inside_doc_item_code_trgm_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask USING gin ("inside_doc_item_code" gin_trgm_ops);
+
+-- autocomplete inside_doc_item_name ILIKE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_inside_doc_item_name_trgm_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask USING gin ("inside_doc_item_name" gin_trgm_ops);
+
+-- autocomplete Номенклатура.ГАУ ILIKE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_gau_trgm_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask USING gin ("Номенклатура.ГАУ" gin_trgm_ops);
+
+-- autocomplete Номенклатура.ГАУ.Группа ILIKE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sales_gau_group_trgm_idx
+    ON intermediate_scheme.sbis_coll_sell_upd_for_flask USING gin ("Номенклатура.ГАУ.Группа" gin_trgm_ops);
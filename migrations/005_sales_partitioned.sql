@@ -0,0 +1,166 @@
+-- Таблица продаж, секционированная по месяцам "Дата", и представление с прежним
+-- именем, через которое её читает приложение и пишет загрузчик.
+--
+--   * intermediate_scheme.sbis_coll_sell_upd_partitioned — те же колонки (LIKE,
+--     вместе с вычисляемой region_code) и row_id — номер строки для keyset-пагинации
+--     (ctid в разных секциях повторяется, а через представление не виден);
+--     секция на каждый месяц, строки без даты и месяцев без своей секции — в секции
+--     по умолчанию;
+--   * индексы исходной таблицы (001–004) создаются на секционированной и тем самым
+--     в каждой секции; btree по "Дата" остаётся — по нему сортировка по дате идёт
+--     упорядоченным обходом секций (Merge Append), BRIN этого не даёт;
+--   * исходная таблица переименовывается в ..._heap (удалить вручную после
+--     проверки), на её место встаёт представление. INSERT загрузчика идёт через
+--     него в секции; TRUNCATE представления невозможен — загрузчик, который очищает
+--     таблицу, должен делать TRUNCATE intermediate_scheme.sbis_coll_sell_upd_partitioned;
+--   * service_toolkit.ensure_sales_partitions создаёт секции на месяцы вперёд и
+--     переносит строки из секции по умолчанию в секции их месяцев; приложение
+--     вызывает её после каждой загрузки (partitions.py).
+-- Копирование читает и пишет всю таблицу и держит её блокировку: применять вне окна загрузки.
+CREATE SEQUENCE IF NOT EXISTS intermediate_scheme.sbis_coll_sell_upd_row_id_seq;
+
+CREATE TABLE intermediate_scheme.sbis_coll_sell_upd_partitioned (
+    LIKE intermediate_scheme.sbis_coll_sell_upd_for_flask INCLUDING DEFAULTS INCLUDING GENERATED,
+    row_id bigint NOT NULL DEFAULT nextval('intermediate_scheme.sbis_coll_sell_upd_row_id_seq')
+) PARTITION BY RANGE ("Дата");
+
+ALTER SEQUENCE intermediate_scheme.sbis_coll_sell_upd_row_id_seq
+    OWNED BY intermediate_scheme.sbis_coll_sell_upd_partitioned.row_id;
+
+CREATE TABLE intermediate_scheme.sbis_coll_sell_upd_pdefault
+    PARTITION OF intermediate_scheme.sbis_coll_sell_upd_partitioned DEFAULT;
+
+-- секции месяцев from_date..to_date и месяцев, чьи строки лежат в секции по умолчанию;
+-- возвращает число созданных секций
+CREATE OR REPLACE FUNCTION service_toolkit.ensure_sales_partitions(from_date date, to_date date) RETURNS int
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = pg_catalog, pg_temp AS $$
+DECLARE
+    parent text := 'intermediate_scheme.sbis_coll_sell_upd_partitioned';
+    cols text;
+    m date;
+    part text;
+    created int := 0;
+BEGIN
+    -- секции создаёт один процесс, остальные ждут и ничего не повторяют
+    PERFORM pg_advisory_xact_lock(hashtext('sales_partitions'));
+    -- вычисляемая region_code считается сама
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO cols
+    FROM pg_attribute
+    WHERE attrelid = parent::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+    FOR m IN
+        SELECT generate_series(date_trunc('month', from_date), date_trunc('month', to_date), interval '1 month')::date
+        UNION
+        SELECT DISTINCT date_trunc('month', "Дата")::date
+        FROM intermediate_scheme.sbis_coll_sell_upd_pdefault
+        WHERE "Дата" IS NOT NULL
+        ORDER BY 1
+    LOOP
+        part := 'sbis_coll_sell_upd_p' || to_char(m, 'YYYY_MM');
+        CONTINUE WHEN to_regclass('intermediate_scheme.' || part) IS NOT NULL;
+        -- строки месяца переносятся из секции по умолчанию до подключения новой секции,
+        -- иначе ATTACH PARTITION откажет
+        EXECUTE format('CREATE TABLE intermediate_scheme.%I (LIKE %s INCLUDING DEFAULTS INCLUDING GENERATED)',
+                       part, parent);
+        EXECUTE format('WITH moved AS (DELETE FROM intermediate_scheme.sbis_coll_sell_upd_pdefault '
+                       'WHERE "Дата" >= %L AND "Дата" < %L RETURNING %s) '
+                       'INSERT INTO intermediate_scheme.%I (%s) SELECT %s FROM moved',
+                       m, (m + interval '1 month')::date, cols, part, cols, cols);
+        EXECUTE format('ALTER TABLE %s ATTACH PARTITION intermediate_scheme.%I FOR VALUES FROM (%L) TO (%L)',
+                       parent, part, m, (m + interval '1 month')::date);
+        created := created + 1;
+    END LOOP;
+    RETURN created;
+END
+$$;
+
+SELECT service_toolkit.ensure_sales_partitions(
+    COALESCE((SELECT MIN("Дата") FROM intermediate_scheme.sbis_coll_sell_upd_for_flask), current_date),
+    (current_date + interval '2 months')::date);
+
+-- строки в порядке дат: row_id растёт вместе с "Дата", секции заполняются подряд
+DO $$
+DECLARE
+    cols text;
+BEGIN
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO cols
+    FROM pg_attribute
+    WHERE attrelid = 'intermediate_scheme.sbis_coll_sell_upd_for_flask'::regclass
+      AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+    EXECUTE format('INSERT INTO intermediate_scheme.sbis_coll_sell_upd_partitioned (%s) '
+                   'SELECT %s FROM intermediate_scheme.sbis_coll_sell_upd_for_flask ORDER BY "Дата"',
+                   cols, cols);
+END
+$$;
+
+-- индексы исходной таблицы — на секционированной (создаются в каждой секции).
+-- Уникальный индекс (в том числе первичного ключа) на секционированной таблице должен
+-- включать ключ секционирования "Дата", иначе CREATE INDEX откажет и миграция прервётся:
+-- такие индексы пропускаются с NOTICE (уникальность по ним между секциями не проверить)
+DO $$
+DECLARE
+    ix record;
+BEGIN
+    FOR ix IN
+        SELECT c.relname, pg_get_indexdef(i.indexrelid) AS def,
+               i.indisunique AND NOT EXISTS (
+                   SELECT 1 FROM pg_attribute a
+                   WHERE a.attrelid = i.indrelid AND a.attname = 'Дата' AND a.attnum = ANY(i.indkey::int2[])
+               ) AS unique_without_key
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'intermediate_scheme.sbis_coll_sell_upd_for_flask'::regclass
+    LOOP
+        IF ix.unique_without_key THEN
+            RAISE NOTICE 'индекс % не перенесён: уникальный без ключа секционирования "Дата"', ix.relname;
+            CONTINUE;
+        END IF;
+        EXECUTE regexp_replace(
+            regexp_replace(ix.def, ' ON (ONLY )?intermediate_scheme\.sbis_coll_sell_upd_for_flask ',
+                           ' ON intermediate_scheme.sbis_coll_sell_upd_partitioned '),
+            '^CREATE (UNIQUE )?INDEX \S+ ',
+            'CREATE \1INDEX ' || quote_ident(left(ix.relname, 58) || '_part') || ' ');
+    END LOOP;
+END
+$$;
+
+ANALYZE intermediate_scheme.sbis_coll_sell_upd_partitioned;
+
+-- права на исходную таблицу и сводную таблицу переходят к представлениям
+CREATE TEMP TABLE sales_grants ON COMMIT DROP AS
+SELECT table_name, grantee, privilege_type
+FROM information_schema.role_table_grants
+WHERE table_schema = 'intermediate_scheme'
+  AND table_name IN ('sbis_coll_sell_upd_for_flask', 'sales_daily_rollup')
+  AND grantee <> current_user;
+
+-- сводная таблица зависит от исходной — пересоздаётся поверх представления
+DROP MATERIALIZED VIEW IF EXISTS intermediate_scheme.sales_daily_rollup;
+
+ALTER TABLE intermediate_scheme.sbis_coll_sell_upd_for_flask RENAME TO sbis_coll_sell_upd_for_flask_heap;
+
+CREATE VIEW intermediate_scheme.sbis_coll_sell_upd_for_flask AS
+SELECT * FROM intermediate_scheme.sbis_coll_sell_upd_partitioned;
+
+CREATE MATERIALIZED VIEW intermediate_scheme.sales_daily_rollup AS
+SELECT
+    "Дата",
+    COALESCE(NULLIF(regexp_replace(SUBSTRING("doc_counterparty_inn" FROM 1 FOR 2), '[^0-9]', '', 'g'), '')::int, 0) AS region_code,
+    "Номенклатура.ГАУ.Группа",
+    SUM("inside_doc_item_full_item_price") AS amount,
+    SUM("inside_doc_item_quantity") AS quantity,
+    COUNT(*) AS lines
+FROM intermediate_scheme.sbis_coll_sell_upd_for_flask
+GROUP BY 1, 2, 3;
+
+CREATE UNIQUE INDEX IF NOT EXISTS sales_daily_rollup_key
+    ON intermediate_scheme.sales_daily_rollup ("Дата", region_code, "Номенклатура.ГАУ.Группа");
+
+DO $$
+DECLARE
+    g record;
+BEGIN
+    FOR g IN SELECT * FROM sales_grants LOOP
+        EXECUTE format('GRANT %s ON intermediate_scheme.%I TO %s', g.privilege_type, g.table_name,
+                       CASE WHEN g.grantee = 'PUBLIC' THEN 'PUBLIC' ELSE quote_ident(g.grantee) END);
+    END LOOP;
+END
+$$;
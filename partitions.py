@@ -0,0 +1,30 @@
+"""Секции таблицы продаж по месяцам "Дата" (migrations/005_sales_partitioned.sql).
+
+Таблица продаж секционирована по диапазонам "Дата", под прежним именем —
+представление поверх неё. Строки месяцев, для которых секции ещё нет,
+загрузчик пишет в секцию по умолчанию, а запросы с периодом читают её
+вместе с секциями месяцев. Поэтому после каждой загрузки приложение вызывает
+service_toolkit.ensure_sales_partitions: она создаёт секции на months_ahead
+месяцев вперёд и переносит строки из секции по умолчанию в секции их
+месяцев. Несколько процессов вызывают её по очереди (advisory lock внутри
+функции), повторный вызов ничего не делает.
+
+Если миграция применена другим пользователем, пользователю приложения
+нужно право EXECUTE на функцию.
+"""
+
+ENSURE_FUNCTION = "service_toolkit.ensure_sales_partitions(date, date)"
+
+
+def ensure(conn, months_ahead=2):
+    """Создаёт недостающие секции; число созданных или None, если таблица не секционирована."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regprocedure(%s) IS NOT NULL", (ENSURE_FUNCTION,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return None
+        cur.execute("SELECT service_toolkit.ensure_sales_partitions("
+                    "current_date, (current_date + make_interval(months => %s))::date)", (months_ahead,))
+        created = cur.fetchone()[0]
+    conn.commit()
+    return created
@@ -0,0 +1,436 @@
+"""Проверка планов SQL, который строит приложение, и подбор индексов.
+
+Перебираются формы запросов, которые может выдать приложение: фильтр
+"поле = ANY(%s)" по каждому полю FIELDS (страница и COUNT(*)), период по "Дата",
+регион, сортировка по каждой колонке COLUMN_ORDER в обе стороны и ILIKE
+автодополнения, — а также они же, выгрузка и итоги за прошлый квартал. Для
+каждой формы выполняется EXPLAIN (без ANALYZE — запросы не выполняются) и
+ищутся полное чтение (Seq Scan) и сортировка (Sort) больших таблиц. Для таких
+форм предлагаются индексы — btree по полю фильтра и дате (страница по
+умолчанию отсортирована по дате), btree по колонке сортировки, GIN pg_trgm
+для ILIKE, — которых ещё нет среди индексов таблицы.
+
+Если таблица продаж — представление над секционированной по "Дата" таблицей
+(migrations/005_sales_partitioned.sql), индексы ищутся и предлагаются для неё,
+а у форм с квартальным периодом проверяется отсечение секций: читаться должны
+только секции месяцев периода — и в обычном плане, и в общем плане
+подготовленного оператора (prepared.py), где секции отсекаются при запуске.
+
+    python plan_guard.py            # отчёт по формам запросов и предлагаемые индексы
+    python plan_guard.py --check    # код выхода 1, если не хватает индексов (для CI)
+    python plan_guard.py --write    # предложенные индексы — новым файлом migrations/NNN_query_indexes.sql
+    python plan_guard.py --apply    # то же и сразу применить его (права на DDL, как у migrate.py)
+
+Файл миграции стоит просмотреть перед применением: каждый индекс замедляет
+загрузку данных и занимает место.
+"""
+import argparse
+import os
+import re
+import sys
+from collections import namedtuple
+from datetime import date, timedelta
+
+import psycopg2
+from werkzeug.datastructures import MultiDict
+
+from prepared import to_positional
+
+# index — индекс, который нужен форме: ("btree", (колонки...)) или ("gin_trgm", (колонка,));
+# period — (date_from, date_to) формы с периодом, для проверки отсечения секций
+Shape = namedtuple("Shape", "name query values index period", defaults=(None,))
+
+# короткие латинские имена колонок для имён индексов
+COLUMN_SLUGS = {"Дата": "date", "Номенклатура.ГАУ": "gau", "Номенклатура.ГАУ.Группа": "gau_group"}
+
+
+def split_table(table):
+    schema, _, name = table.rpartition(".")
+    return schema or "public", name
+
+
+def storage_table(conn, table):
+    """(таблица, relkind), в которой лежат строки table: для представления над одной
+       таблицей — она (секционированная — relkind 'p'), иначе сама table."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT DISTINCT d.refobjid::regclass::text, c.relkind
+        FROM pg_rewrite r
+        JOIN pg_depend d ON d.classid = 'pg_rewrite'::regclass AND d.objid = r.oid
+        JOIN pg_class c ON c.oid = d.refobjid
+        WHERE r.ev_class = to_regclass(%s) AND d.refobjid <> r.ev_class AND c.relkind IN ('r', 'p')
+    """, (table,))
+    rows = cur.fetchall()
+    if len(rows) != 1:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+        row = cur.fetchone()
+        rows = [(table, row[0] if row else "r")]
+    cur.close()
+    return rows[0]
+
+
+def leaf_partitions(conn, table):
+    """{(схема, имя)} секций секционированной таблицы (пусто для обычной)."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT n.nspname, c.relname
+        FROM pg_partition_tree(to_regclass(%s)) t
+        JOIN pg_class c ON c.oid = t.relid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE t.isleaf AND c.relkind = 'r'
+    """, (table,))
+    res = set(cur.fetchall())
+    cur.close()
+    return res
+
+
+def last_quarter(today=None):
+    """(первый, последний день) прошлого календарного квартала."""
+    today = today or date.today()
+    end = date(today.year, 3 * ((today.month - 1) // 3) + 1, 1) - timedelta(days=1)
+    return date(end.year, 3 * ((end.month - 1) // 3) + 1, 1), end
+
+
+def months_spanned(period):
+    start, end = period
+    return (end.year - start.year) * 12 + end.month - start.month + 1
+
+
+def sample_values(conn, table, fields):
+    """Типичное значение каждого поля для подстановки в фильтр: середина гистограммы
+       pg_stats (не самое частое значение), без статистики — любое непустое."""
+    schema, name = split_table(table)
+    cur = conn.cursor()
+    res = {}
+    for field in fields:
+        cur.execute("""
+            SELECT (histogram_bounds::text::text[])[array_length(histogram_bounds::text::text[], 1) / 2 + 1]
+            FROM pg_stats WHERE schemaname = %s AND tablename = %s AND attname = %s
+        """, (schema, name, field))
+        row = cur.fetchone()
+        if not row or row[0] is None:
+            cur.execute(f'SELECT "{field}"::text FROM {table} WHERE "{field}" IS NOT NULL LIMIT 1')
+            row = cur.fetchone()
+        res[field] = row[0] if row and row[0] is not None else ""
+    cur.close()
+    return res
+
+
+def query_shapes(app, conn):
+    """Формы запросов приложения (app — модуль app.py) с типичными значениями параметров."""
+    table = app.SALES_TABLE
+    samples = sample_values(conn, storage_table(conn, table)[0], app.FIELDS)
+    quarter = last_quarter()
+    quarter_params = [("date_from", quarter[0].isoformat()), ("date_to", quarter[1].isoformat())]
+    shapes = []
+
+    # каждая форма — без периода и за прошлый квартал (period — для проверки отсечения секций)
+    for suffix, period_params, period in (("", [], None), (" quarter", quarter_params, quarter)):
+        def page_and_count(name, params, index):
+            where_clause, values = app.build_filter_query(MultiDict(params + period_params))
+            query, page_values = app.build_page_query(where_clause, values, "Дата", "DESC")
+            shapes.append(Shape(f"page {name}{suffix}", query, page_values, index, period))
+            shapes.append(Shape(f"count {name}{suffix}", f"SELECT COUNT(*) FROM {table} {where_clause}", values,
+                                index, period))
+
+        for field in app.FIELDS:
+            page_and_count(f"{field} = ANY", [(field + "[]", samples[field])], ("btree", (field, "Дата")))
+        if period is None:
+            page_and_count("period", [("date_from", (date.today() - timedelta(days=30)).isoformat())],
+                           ("btree", ("Дата",)))
+        if app.region_code_sql() == app.REGION_CODE_COLUMN_SQL:
+            page_and_count("region_code = ANY", [("region_code[]", "77")], ("btree", ("region_code",)))
+
+        where_clause, values = app.build_filter_query(MultiDict(period_params))
+        seen = set()
+        for col in app.COLUMN_ORDER:
+            db_col = app.sort_db_column(col)
+            if db_col in seen:
+                continue
+            seen.add(db_col)
+            for sort_dir in ("ASC", "DESC"):
+                query, page_values = app.build_page_query(where_clause, values, col, sort_dir)
+                shapes.append(Shape(f"sort {db_col} {sort_dir}{suffix}", query, page_values, ("btree", (db_col,)),
+                                    period))
+
+        for field in app.FIELDS:
+            # трёх символов достаточно, чтобы pg_trgm мог искать по индексу
+            query, ac_values = app.autocomplete_query(field, str(samples[field])[:3] or "абв",
+                                                      MultiDict(period_params))
+            shapes.append(Shape(f"autocomplete {field} ILIKE{suffix}", query, ac_values, ("gin_trgm", (field,)),
+                                period))
+
+    where_clause, values = app.build_filter_query(MultiDict(quarter_params))
+    shapes.append(Shape("export quarter", app.build_export_query(where_clause), values, ("btree", ("Дата",)), quarter))
+    shapes.append(Shape("aggregate quarter", app.build_aggregate_query(where_clause, ()), values,
+                        ("btree", ("Дата",)), quarter))
+    return shapes
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def relation_rows(conn, relation, schema=None):
+    cur = conn.cursor()
+    cur.execute("SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)",
+                (f'"{schema}"."{relation}"' if schema else f'"{relation}"',))
+    row = cur.fetchone()
+    cur.close()
+    return max(row[0], 0) if row else 0
+
+
+def explain(conn, shape):
+    cur = conn.cursor()
+    try:
+        cur.execute("EXPLAIN (FORMAT JSON, VERBOSE) " + shape.query, shape.values)
+        return cur.fetchone()[0][0]["Plan"]
+    finally:
+        cur.close()
+        conn.rollback()
+
+
+def explain_generic(conn, shape):
+    """План подготовленного оператора без учёта значений (общий план): секции
+       в нём отсекаются при запуске, в EXPLAIN EXECUTE остаются только нужные."""
+    text, n = to_positional(shape.query)
+    cur = conn.cursor()
+    prepared = False
+    try:
+        cur.execute("SET LOCAL plan_cache_mode = force_generic_plan")
+        cur.execute(f"PREPARE plan_guard_generic AS {text}")
+        prepared = True
+        cur.execute("EXPLAIN (FORMAT JSON, VERBOSE) EXECUTE plan_guard_generic"
+                    + (f" ({', '.join(['%s'] * n)})" if n else ""), shape.values)
+        return cur.fetchone()[0][0]["Plan"]
+    finally:
+        conn.rollback()
+        # подготовленный оператор переживает ROLLBACK
+        if prepared:
+            cur.execute("DEALLOCATE plan_guard_generic")
+            conn.rollback()
+        cur.close()
+
+
+def plan_issues(conn, plan, min_rows, sizes, partitions=frozenset()):
+    """Полные чтения и сортировки больших таблиц в плане: [(вид, описание)].
+       Секции partitions считаются вместе: полное чтение многих маленьких секций —
+       тоже полное чтение большой таблицы."""
+    issues = []
+    partition_rows = []
+    for node in plan_nodes(plan):
+        if node["Node Type"] == "Seq Scan":
+            key = (node.get("Schema"), node["Relation Name"])
+            if key not in sizes:
+                sizes[key] = relation_rows(conn, key[1], key[0])
+            if key in partitions:
+                partition_rows.append(sizes[key])
+            elif sizes[key] >= min_rows:
+                issues.append(("seq scan", f"Seq Scan {key[1]} (~{sizes[key]:.0f} строк)"))
+        elif node["Node Type"] == "Sort" and node["Plan Rows"] >= min_rows:
+            issues.append(("sort", f"Sort ~{node['Plan Rows']} строк по {', '.join(node.get('Sort Key', []))}"))
+    if sum(partition_rows) >= min_rows:
+        issues.append(("seq scan", f"Seq Scan {len(partition_rows)} секций (~{sum(partition_rows):.0f} строк)"))
+    return issues
+
+
+def pruning_issues(plan, period, partitions, plan_kind):
+    """Замечание, если план читает секций больше, чем месяцев в периоде."""
+    scanned = {(n.get("Schema"), n["Relation Name"]) for n in plan_nodes(plan) if "Relation Name" in n}
+    scanned &= partitions
+    months = months_spanned(period)
+    if len(scanned) <= months:
+        return []
+    return [("pruning", f"{plan_kind}: читаются {len(scanned)} секций из {len(partitions)}, "
+                        f"в периоде {months} мес.")]
+
+
+def check(conn, shapes, min_rows, table=None):
+    """[(shape, issues)] для всех форм; ошибка EXPLAIN — тоже замечание.
+       table — таблица форм: если она секционирована, у форм с периодом
+       проверяется отсечение секций."""
+    partitions = leaf_partitions(conn, storage_table(conn, table)[0]) if table else set()
+    sizes, res = {}, []
+    for shape in shapes:
+        try:
+            plan = explain(conn, shape)
+            issues = plan_issues(conn, plan, min_rows, sizes, partitions)
+            if partitions and shape.period:
+                issues += pruning_issues(plan, shape.period, partitions, "план")
+                issues += pruning_issues(explain_generic(conn, shape), shape.period, partitions, "общий план")
+        except psycopg2.Error as e:
+            issues = [("error", str(e).strip().splitlines()[0])]
+        res.append((shape, issues))
+    return res
+
+
+def existing_indexes(conn, table):
+    """[(метод, (колонки...))] индексов таблицы (у представления — таблицы под ним);
+       GIN с gin_trgm_ops — метод gin_trgm."""
+    table = storage_table(conn, table)[0]
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT am.amname,
+               ARRAY(SELECT a.attname FROM unnest(i.indkey) WITH ORDINALITY k(attnum, n)
+                     JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum ORDER BY k.n),
+               ARRAY(SELECT o.opcname FROM unnest(i.indclass) WITH ORDINALITY k(oid, n)
+                     JOIN pg_opclass o ON o.oid = k.oid ORDER BY k.n)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        WHERE i.indrelid = to_regclass(%s) AND i.indpred IS NULL
+    """, (table,))
+    res = []
+    for method, columns, opclasses in cur.fetchall():
+        if method == "gin" and "gin_trgm_ops" in opclasses:
+            method = "gin_trgm"
+        res.append((method, tuple(columns)))
+    cur.close()
+    return res
+
+
+def covered(index, indexes):
+    """btree покрыт индексом, у которого эти колонки — начало ключа; gin_trgm — любым по той же колонке."""
+    method, columns = index
+    for other_method, other_columns in indexes:
+        if other_method != method:
+            continue
+        if method == "btree" and other_columns[:len(columns)] == columns:
+            return True
+        if method == "gin_trgm" and set(columns) <= set(other_columns):
+            return True
+    return False
+
+
+def trgm_available(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    res = cur.fetchone() is not None
+    cur.close()
+    return res
+
+
+def propose(results, indexes, trgm=True):
+    """Индексы для форм с замечаниями, которых нет среди indexes: {индекс: [формы]}.
+       Составные индексы идут первыми — btree по одной колонке часто оказывается их началом.
+       trgm=False — расширения pg_trgm на сервере нет, GIN-индексы для ILIKE не предлагаются."""
+    wanted = {}
+    for shape, issues in results:
+        if shape.index[0] == "gin_trgm" and not trgm:
+            continue
+        if any(kind != "error" for kind, _ in issues):
+            wanted.setdefault(shape.index, []).append(shape.name)
+    res = {}
+    for index in sorted(wanted, key=lambda i: (-len(i[1]), i)):
+        if not covered(index, indexes) and not covered(index, list(res)):
+            res[index] = wanted[index]
+        elif covered(index, list(res)):
+            next(v for k, v in res.items() if covered(index, [k])).extend(wanted[index])
+    return res
+
+
+def index_name(index):
+    method, columns = index
+    parts = [COLUMN_SLUGS.get(c) or re.sub(r"[^a-z0-9]+", "_", c.lower()).strip("_") for c in columns]
+    return "sales_" + "_".join(parts) + ("_trgm_idx" if method == "gin_trgm" else "_idx")
+
+
+def index_sql(table, index, concurrently=True):
+    method, columns = index
+    create = "CREATE INDEX CONCURRENTLY" if concurrently else "CREATE INDEX"
+    if method == "gin_trgm":
+        cols = ", ".join(f'"{c}" gin_trgm_ops' for c in columns)
+        return f"{create} IF NOT EXISTS {index_name(index)}\n    ON {table} USING gin ({cols});"
+    cols = ", ".join(f'"{c}"' for c in columns)
+    return f"{create} IF NOT EXISTS {index_name(index)}\n    ON {table} ({cols});"
+
+
+def migration_sql(table, proposals, concurrently=True):
+    """concurrently=False — для секционированной таблицы: CONCURRENTLY на ней не
+       поддерживается, индекс создаётся в каждой секции и блокирует запись."""
+    if concurrently:
+        lines = [
+            "-- migrate:no-transaction",
+            "-- Индексы для форм запросов, у которых plan_guard.py нашёл Seq Scan или Sort",
+            "-- большой таблицы. CREATE INDEX CONCURRENTLY не блокирует запись, но читает",
+            "-- всю таблицу: применять вне окна загрузки.",
+        ]
+    else:
+        lines = [
+            "-- Индексы для форм запросов, у которых plan_guard.py нашёл Seq Scan или Sort",
+            "-- большой таблицы. Индекс секционированной таблицы создаётся в каждой секции",
+            "-- и блокирует запись на время построения: применять вне окна загрузки.",
+        ]
+    if any(method == "gin_trgm" for method, _ in proposals):
+        lines += ["", "-- ILIKE '%...%' автодополнения — по триграммам", "CREATE EXTENSION IF NOT EXISTS pg_trgm;"]
+    for index, shapes in proposals.items():
+        lines += ["", "-- " + "; ".join(shapes), index_sql(table, index, concurrently)]
+    return "\n".join(lines) + "\n"
+
+
+def write_migration(table, proposals, migrations_dir, concurrently=True):
+    versions = [int(m.group(1)) for m in (re.match(r"^(\d+)_", n) for n in os.listdir(migrations_dir)) if m]
+    path = os.path.join(migrations_dir, f"{max(versions, default=0) + 1:03d}_query_indexes.sql")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(migration_sql(table, proposals, concurrently))
+    return path
+
+
+def report_lines(results, proposals):
+    """Замечания и недостающие индексы построчно — для журнала."""
+    lines = [f"{shape.name}: {detail}" for shape, issues in results for _, detail in issues]
+    lines += [f"нет индекса {index_name(index)} ({index[0]}: {', '.join(index[1])}): {'; '.join(shapes)}"
+              for index, shapes in proposals.items()]
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--min-rows", type=int, default=int(os.getenv("PLAN_CHECK_MIN_ROWS", 100_000)),
+                        help="таблица считается большой от стольких строк (pg_class.reltuples)")
+    parser.add_argument("--check", action="store_true", help="код выхода 1, если не хватает индексов")
+    parser.add_argument("--write", action="store_true", help="записать миграцию с предложенными индексами")
+    parser.add_argument("--apply", action="store_true", help="записать миграцию и применить её")
+    args = parser.parse_args()
+
+    import app
+    import migrate
+
+    conn = psycopg2.connect(**app.DB_CONFIG)
+    app.check_schema(conn)
+    results = check(conn, query_shapes(app, conn), args.min_rows, app.SALES_TABLE)
+    trgm = trgm_available(conn)
+    proposals = propose(results, existing_indexes(conn, app.SALES_TABLE), trgm)
+    # индексы представления создаются на таблице под ним
+    target, relkind = storage_table(conn, app.SALES_TABLE)
+    conn.close()
+
+    width = max(len(shape.name) for shape, _ in results)
+    for shape, issues in results:
+        print(f"{shape.name:<{width}}  {'; '.join(d for _, d in issues) if issues else 'ok'}")
+    if not trgm:
+        print("\npg_trgm на сервере не установлен — индексы для ILIKE автодополнения не предлагаются")
+    if not proposals:
+        # оставшиеся Seq Scan — выбор планировщика при имеющихся индексах (например, частое значение)
+        print("\nвсе нужные индексы есть")
+        return
+    print("\nпредлагаемые индексы:")
+    print(migration_sql(target, proposals, relkind != "p"))
+
+    if args.write or args.apply:
+        path = write_migration(target, proposals, migrate.MIGRATIONS_DIR, relkind != "p")
+        print(f"миграция: {os.path.relpath(path)}")
+        if args.apply:
+            admin = psycopg2.connect(**migrate.admin_db_config())
+            migrate.ensure_table(admin)
+            migrate.apply_migration(admin, os.path.basename(path)[:-4], path)
+            admin.close()
+            print("применена; повторная проверка: python plan_guard.py")
+    if args.check:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
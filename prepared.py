@@ -0,0 +1,143 @@
+"""Повторяющиеся формы запросов: кэш текста SQL и подготовленные операторы.
+
+Различных форм запросов немного — какие фильтры заданы, колонка и направление
+сортировки, — меняются только значения. Поэтому:
+
+  * QueryCompiler хранит текст SQL по ключу формы, повторно он не собирается;
+  * PreparedStatements выполняет запрос как серверный подготовленный оператор
+    (PREPARE / EXECUTE) на соединении из пула: PostgreSQL разбирает и планирует
+    его один раз на соединение, дальше только EXECUTE с новыми значениями.
+
+Подготовленные операторы живут в сессии, поэтому соединения создаются с
+connection_factory=PreparingConnection (у них есть список операторов);
+на других соединениях запрос выполняется как обычно. Через pgbouncer в режиме
+transaction pooling подготовленные операторы не работают. На время выполнения
+у курсора выставлен sql_source = (запрос, значения): курсор метрик (metrics.py)
+относит время EXECUTE к исходному тексту запроса.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import psycopg2.extensions
+
+_PLACEHOLDER = re.compile(r"%(s|%)")
+
+
+def to_positional(query):
+    """Текст для PREPARE: %s -> $1, $2, ..., %% -> %. Возвращает (текст, число параметров)."""
+    n = 0
+
+    def replace(m):
+        nonlocal n
+        if m.group(1) == "%":
+            return "%"
+        n += 1
+        return f"${n}"
+
+    return _PLACEHOLDER.sub(replace, query), n
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """Соединение psycopg2 со списком своих подготовленных операторов (текст запроса -> имя)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = OrderedDict()
+
+
+def _hit_rate(hits, misses):
+    return round(hits / (hits + misses), 4) if hits + misses else None
+
+
+class QueryCompiler:
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._texts = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def compile(self, key, build):
+        """Текст SQL формы key; build() собирает его при первом обращении."""
+        with self._lock:
+            text = self._texts.get(key)
+            if text is not None:
+                self._texts.move_to_end(key)
+                self._hits += 1
+                return text
+            self._misses += 1
+        text = build()
+        with self._lock:
+            self._texts[key] = text
+            while len(self._texts) > self.max_entries:
+                self._texts.popitem(last=False)
+        return text
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._texts), "hits": self._hits, "misses": self._misses,
+                    "hit_rate": _hit_rate(self._hits, self._misses)}
+
+
+class PreparedStatements:
+    def __init__(self, max_per_connection=200):
+        """max_per_connection — операторов на соединение; самый давно не выполнявшийся
+           освобождается (DEALLOCATE), когда их становится больше."""
+        self.max_per_connection = max_per_connection
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "prepared": 0, "deallocated": 0, "unprepared": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def execute(self, cur, query, values=()):
+        """cur.execute(query, values) через подготовленный оператор соединения курсора."""
+        conn = cur.connection
+        prepared = getattr(conn, "prepared", None)
+        if prepared is None:
+            self._count("unprepared")
+            cur.execute(query, values)
+            return
+        if not hasattr(cur, "sql_source"):  # курсор без метрик
+            self._execute_prepared(cur, prepared, query, values)
+            return
+        cur.sql_source = (query, values)
+        try:
+            self._execute_prepared(cur, prepared, query, values)
+        finally:
+            cur.sql_source = None
+
+    def _execute_prepared(self, cur, prepared, query, values):
+        name = prepared.get(query)
+        if name is None:
+            text, n = to_positional(query)
+            if n != len(values):
+                # параметров в тексте не столько, сколько значений — пусть ошибку покажет сам запрос
+                self._count("unprepared")
+                cur.execute(query, values)
+                return
+            # имя — от текста: одинаковое на всех соединениях
+            name = "q_" + hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+            cur.execute(f"PREPARE {name} AS {text}")
+            prepared[query] = name
+            self._count("prepared")
+            while len(prepared) > self.max_per_connection:
+                _, old = prepared.popitem(last=False)
+                cur.execute(f"DEALLOCATE {old}")
+                self._count("deallocated")
+        else:
+            prepared.move_to_end(query)
+            self._count("hits")
+        if values:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(values))})", values)
+        else:
+            cur.execute(f"EXECUTE {name}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["hit_rate"] = _hit_rate(stats["hits"], stats["prepared"])
+        return stats
@@ -0,0 +1,180 @@
+"""Справочник регионов и векторное определение региона по ИНН.
+
+Регион — первые две цифры ИНН. Вместо разбора каждой строки в Python
+код берётся из массива целиком (numpy или Arrow), а наименование —
+индексированием заранее построенной таблицы REGION_NAMES[код].
+"""
+from functools import lru_cache
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # Arrow-вариант нужен только выгрузкам Parquet/Arrow
+    pa = pc = None
+
+# -------------------------
+# Справочник регионов (код -> наименование)
+# -------------------------
+REGION_MAP = {
+    1: "Республика Адыгея", 
+    2: "Республика Башкортостан", 
+    3: "Республика Бурятия", 
+    4: "Республика Алтай",
+    5: "Республика Дагестан", 
+    6: "Республика Ингушетия", 
+    7: "Кабардино-Балкарская Республика",
+    8: "Республика Калмыкия", 
+    9: "Карачаево-Черкесская Республика", 
+    10: "Республика Карелия",
+    11: "Республика Коми", 
+    12: "Республика Марий Эл", 
+    13: "Республика Мордовия",
+    14: "Республика Саха (Якутия)", 
+    15: "Республика Северная Осетия — Алания", 
+    16: "Республика Татарстан",
+    17: "Республика Тыва", 
+    18: "Удмуртская Республика", 
+    19: "Республика Хакасия",
+    20: "Чеченская Республика", 
+    21: "Чувашская Республика", 
+    22: "Алтайский край",
+    23: "Краснодарский край", 
+    24: "Красноярский край", 
+    25: "Приморский край", 
+    26: "Ставропольский край",
+    27: "Хабаровский край", 
+    28: "Амурская область", 
+    29: "Архангельская область", 
+    30: "Астраханская область",
+    31: "Белгородская область",
+    32: "Брянская область",
+    33: "Владимирская область",
+    34: "Волгоградская область",
+    35: "Вологодская область",
+    36: "Воронежская область",
+    37: "Ивановская область",
+    38: "Иркутская область",
+    39: "Калининградская область", 
+    40: "Калужская область", 
+    41: "Камчатский край", 
+    42: "Кемеровская область",
+    43: "Кировская область", 
+    44: "Костромская область", 
+    45: "Курганская область", 
+    46: "Курская область",
+    47: "Ленинградская область", 
+    48: "Липецкая область",
+    49: "Магаданская область",
+    50: "Московская область",
+    51: "Мурманская область", 
+    52: "Нижегородская область", 
+    53: "Новгородская область", 
+    54: "Новосибирская область",
+    55: "Омская область",
+    56: "Оренбургская область",
+    57: "Орловская область",
+    58: "Пензенская область",
+    59: "Пермский край",
+    60: "Псковская область",
+    61: "Ростовская область",
+    62: "Рязанская область",
+    63: "Самарская область",
+    64: "Саратовская область",
+    65: "Сахалинская область",
+    66: "Свердловская область",
+    67: "Смоленская область",
+    68: "Тамбовская область",
+    69: "Тверская область",
+    70: "Томская область",
+    71: "Тульская область",
+    72: "Тюменская область",
+    73: "Ульяновская область",
+    74: "Челябинская область",
+    75: "Забайкальский край",
+    76: "Ярославская область",
+    77: "Москва", 
+    78: "Санкт-Петербург",
+    79: "Еврейская автономная область", 
+    80: "",
+    81: "",
+    82: "",
+    83: "Ненецкий автономный округ",
+    84: "",
+    85: "",
+    86: "Ханты-Мансийский автономный округ — Югра", 
+    87: "Чукотский автономный округ",
+    88: "",
+    89: "Ямало-Ненецкий автономный округ", 
+    90: "Запорожская область", 
+    91: "Республика Крым", 
+    92: "Севастополь", 
+    93: "Донецкая Народная Республика", 
+    94: "Луганская Народная Республика", 
+    95: "Херсонская область", 
+    96: "", 
+    97: "", 
+    98: "",     
+    99: "Иные территории"
+}
+
+UNKNOWN_REGION = "Неизвестный регион"
+
+# таблица наименований, индекс — двузначный код региона (0..99)
+REGION_NAMES = np.array([REGION_MAP.get(code, UNKNOWN_REGION) for code in range(100)], dtype=object)
+
+
+def region_name(code):
+    return REGION_NAMES[code] if 0 <= code < len(REGION_NAMES) else UNKNOWN_REGION
+
+
+def region_label(code):
+    """Подпись для выпадающего списка: "77 — Москва"."""
+    return f"{code} — {region_name(code)}"
+
+
+def region_codes(inns):
+    """Коды регионов для последовательности ИНН (list, numpy, pandas) одним проходом.
+       Как и фильтр в SQL: из первых двух символов берутся только цифры,
+       пустой результат (None, не цифры) даёт код 0."""
+    if hasattr(inns, "to_numpy"):
+        inns = inns.to_numpy(dtype=object)
+    # U2 обрезает каждое значение до двух символов; кодовые точки — это uint32
+    chars = np.asarray(inns, dtype=object).astype("U2")
+    cp = chars.view(np.uint32).reshape(-1, 2).astype(np.int64) - ord("0")
+    digit = (cp >= 0) & (cp <= 9)
+    d0, d1 = cp[:, 0], cp[:, 1]
+    return np.where(digit[:, 0] & digit[:, 1], d0 * 10 + d1,
+                    np.where(digit[:, 0], d0, np.where(digit[:, 1], d1, 0)))
+
+
+def region_names(inns):
+    """Наименования регионов (numpy-массив строк) для последовательности ИНН."""
+    return REGION_NAMES[region_codes(inns)]
+
+
+@lru_cache(maxsize=None)
+def _region_name_for_prefix(prefix):
+    return REGION_NAMES[region_codes([prefix])[0]]
+
+
+def region_name_for_inn(inn):
+    """Наименование региона для одного ИНН (строки страницы /data) — как region_names,
+       в том числе для ИНН числом. Регион зависит только от первых двух символов,
+       ответ по ним кэшируется."""
+    return _region_name_for_prefix(None if inn is None else str(inn)[:2])
+
+
+def region_names_arrow(inns):
+    """То же для Arrow-массива ИНН, целиком средствами pyarrow.compute."""
+    head = pc.replace_substring_regex(pc.utf8_slice_codeunits(inns.cast(pa.string()), 0, 2), "[^0-9]", "")
+    codes = pc.fill_null(pc.cast(pc.if_else(pc.equal(head, ""), None, head), pa.int32()), 0)
+    return pc.take(pa.array(REGION_NAMES.tolist(), type=pa.string()), codes)
+
+
+def region_names_sql(code_expr):
+    """SQL-выражение наименования региона по коду — та же таблица, но в БД
+       (для COPY, где строки не проходят через Python)."""
+    names = ", ".join("'" + n.replace("'", "''") + "'" for n in REGION_NAMES[1:])
+    return f"COALESCE((ARRAY[{names}])[{code_expr}], '{UNKNOWN_REGION}')"
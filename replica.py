@@ -0,0 +1,182 @@
+"""Локальная колоночная копия таблицы продаж (DuckDB) для чтения без PostgreSQL.
+
+Таблица продаж меняется только при загрузке (новая запись в
+service_toolkit.upd_t), поэтому копию достаточно синхронизировать один раз
+на загрузку. Построчной метки загрузки в таблице нет, поэтому синхронизация
+работает так же, как обновление индекса фильтров (facets.py): перечитываются
+строки с "Дата" не раньше (последняя дата - window_days) и строки без даты.
+Если число более старых строк в PostgreSQL изменилось (перезагрузка
+истории), копия строится заново.
+
+Копия лежит в файле DuckDB (колоночное хранение, читается с диска
+страницами) и переживает перезапуск: если версия в файле совпадает с
+текущей, синхронизация ничего не читает. Таблица называется так же, как в
+PostgreSQL, и дополнительно хранит region_code, ctid и row_id (номер строки
+в копии — разрыватель ничьих при сортировке, под обоими именами: у обычной
+таблицы это ctid, у секционированной — row_id), поэтому SQL приложения
+выполняется без изменений, кроме плейсхолдеров: %s -> ?.
+
+Файл DuckDB открывается на запись только одним процессом: при нескольких
+воркерах gunicorn путь должен содержать {pid}.
+"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2.extensions
+
+from export import EXPORT_BATCH_SIZE, NUMERIC_AS_FLOAT
+from regions import region_codes
+
+try:
+    import duckdb
+except ImportError:  # duckdb нужен только при REPLICA_ENABLED=1
+    duckdb = None
+
+FETCH_SIZE = 50000
+
+# OID типов PostgreSQL -> тип колонки DuckDB (остальное хранится строкой)
+_DUCKDB_TYPES_BY_OID = {
+    16: "BOOLEAN", 20: "BIGINT", 21: "BIGINT", 23: "BIGINT", 700: "DOUBLE", 701: "DOUBLE",
+    1700: "DOUBLE", 1082: "DATE", 1114: "TIMESTAMP", 1184: "TIMESTAMPTZ",
+}
+
+
+class LocalReplica:
+    def __init__(self, path, table, columns, inn_column, date_column):
+        """columns — колонки таблицы продаж, которые копируются (без "Регион")."""
+        if duckdb is None:
+            raise RuntimeError("для REPLICA_ENABLED=1 установите пакет duckdb")
+        self.path = path
+        self.table = table
+        self.columns = list(columns)
+        self.inn_column = inn_column
+        self.date_sql = f'"{date_column}"'
+        self._db = duckdb.connect(path)
+        # NULL при сортировке — как в PostgreSQL: последними при ASC, первыми при DESC
+        self._db.execute("SET default_null_order = 'nulls_last_on_asc_first_on_desc'")
+        self._db.execute("CREATE TABLE IF NOT EXISTS replica_meta (key VARCHAR PRIMARY KEY, value VARCHAR)")
+        if "." in table:
+            self._db.execute(f"CREATE SCHEMA IF NOT EXISTS {table.split('.')[0]}")
+        row = self._db.execute("SELECT value FROM replica_meta WHERE key = 'version'").fetchone()
+        self.version = row[0] if row else None
+        self.last_sync = {}
+        self._lock = threading.Lock()
+
+    # -------------------------
+    # Синхронизация
+    # -------------------------
+    def sync(self, conn, version, window_days=45):
+        """Догружает изменения из PostgreSQL (conn) до версии version; возвращает self."""
+        with self._lock:
+            if self.version == str(version):
+                return self
+            start = time.time()
+            db = self._db.cursor()
+            db.execute("BEGIN TRANSACTION")
+            try:
+                mode = self._sync_window(conn, db, window_days) if self._exists(db) else None
+                if mode is None:
+                    mode = self._sync_full(conn, db)
+                db.execute("INSERT OR REPLACE INTO replica_meta VALUES ('version', ?)", [str(version)])
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            finally:
+                conn.commit()
+            self.version = str(version)
+            rows = db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            db.close()
+            self.last_sync = {"mode": mode, "rows": rows, "seconds": round(time.time() - start, 3)}
+        return self
+
+    def _exists(self, db):
+        # копия из версии без row_id строится заново
+        schema, _, name = self.table.rpartition(".")
+        db.execute("SELECT 1 FROM information_schema.columns "
+                   "WHERE table_schema = ? AND table_name = ? AND column_name = 'row_id'",
+                   [schema or "main", name])
+        return db.fetchone() is not None
+
+    def _sync_window(self, conn, db, window_days):
+        """Перечитывает только окно последних дней; None, если нужна полная загрузка."""
+        date = self.date_sql
+        cutoff = db.execute(f"SELECT CAST(MAX({date}) - INTERVAL {int(window_days)} DAY AS DATE) "
+                            f"FROM {self.table}").fetchone()[0]
+        if cutoff is None:
+            return None
+        local_old = db.execute(f"SELECT COUNT(*) FROM {self.table} WHERE {date} < ?", [cutoff]).fetchone()[0]
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM {self.table} WHERE {date} < %s", (cutoff,))
+            if cur.fetchone()[0] != local_old:
+                return None
+        db.execute(f"DELETE FROM {self.table} WHERE {date} >= ? OR {date} IS NULL", [cutoff])
+        self._load(conn, db, f"WHERE {date} >= %s OR {date} IS NULL", (cutoff,))
+        return "window"
+
+    def _sync_full(self, conn, db):
+        db.execute(f"DROP TABLE IF EXISTS {self.table}")
+        self._load(conn, db, create=True)
+        return "full"
+
+    def _create(self, db, description):
+        types = [_DUCKDB_TYPES_BY_OID.get(d[1], "VARCHAR") for d in description]
+        columns = [f'"{name}" {t}' for name, t in zip(self.columns, types)]
+        db.execute(f"CREATE TABLE {self.table} ({', '.join(columns)}, region_code INTEGER, ctid BIGINT, row_id BIGINT)")
+
+    def _load(self, conn, db, where="", values=(), create=False):
+        """Переносит строки из PostgreSQL пачками; region_code считается по ИНН, как в SQL."""
+        next_id = 0 if create else db.execute(f"SELECT COALESCE(MAX(ctid) + 1, 0) FROM {self.table}").fetchone()[0]
+        select = ", ".join(f'"{c}"' for c in self.columns)
+        with conn.cursor(name="replica_load") as cur:
+            cur.itersize = FETCH_SIZE
+            psycopg2.extensions.register_type(NUMERIC_AS_FLOAT, cur)
+            cur.execute(f"SELECT {select} FROM {self.table} {where}", list(values))
+            while True:
+                rows = cur.fetchmany(FETCH_SIZE)
+                if create:
+                    self._create(db, cur.description)
+                    create = False
+                if not rows:
+                    break
+                batch = pd.DataFrame.from_records(rows, columns=self.columns)
+                batch["region_code"] = region_codes(batch[self.inn_column]).astype(np.int32)
+                batch["ctid"] = np.arange(next_id, next_id + len(rows), dtype=np.int64)
+                batch["row_id"] = batch["ctid"]
+                next_id += len(rows)
+                db.register("replica_batch", batch)
+                db.execute(f"INSERT INTO {self.table} SELECT * FROM replica_batch")
+                db.unregister("replica_batch")
+
+    # -------------------------
+    # Чтение
+    # -------------------------
+    def execute(self, query, values=()):
+        """Курсор DuckDB с результатом запроса, записанного для psycopg2 (плейсхолдеры %s).
+           У каждого вызова своё соединение, поэтому вызывать можно из любых потоков."""
+        cur = self._db.cursor()
+        cur.execute(query.replace("%s", "?"), list(values))
+        return cur
+
+    def count(self, where_clause, values):
+        cur = self.execute(f"SELECT COUNT(*) FROM {self.table} {where_clause}", values)
+        total = cur.fetchone()[0]
+        cur.close()
+        return total
+
+    def iter_batches(self, query, values, batch_size=EXPORT_BATCH_SIZE):
+        """Пачки строк (списки кортежей), как export.iter_batches."""
+        cur = self.execute(query, values)
+        try:
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
+
+    def stats(self):
+        return {"path": self.path, "version": self.version, **self.last_sync}
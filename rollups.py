@@ -0,0 +1,67 @@
+"""Сводные таблицы (materialized view) по таблице продаж и выбор источника итогов.
+
+Сводные таблицы создаются миграцией (migrations/003_sales_rollups.sql) и
+обновляются приложением после каждой загрузки данных (новая версия из
+service_toolkit.upd_t): REFRESH MATERIALIZED VIEW CONCURRENTLY через
+функцию service_toolkit.refresh_sales_rollups, так что чтение во время
+обновления не блокируется. Несколько процессов обновляют по очереди
+(advisory lock), и обновление пропускается, если другой процесс уже
+построил таблицы на этой версии.
+
+Запрос можно ответить из сводной таблицы, если все его фильтры и
+измерения группировки есть среди её колонок; код региона и "Дата" в
+сводных таблицах есть всегда. Иначе итоги считаются по исходным строкам.
+Если миграция применена другим пользователем, пользователю приложения
+нужны SELECT на представление и service_toolkit.rollup_versions.
+"""
+
+REFRESH_LOCK = "sales_rollups"
+
+# колонка кода региона в сводных таблицах (вместо выражения по ИНН)
+REGION_SQL = '"region_code"'
+
+# итоги по сводной таблице: цена, количество, число строк исходной таблицы
+MEASURES = 'SUM("amount"), SUM("quantity"), SUM("lines")::bigint'
+
+
+class Rollup:
+    def __init__(self, table, fields, dimensions):
+        """fields — поля фильтров (из FIELDS), которые есть в таблице;
+           dimensions — измерения /aggregate, по которым её можно группировать."""
+        self.table = table
+        self.fields = set(fields)
+        self.dimensions = set(dimensions)
+
+    def covers(self, filter_fields, group_by):
+        return set(filter_fields) <= self.fields and set(group_by) <= self.dimensions
+
+
+# от меньшей таблицы к большей: берётся первая подходящая
+ROLLUPS = [
+    Rollup("intermediate_scheme.sales_daily_rollup",
+           fields=["Номенклатура.ГАУ.Группа"],
+           dimensions=["region", "gau_group", "month"]),
+]
+
+
+def pick(filter_fields, group_by=()):
+    """Сводная таблица для фильтров по полям filter_fields и группировки group_by или None."""
+    return next((r for r in ROLLUPS if r.covers(filter_fields, group_by)), None)
+
+
+def refresh(conn, version):
+    """Обновляет сводные таблицы до версии данных version.
+       False, если миграция со сводными таблицами не применена."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regprocedure('service_toolkit.refresh_sales_rollups(text)') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return False
+        # ждём, пока обновление закончит другой процесс, и не повторяем его
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (REFRESH_LOCK,))
+        cur.execute("SELECT version FROM service_toolkit.rollup_versions WHERE name = %s", (REFRESH_LOCK,))
+        row = cur.fetchone()
+        if row is None or row[0] != str(version):
+            cur.execute("SELECT service_toolkit.refresh_sales_rollups(%s)", (str(version),))
+    conn.commit()
+    return True
@@ -0,0 +1,78 @@
+"""Поиск подстроки по значениям одного поля в памяти (для автодополнения).
+
+Заменяет SELECT DISTINCT ... ILIKE '%q%', который не может использовать
+btree-индекс и на каждое нажатие клавиши читает всю таблицу.
+
+  * префиксные совпадения — бинарный поиск по отсортированным ключам;
+  * подстроки от трёх символов — пересечение списков строк по триграммам
+    с последующей проверкой кандидатов;
+  * одно-двухсимвольные подстроки — проход по значениям до набора limit.
+
+Сначала выдаются совпадения по префиксу, затем остальные; внутри групп —
+в исходном порядке значений (как ORDER BY в БД).
+"""
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+
+_MAX_CHAR = "\U0010ffff"
+
+
+class SubstringIndex:
+    def __init__(self, values):
+        """values — различные значения поля в нужном порядке выдачи."""
+        self.values = list(values)
+        self.lower = [str(v).lower() for v in self.values]
+        order = sorted(range(len(self.lower)), key=self.lower.__getitem__)
+        self._prefix_keys = [self.lower[i] for i in order]
+        self._prefix_ids = np.array(order, dtype=np.int32)
+
+        postings = defaultdict(list)
+        for i, s in enumerate(self.lower):
+            for gram in {s[j:j + 3] for j in range(len(s) - 2)}:
+                postings[gram].append(i)
+        self._trigrams = {g: np.array(ids, dtype=np.int32) for g, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.values)
+
+    def _prefix_matches(self, q):
+        lo = bisect_left(self._prefix_keys, q)
+        hi = bisect_left(self._prefix_keys, q + _MAX_CHAR)
+        return np.sort(self._prefix_ids[lo:hi])
+
+    def _substring_candidates(self, q):
+        """Строки, содержащие все триграммы q (по возрастанию номера)."""
+        grams = sorted({q[j:j + 3] for j in range(len(q) - 2)},
+                       key=lambda g: len(self._trigrams.get(g, ())))
+        result = None
+        for gram in grams:
+            ids = self._trigrams.get(gram)
+            if ids is None:
+                return np.empty(0, dtype=np.int32)
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    def search(self, q, limit=50):
+        q = q.lower()
+        if not q:
+            return self.values[:limit]
+        prefix = self._prefix_matches(q)[:limit]
+        res = [self.values[i] for i in prefix]
+        if len(res) >= limit:
+            return res
+
+        if len(q) >= 3:
+            candidates = (i for i in self._substring_candidates(q))
+        else:
+            candidates = iter(range(len(self.lower)))
+        for i in candidates:
+            s = self.lower[i]
+            if q in s and not s.startswith(q):
+                res.append(self.values[i])
+                if len(res) >= limit:
+                    break
+        return res
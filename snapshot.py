@@ -0,0 +1,105 @@
+"""Данные, которые строятся один раз на загрузку и живут в памяти процесса.
+
+Версия — метка последней загрузки (MAX("datetime") из service_toolkit.upd_t):
+пока она не изменилась, повторно в БД не ходим.
+"""
+import threading
+import time
+
+_EMPTY = object()
+
+
+class VersionedSnapshot:
+    def __init__(self, build):
+        """build(conn) -> значение; вызывается при первой выдаче и после смены версии."""
+        self.build = build
+        self._lock = threading.Lock()
+        self._version = _EMPTY
+        self._value = None
+
+    def get(self, conn, version):
+        if self._version == version:
+            return self._value
+        # строим под блокировкой, чтобы параллельные запросы не делали одно и то же
+        with self._lock:
+            if self._version != version:
+                self._value = self.build(conn)
+                self._version = version
+        return self._value
+
+    def current(self, version):
+        """Значение для version, если оно уже построено, иначе None (без обращения к БД)."""
+        return self._value if self._version == version else None
+
+    def peek(self):
+        """Последнее построенное значение (может быть от прошлой версии) или None."""
+        return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._version = _EMPTY
+
+
+class BackgroundSnapshot(VersionedSnapshot):
+    """То же, но долгое построение идёт в фоновом потоке: пока значение для
+       текущей версии не готово, get_ready() возвращает None и вызывающий
+       использует обычный путь (запрос в БД). После неудачи (нет соединения,
+       ошибка build) следующая попытка — не раньше чем через retry_delay секунд,
+       с каждой новой неудачей вдвое дольше, но не больше max_retry_delay.
+       get_latest() вместо None отдаёт значение прошлой версии, а get()
+       дожидается идущего фонового построения вместо повторного."""
+
+    def __init__(self, build, connect, release, retry_delay=5.0, max_retry_delay=300.0):
+        super().__init__(build)
+        self.connect = connect
+        self.release = release
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._building = _EMPTY
+        self._built = threading.Condition(self._lock)
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def get(self, conn, version):
+        with self._lock:
+            while self._building == version and self._version != version:
+                self._built.wait()
+        return super().get(conn, version)
+
+    def get_latest(self, version):
+        """Значение для version, а пока оно строится в фоне — последнее построенное
+           (от прошлой версии; None, если ещё ни одного)."""
+        value = self.get_ready(version)
+        return self._value if value is None else value
+
+    def get_ready(self, version):
+        if self._version == version:
+            return self._value
+        with self._lock:
+            if self._building != version and time.monotonic() >= self._retry_at:
+                self._building = version
+                threading.Thread(target=self._build_in_background, args=(version,),
+                                 name="snapshot-build", daemon=True).start()
+        return None
+
+    def _build_in_background(self, version):
+        try:
+            conn = self.connect()
+            try:
+                value = self.build(conn)
+            finally:
+                self.release(conn)
+        except Exception:
+            with self._lock:
+                self._building = _EMPTY
+                self._failures += 1
+                delay = min(self.retry_delay * 2 ** (self._failures - 1), self.max_retry_delay)
+                self._retry_at = time.monotonic() + delay
+                self._built.notify_all()
+            raise
+        with self._lock:
+            self._value = value
+            self._version = version
+            self._failures = 0
+            self._retry_at = 0.0
+            self._built.notify_all()
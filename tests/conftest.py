@@ -0,0 +1,12 @@
+"""Общие настройки тестов (python -m pytest из корня репозитория).
+
+app.py при импорте создаёт пул соединений и проверяет схему таблицы. Тестам
+БД не нужна: пул не открывает соединений заранее, а проверка схемы при старте
+не находит сервер (сокет в несуществующем каталоге) и оставляет значения
+по умолчанию — тесты сами задают нужную схему.
+"""
+import os
+import tempfile
+
+os.environ["DB_POOL_MIN"] = "0"
+os.environ["DB_HOST"] = os.path.join(tempfile.gettempdir(), "sales-tests-no-db")
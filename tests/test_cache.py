@@ -0,0 +1,92 @@
+"""Кэши cache.py: LRU-вытеснение, TTL и сброс при новой версии данных для memory и sqlite."""
+import time
+
+import pytest
+
+from cache import Cache, MemoryBackend, SQLiteBackend, make_cache
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend_factory(request, tmp_path):
+    """backend_factory(max_entries, namespace) — бэкенд нужного вида (sqlite — в общем файле)."""
+    if request.param == "memory":
+        return lambda max_entries, namespace="cache": MemoryBackend(max_entries)
+    path = str(tmp_path / "cache.sqlite3")
+    return lambda max_entries, namespace="cache": SQLiteBackend(path, max_entries, namespace)
+
+
+def test_get_set_and_miss(backend_factory):
+    cache = Cache(backend_factory(10), ttl=60)
+    assert cache.get("a", "v1") is None
+    cache.set("a", {"x": [1, 2]}, "v1")
+    assert cache.get("a", "v1") == {"x": [1, 2]}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+
+def test_lru_eviction_keeps_recently_read(backend_factory, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    cache = Cache(backend_factory(3), ttl=600)
+    for key in "abc":
+        clock[0] += 1
+        cache.set(key, key, "v1")
+    clock[0] += 1
+    assert cache.get("a", "v1") == "a"   # «a» прочитан последним — вытесняется «b»
+    clock[0] += 1
+    cache.set("d", "d", "v1")
+    assert [cache.get(k, "v1") for k in "abcd"] == ["a", None, "c", "d"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry(backend_factory, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    cache = Cache(backend_factory(10), ttl=60)
+    cache.set("a", 1, "v1")
+    clock[0] += 59
+    assert cache.get("a", "v1") == 1
+    clock[0] += 2
+    assert cache.get("a", "v1") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_new_version_clears_entries(backend_factory):
+    cache = Cache(backend_factory(10), ttl=60)
+    cache.set("a", 1, "v1")
+    cache.set("b", 2, "v1")
+    assert cache.get("a", "v2") is None
+    assert cache.stats()["size"] == 0
+    assert cache.stats()["invalidations"] == 2   # v1 и v2
+    # без версии (None) записи не сбрасываются
+    cache.set("c", 3, "v2")
+    assert cache.get("c", None) is None   # ключ включает версию
+    assert cache.get("c", "v2") == 3
+
+
+def test_sqlite_namespaces_share_file_but_not_entries(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    first = make_cache("sqlite", 10, 60, url=path, namespace="autocomplete")
+    second = make_cache("sqlite", 10, 60, url=path, namespace="responses")
+    first.set("k", "first", "v1")
+    second.set("k", "second", "v1")
+    assert first.get("k", "v2") is None   # новая версия сбрасывает только свой кэш
+    assert second.get("k", "v1") == "second"
+
+
+def test_sqlite_access_times_survive_other_processes(tmp_path, monkeypatch):
+    """Время чтения пишется пачкой, но вытеснение видит его и из другого экземпляра бэкенда."""
+    clock = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    path = str(tmp_path / "cache.sqlite3")
+    reader, writer = SQLiteBackend(path, 2), SQLiteBackend(path, 2)
+    for key in "ab":
+        clock[0] += 1
+        writer.set(key, key, 600)
+    clock[0] += 1
+    assert reader.get("a") == ("a", False)
+    clock[0] += SQLiteBackend.ACCESS_FLUSH_SECONDS + 1
+    assert reader.get("a") == ("a", False)   # срок вышел — накопленное записано
+    writer.set("c", "c", 600)
+    assert writer.get("a") == ("a", False)
+    assert writer.get("b") == (None, False)
@@ -0,0 +1,194 @@
+"""Пул соединений (dbpool.py): ожидание с таймаутом, очередь FIFO, пересоздание соединений.
+
+Вместо PostgreSQL — соединения-заглушки: пулу нужны только closed, cursor(),
+commit/rollback/close и info.transaction_status."""
+import threading
+import time
+from types import SimpleNamespace
+
+import psycopg2
+import psycopg2.extensions
+import pytest
+
+import dbpool
+from dbpool import ConnectionPool, PoolError, PoolFull, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.closed = 0
+        self.broken = False
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.executed = []
+
+    @property
+    def info(self):
+        return SimpleNamespace(transaction_status=self.status)
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def execute(self, query, values=None):
+                if conn.broken:
+                    raise psycopg2.OperationalError("server closed the connection unexpectedly")
+                conn.executed.append((query, values))
+                conn.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+            def close(self):
+                pass
+
+        return Cursor()
+
+    def commit(self):
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Список созданных пулом соединений (по порядку)."""
+    created = []
+
+    def connect(**kwargs):
+        conn = FakeConnection(**kwargs)
+        created.append(conn)
+        return conn
+
+    monkeypatch.setattr(dbpool.psycopg2, "connect", connect)
+    return created
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "не дождались"
+        time.sleep(0.005)
+
+
+def test_min_connections_and_reuse(connections):
+    pool = ConnectionPool(1, 2, host="db")
+    assert len(connections) == 1 and connections[0].kwargs == {"host": "db"}
+    conn = pool.getconn()
+    assert conn is connections[0]
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert pool.stats()["in_use"] == 1
+
+
+def test_timeout_when_exhausted(connections):
+    pool = ConnectionPool(0, 1, timeout=0.05)
+    conn = pool.getconn()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()["timeouts"] == 1 and pool.stats()["waiting"] == 0
+    pool.putconn(conn)
+    assert pool.getconn(timeout=0.05) is conn
+
+
+def test_full_queue_rejects_immediately(connections):
+    pool = ConnectionPool(0, 1, timeout=1, max_waiting=1)
+    conn = pool.getconn()
+    waiter = threading.Thread(target=lambda: pool.putconn(pool.getconn()))
+    waiter.start()
+    wait_for(lambda: pool.stats()["waiting"] == 1)
+    with pytest.raises(PoolFull):
+        pool.getconn()
+    assert pool.stats()["rejected"] == 1
+    pool.putconn(conn)
+    waiter.join()
+
+
+def test_waiters_served_in_fifo_order(connections):
+    pool = ConnectionPool(0, 1, timeout=5)
+    conn = pool.getconn()
+    served = []
+
+    def borrow(name):
+        c = pool.getconn()
+        served.append(name)
+        pool.putconn(c)
+
+    threads = []
+    for i, name in enumerate(["first", "second", "third"]):
+        t = threading.Thread(target=borrow, args=(name,))
+        t.start()
+        threads.append(t)
+        wait_for(lambda: pool.stats()["waiting"] == i + 1)
+    pool.putconn(conn)
+    for t in threads:
+        t.join()
+    assert served == ["first", "second", "third"]
+    assert len(connections) == 1   # ожидающие получили то же соединение, новых не создавалось
+
+
+def test_closed_connection_frees_slot_for_waiter(connections):
+    pool = ConnectionPool(0, 1, timeout=5)
+    conn = pool.getconn()
+    got = []
+    t = threading.Thread(target=lambda: got.append(pool.getconn()))
+    t.start()
+    wait_for(lambda: pool.stats()["waiting"] == 1)
+    pool.putconn(conn, close=True)
+    t.join()
+    assert conn.closed and got[0] is connections[1]
+    assert pool.stats()["size"] == 1
+
+
+def test_recycles_old_and_closed_connections(connections, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(dbpool.time, "monotonic", lambda: clock[0])
+    pool = ConnectionPool(0, 2, max_lifetime=60, check_idle=1000)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    clock[0] += 61
+    fresh = pool.getconn()
+    assert fresh is not conn and conn.closed
+    assert pool.stats()["recycled"] == 1
+    fresh.closed = 2   # соединение закрылось, пока лежало в пуле
+    pool.putconn(fresh)
+    assert pool.getconn() is connections[-1] is not fresh
+    assert pool.stats()["size"] == 1
+
+
+def test_idle_connection_checked_and_replaced_when_broken(connections, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(dbpool.time, "monotonic", lambda: clock[0])
+    pool = ConnectionPool(0, 1, max_lifetime=3600, check_idle=30)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    clock[0] += 31
+    assert pool.getconn() is conn and ("SELECT 1", None) in conn.executed
+    pool.putconn(conn)
+    clock[0] += 31
+    conn.broken = True
+    assert pool.getconn() is connections[1]
+    assert pool.stats()["broken"] == 1
+
+
+def test_putconn_rolls_back_open_transaction(connections):
+    pool = ConnectionPool(0, 1)
+    conn = pool.getconn()
+    conn.status = psycopg2.extensions.TRANSACTION_STATUS_INERROR
+    pool.putconn(conn)
+    assert conn.status == psycopg2.extensions.TRANSACTION_STATUS_IDLE and not conn.closed
+    with pytest.raises(PoolError):
+        pool.putconn(FakeConnection())
+
+
+def test_statement_timeout_set_only_on_change(connections):
+    pool = ConnectionPool(0, 1)
+    conn = pool.getconn(5000)
+    pool.putconn(conn)
+    pool.putconn(pool.getconn(5000))
+    pool.putconn(pool.getconn(0))
+    assert [q for q in conn.executed if q[0].startswith("SET")] == [
+        ("SET statement_timeout = %s", (5000,)), ("SET statement_timeout = %s", (0,))]
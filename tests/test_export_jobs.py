@@ -0,0 +1,120 @@
+"""Фоновые выгрузки (export_jobs.py): повтор одинаковых заданий, ключи между воркерами, очистка.
+
+Воркеры gunicorn — два ExportJobManager над одним каталогом результатов."""
+import os
+import threading
+import time
+
+import pytest
+
+from export_jobs import ExportJobManager, QueueFull
+
+
+class Runner:
+    """run_job, который ждёт release() и пишет в файл результата строку."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def __call__(self, job, path, report):
+        self.started.set()
+        assert self.released.wait(5)
+        with open(path, "w") as f:
+            f.write("ok")
+        job["rows_written"] = 1
+        report()
+
+    def release(self):
+        self.released.set()
+
+
+def wait_status(manager, job_id, status):
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job and job["status"] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"задание {job_id} не перешло в {status}")
+
+
+@pytest.fixture
+def runner():
+    runner = Runner()
+    yield runner
+    runner.release()
+
+
+def test_same_key_returns_active_job(tmp_path, runner):
+    manager = ExportJobManager(runner, str(tmp_path), workers=1)
+    job, created = manager.submit("xlsx|a", None)
+    again, created_again = manager.submit("xlsx|a", None)
+    assert created and not created_again
+    assert again["id"] == job["id"]
+
+    other, created_other = manager.submit("xlsx|b", None)
+    assert created_other and other["id"] != job["id"]
+
+
+def test_dedup_across_workers(tmp_path, runner):
+    first = ExportJobManager(runner, str(tmp_path), workers=1)
+    second = ExportJobManager(runner, str(tmp_path), workers=1)
+    job, created = first.submit("xlsx|a", None)
+    seen, created_seen = second.submit("xlsx|a", None)
+    assert created and not created_seen
+    assert seen["id"] == job["id"]
+    # лишнего состояния от отклонённого задания не остаётся
+    assert sorted(n for n in os.listdir(tmp_path) if n.endswith(".json")) == [job["id"] + ".json"]
+
+
+def test_finished_job_releases_key(tmp_path, runner):
+    first = ExportJobManager(runner, str(tmp_path), workers=1)
+    second = ExportJobManager(runner, str(tmp_path), workers=1)
+    job, _ = first.submit("xlsx|a", None)
+    runner.release()
+    wait_status(second, job["id"], "done")
+    assert not [n for n in os.listdir(tmp_path) if n.endswith(".key")]
+
+    again, created = second.submit("xlsx|a", None)
+    assert created and again["id"] != job["id"]
+
+
+def test_stale_key_of_dead_worker_is_taken_over(tmp_path, runner):
+    dead = ExportJobManager(runner, str(tmp_path), workers=1)
+    job, _ = dead.submit("xlsx|a", None)
+    runner.release()
+    wait_status(dead, job["id"], "done")
+    # процесс упал между записью состояния и удалением ключа
+    dead._claim_key("xlsx|a", job["id"])
+
+    manager = ExportJobManager(runner, str(tmp_path), workers=1)
+    again, created = manager.submit("xlsx|a", None)
+    assert created and again["id"] != job["id"]
+
+
+def test_queue_full_frees_key(tmp_path, runner):
+    manager = ExportJobManager(runner, str(tmp_path), workers=1, max_queue=1)
+    manager.submit("xlsx|a", None)
+    assert runner.started.wait(5)
+    manager.submit("xlsx|b", None)
+    with pytest.raises(QueueFull):
+        manager.submit("xlsx|c", None)
+    # ключ и состояние отклонённого задания не остаются и не мешают поставить его позже
+    assert not os.path.exists(manager._key_path("xlsx|c"))
+    assert len([n for n in os.listdir(tmp_path) if n.endswith(".json")]) == 2
+
+
+def test_status_request_cleans_up_expired_results(tmp_path, runner, monkeypatch):
+    manager = ExportJobManager(runner, str(tmp_path), workers=1, result_ttl=60, cleanup_interval=10)
+    job, _ = manager.submit("xlsx|a", None)
+    runner.release()
+    done = wait_status(manager, job["id"], "done")
+    assert os.path.exists(manager.result_path(done))
+
+    # другой воркер, который заданий не ставит, но отвечает на запросы статуса
+    reader = ExportJobManager(runner, str(tmp_path), result_ttl=60, cleanup_interval=10)
+    later = time.time() + 120
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert reader.get(job["id"]) is None
+    assert not os.path.exists(manager.result_path(done))
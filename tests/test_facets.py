@@ -0,0 +1,119 @@
+"""Зависимые списки в памяти (facets.py): то же, что DISTINCT с фильтрами по остальным полям."""
+import datetime
+
+import numpy as np
+import pytest
+
+from facets import FacetIndex, _Encoder, _encode, _merge, _to_dates
+
+COLUMNS = {"manager": '"doc_assigned_manager"', "gau": '"Номенклатура.ГАУ"', "region_code": '"region_code"'}
+
+ROWS = [
+    # manager, gau, region_code, "Дата"
+    ("Иванов", "Бумага", 77, datetime.date(2026, 9, 1)),
+    ("Иванов", "Тонер", 77, datetime.date(2026, 9, 15)),
+    ("Петров", "Бумага", 50, datetime.date(2026, 9, 20)),
+    ("Петров", None, 50, datetime.date(2026, 10, 1)),
+    ("Сидоров", "Картридж", 78, None),
+    (None, "Тонер", 78, datetime.date(2026, 10, 5)),
+]
+
+
+def make_index(rows=ROWS):
+    encoded = {name: _encode([row[i] for row in rows]) for i, name in enumerate(COLUMNS)}
+    return FacetIndex("sales", COLUMNS, '"Дата"', encoded, _to_dates([row[-1] for row in rows]))
+
+
+def reference(field, filters, date_from=None, date_to=None, rows=ROWS):
+    """SELECT DISTINCT field ... WHERE (фильтры остальных полей) AND (даты)."""
+    names = list(COLUMNS)
+    result = set()
+    for row in rows:
+        if any(name != field and values and row[names.index(name)] not in values
+               for name, values in filters.items()):
+            continue
+        if date_from and (row[-1] is None or row[-1] < datetime.date.fromisoformat(date_from[:10])):
+            continue
+        if date_to and (row[-1] is None or row[-1] > datetime.date.fromisoformat(date_to[:10])):
+            continue
+        value = row[names.index(field)]
+        if value:
+            result.add(value)
+    return sorted(result)
+
+
+def test_no_filters_lists_all_values():
+    index = make_index()
+    assert len(index) == len(ROWS)
+    assert index.values("manager", {}) == ["Иванов", "Петров", "Сидоров"]
+    assert index.values("region_code", {}) == [50, 77, 78]
+
+
+def test_cross_filter_excludes_own_field():
+    """Выбор в самом поле его список не сужает, а остальные — сужают."""
+    index = make_index()
+    filters = {"manager": ["Иванов"], "gau": [], "region_code": []}
+    assert index.values("manager", filters) == ["Иванов", "Петров", "Сидоров"]
+    assert index.values("gau", filters) == ["Бумага", "Тонер"]
+    assert index.values("region_code", filters) == [77]
+
+
+def test_filters_intersect_and_accept_strings():
+    """Значения приходят строками из запроса — в том числе коды регионов."""
+    index = make_index()
+    filters = {"gau": ["Бумага", "Тонер"], "region_code": ["77", "78"]}
+    assert index.values("manager", filters) == ["Иванов"]
+    assert index.values("gau", filters) == ["Бумага", "Картридж", "Тонер"]
+    assert index.values("manager", {"gau": ["нет такого"]}) == []
+
+
+@pytest.mark.parametrize("date_from, date_to", [
+    ("2026-09-15", None),
+    (None, "2026-09-20"),
+    ("2026-09-15", "2026-10-01"),
+    ("2026-10-02T00:00:00", "2026-12-31"),
+])
+def test_date_window(date_from, date_to):
+    """Границы включительно; строки без даты под фильтр по дате не попадают."""
+    index = make_index()
+    for field in COLUMNS:
+        assert index.values(field, {}, date_from, date_to) == reference(field, {}, date_from, date_to)
+
+
+def test_matches_reference_for_all_filter_combinations():
+    index = make_index()
+    choices = {"manager": [[], ["Петров"], ["Иванов", "Сидоров"]],
+               "gau": [[], ["Тонер"]],
+               "region_code": [[], [78], [50, 77]]}
+    for manager in choices["manager"]:
+        for gau in choices["gau"]:
+            for region in choices["region_code"]:
+                filters = {"manager": manager, "gau": gau, "region_code": region}
+                for field in COLUMNS:
+                    assert index.values(field, filters, "2026-09-01") == reference(field, filters, "2026-09-01")
+
+
+def test_merge_recodes_both_parts():
+    """refresh: старые строки и перечитанное окно — общий словарь, NULL остаётся -1."""
+    old_dictionary, old_codes = _encode(["б", None, "г"])
+    new_dictionary, new_codes = _encode(["а", "г", None])
+    dictionary, codes = _merge(old_dictionary, old_codes, new_dictionary, new_codes)
+    assert list(dictionary) == ["а", "б", "г"]
+    decoded = [None if c < 0 else dictionary[c] for c in codes]
+    assert decoded == ["б", None, "г", "а", "г", None]
+    assert codes.dtype == np.int32
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 4, 100])
+def test_chunked_encoding_matches_whole(chunk):
+    """Загрузка пачками даёт тот же словарь и коды, что кодирование всей колонки сразу."""
+    raw = ["в", None, "а", "в", "б", None, "а", "г", "б"]
+    encoder = _Encoder()
+    for start in range(0, len(raw), chunk):
+        encoder.add(raw[start:start + chunk])
+    dictionary, codes = encoder.finish()
+    expected_dictionary, expected_codes = _encode(raw)
+    assert list(dictionary) == list(expected_dictionary)
+    assert codes.tolist() == expected_codes.tolist() and codes.dtype == np.int32
+    empty_dictionary, empty_codes = _Encoder().finish()
+    assert len(empty_dictionary) == 0 and len(empty_codes) == 0
@@ -0,0 +1,121 @@
+"""Кэш HTTP-ответов (http_cache.py): ETag и 304, что кэшируется и что нет, сжатые варианты."""
+import gzip
+
+import pytest
+from flask import Flask, Response, jsonify
+
+from cache import Cache, MemoryBackend
+from http_cache import ResponseCache
+
+
+@pytest.fixture
+def env():
+    """(тестовый клиент, счётчик вызовов маршрутов, версия данных — список из одного элемента)."""
+    calls = {}
+    version = ["v1"]
+
+    def current_version():
+        if version[0] is None:
+            raise RuntimeError("БД недоступна")
+        return version[0]
+
+    cache = ResponseCache(Cache(MemoryBackend(100), 600), current_version, max_age=0, encodings=["gzip"],
+                          min_size=100)
+    app = Flask(__name__)
+
+    def route(path):
+        def register(view):
+            def counted(*args, **kwargs):
+                calls[path] = calls.get(path, 0) + 1
+                return view(*args, **kwargs)
+            counted.__name__ = view.__name__
+            app.route(path)(cache.cached(counted))
+            return view
+        return register
+
+    @route("/data")
+    def data():
+        return jsonify({"rows": list(range(5))})
+
+    @route("/big")
+    def big():
+        return jsonify({"rows": ["строка"] * 200})
+
+    @route("/estimate")
+    def estimate():
+        response = jsonify({"total": 1000})
+        response.cache_control.no_store = True
+        return response
+
+    @route("/stream")
+    def stream():
+        return Response((chunk for chunk in [b"a,b\n", b"1,2\n"]), mimetype="text/csv")
+
+    @route("/error")
+    def error():
+        return jsonify({"error": "нет"}), 400
+
+    return app.test_client(), calls, version, cache
+
+
+def test_second_request_served_from_cache(env):
+    client, calls, _, _ = env
+    first = client.get("/data?b=2&a=1&a=0")
+    second = client.get("/data?a=0&a=1&b=2")   # порядок параметров и значений не важен
+    assert first.get_json() == second.get_json() == {"rows": [0, 1, 2, 3, 4]}
+    assert calls["/data"] == 1
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert "private" in second.headers["Cache-Control"] and "Accept-Encoding" in second.headers["Vary"]
+
+
+def test_if_none_match_gives_304_without_calling_route(env):
+    client, calls, _, cache = env
+    etag = client.get("/data").headers["ETag"]
+    response = client.get("/data", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.data == b""
+    assert response.headers["ETag"] == etag
+    assert calls["/data"] == 1
+    assert cache.stats()["not_modified"] == 1
+    # другой запрос — другой ETag
+    assert client.get("/data?x=1", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_new_version_changes_etag_and_refreshes(env):
+    client, calls, version, _ = env
+    etag = client.get("/data").headers["ETag"]
+    version[0] = "v2"
+    response = client.get("/data", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    assert calls["/data"] == 2
+
+
+@pytest.mark.parametrize("path", ["/estimate", "/stream", "/error"])
+def test_not_cached(env, path):
+    """no-store, потоковые ответы и не-200 каждый раз идут в маршрут и без ETag."""
+    client, calls, _, _ = env
+    for _ in range(2):
+        response = client.get(path)
+        assert "ETag" not in response.headers
+    assert calls[path] == 2
+    if path == "/stream":
+        assert response.data == b"a,b\n1,2\n"
+
+
+def test_version_unavailable_calls_route(env):
+    client, calls, version, _ = env
+    version[0] = None
+    assert client.get("/data").status_code == 200
+    assert client.get("/data").status_code == 200
+    assert calls["/data"] == 2
+
+
+def test_gzip_variant_for_large_bodies(env):
+    client, calls, _, _ = env
+    plain = client.get("/big")
+    compressed = client.get("/big", headers={"Accept-Encoding": "gzip, br"})
+    assert "Content-Encoding" not in plain.headers
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.data) == plain.data
+    assert calls["/big"] == 1
+    # маленькое тело не сжимается
+    assert "Content-Encoding" not in client.get("/data", headers={"Accept-Encoding": "gzip"}).headers
@@ -0,0 +1,131 @@
+"""Keyset-пагинация /data: условия после курсора, запросы страницы, разбор параметров."""
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import app
+
+
+@pytest.fixture(params=[False, True], ids=["ctid", "row_id"])
+def row_id_schema(request, monkeypatch):
+    """Обычная таблица (ctid) или секционированная (row_id)."""
+    monkeypatch.setitem(app._schema, "row_id_column", request.param)
+    return request.param
+
+
+def test_tiebreaker_follows_schema(row_id_schema):
+    assert app.tiebreaker_sql() == (('"row_id"', "bigint") if row_id_schema else ("ctid", "tid"))
+
+
+@pytest.mark.parametrize("sort_dir, sort_value, expected", [
+    # непустое значение: строки после него, затем отрезок NULL (при ASC они последние)
+    ("ASC", "2026-09-01", [('("Дата", {tb}) > (%s, %s::{type})', ["2026-09-01", "T"]),
+                           ('"Дата" IS NULL', [])]),
+    # курсор уже в отрезке NULL — дальше только NULL
+    ("ASC", None, [('("Дата" IS NULL AND {tb} > %s::{type})', ["T"])]),
+    # при DESC NULL идут первыми: после курсора в отрезке NULL — остаток NULL, затем все непустые
+    ("DESC", None, [('("Дата" IS NULL AND {tb} < %s::{type})', ["T"]),
+                    ('"Дата" IS NOT NULL', [])]),
+    ("DESC", "2026-09-01", [('("Дата", {tb}) < (%s, %s::{type})', ["2026-09-01", "T"])]),
+])
+def test_seek_conditions(row_id_schema, sort_dir, sort_value, expected):
+    tb, tb_type = app.tiebreaker_sql()
+    conditions = app.build_seek_conditions("Дата", sort_dir, sort_value, "T")
+    assert conditions == [(cond.format(tb=tb, type=tb_type), values) for cond, values in expected]
+
+
+def test_seek_conditions_have_no_or(row_id_schema):
+    for sort_dir in ("ASC", "DESC"):
+        for value in ("x", None):
+            for cond, _ in app.build_seek_conditions("Дата", sort_dir, value, "1"):
+                assert " OR " not in cond
+
+
+def test_region_sorts_by_inn():
+    cond, _ = app.build_seek_conditions("Регион", "ASC", "7700000000", "(0,1)")[0]
+    assert cond.startswith('("doc_counterparty_inn", ')
+
+
+def test_offset_page_query(row_id_schema):
+    where_clause, values = " WHERE \"Дата\">=%s", ["2026-09-01"]
+    [(query, params)] = app.build_page_queries(where_clause, values, "Дата", "DESC", page=3)
+    tb = app.tiebreaker_sql()[0]
+    assert f'ORDER BY "Дата" DESC, {tb} DESC LIMIT %s OFFSET %s' in query
+    assert params == ["2026-09-01", app.PAGE_SIZE, 2 * app.PAGE_SIZE]
+    assert values == ["2026-09-01"]
+
+
+@pytest.mark.parametrize("where_clause, values", [("", []), (' WHERE "Дата">=%s', ["2026-09-01"])])
+def test_keyset_page_queries(row_id_schema, where_clause, values):
+    """По запросу на отрезок: значения фильтров, затем курсора, затем LIMIT и OFFSET 0."""
+    queries = app.build_page_queries(where_clause, values, "Дата", "ASC", page=7, seek=("2026-09-05", "42"))
+    tb, tb_type = app.tiebreaker_sql()
+    joiner = " AND " if where_clause else " WHERE "
+    first, second = queries
+    assert f'{where_clause}{joiner}("Дата", {tb}) > (%s, %s::{tb_type}) ORDER BY' in first[0]
+    assert first[1] == values + ["2026-09-05", "42", app.PAGE_SIZE, 0]
+    assert f'{where_clause}{joiner}"Дата" IS NULL ORDER BY' in second[0]
+    assert second[1] == values + [app.PAGE_SIZE, 0]
+    # page при курсоре не учитывается
+    assert all(query.endswith("LIMIT %s OFFSET %s") for query, _ in queries)
+
+
+class FakeReplica:
+    """Локальная копия с заданными строками на каждый запрос (по порядку)."""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.executed = []
+
+    def execute(self, query, values):
+        self.executed.append(query)
+        rows = self.results.pop(0)
+
+        class Cursor:
+            def fetchall(self):
+                return rows
+
+            def close(self):
+                pass
+
+        return Cursor()
+
+
+def test_fetch_page_reads_next_segment_only_when_short():
+    full = [(i,) for i in range(app.PAGE_SIZE)]
+    replica = FakeReplica([full, [("null",)]])
+    assert app.fetch_page(None, replica, [("q1", []), ("q2", [])]) == full
+    assert replica.executed == ["q1"]
+
+    replica = FakeReplica([full[:3], [("null",)] * app.PAGE_SIZE])
+    rows = app.fetch_page(None, replica, [("q1", []), ("q2", [])])
+    assert rows == full[:3] + [("null",)] * (app.PAGE_SIZE - 3)
+    assert replica.executed == ["q1", "q2"]
+
+
+def test_parse_page_args_defaults():
+    assert app.parse_page_args(MultiDict()) == (1, "Дата", "DESC", None)
+    assert app.parse_page_args(MultiDict({"sort_col": "нет такой", "sort_dir": "asc"})) == (1, "Дата", "ASC", None)
+
+
+@pytest.mark.parametrize("sort_value", ["2026-09-01", None])
+def test_cursor_round_trip(row_id_schema, sort_value):
+    tiebreaker = "42" if row_id_schema else "(0,42)"
+    cursor = app.encode_cursor("Дата", "ASC", sort_value, tiebreaker)
+    args = MultiDict({"sort_col": "Дата", "sort_dir": "asc", "cursor": cursor})
+    assert app.parse_page_args(args) == (1, "Дата", "ASC", (sort_value, tiebreaker))
+
+
+@pytest.mark.parametrize("args", [
+    {"cursor": "не base64"},
+    {"cursor": app.encode_cursor("Дата", "ASC", "2026-09-01", "(0,1)")},  # выдан для другой сортировки
+    {"sort_col": "Дата", "sort_dir": "asc", "cursor": app.encode_cursor("Дата", "ASC", "x", "42")},  # row_id, а таблица с ctid
+], ids=["garbage", "other-sort", "other-tiebreaker"])
+def test_parse_page_args_rejects_bad_cursor(monkeypatch, args):
+    monkeypatch.setitem(app._schema, "row_id_column", False)
+    with pytest.raises(ValueError, match="cursor"):
+        app.parse_page_args(MultiDict(args))
+
+
+def test_parse_page_args_rejects_bad_page():
+    with pytest.raises(ValueError):
+        app.parse_page_args(MultiDict({"page": "abc"}))
@@ -0,0 +1,132 @@
+"""Формы запросов (prepared.py): текст для PREPARE, подготовленные операторы на соединении, LRU."""
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+from prepared import PreparedStatements, QueryCompiler, to_positional
+
+
+@pytest.mark.parametrize("query, expected, n", [
+    ("SELECT 1", "SELECT 1", 0),
+    ('SELECT * FROM t WHERE "a" = ANY(%s) AND "Дата">=%s LIMIT %s OFFSET %s',
+     'SELECT * FROM t WHERE "a" = ANY($1) AND "Дата">=$2 LIMIT $3 OFFSET $4', 4),
+    # %% — буквальный процент (как в psycopg2), в том числе перед «s»
+    ("SELECT x FROM t WHERE x LIKE 'a%%' AND y = %s", "SELECT x FROM t WHERE x LIKE 'a%' AND y = $1", 1),
+    ("SELECT '%%s', %s", "SELECT '%s', $1", 1),
+    ("SELECT '100%%%%' || %s", "SELECT '100%%' || $1", 1),
+    # литералы без процентов и $ в них не трогаются
+    ("SELECT regexp_replace(x, '[^0-9]$', '', 'g') FROM t WHERE y = %s",
+     "SELECT regexp_replace(x, '[^0-9]$', '', 'g') FROM t WHERE y = $1", 1),
+])
+def test_to_positional(query, expected, n):
+    assert to_positional(query) == (expected, n)
+
+
+class FakeCursor:
+    def __init__(self, conn, metered=False):
+        self.connection = conn
+        self.executed = []
+        if metered:
+            self.sql_source = None   # как у курсора метрик (metrics.cursor_factory)
+            self.sources = []
+
+    def execute(self, query, values=None):
+        self.executed.append((query, values))
+        if hasattr(self, "sources"):
+            self.sources.append(self.sql_source)
+
+
+def preparing_connection():
+    return SimpleNamespace(prepared=OrderedDict())
+
+
+QUERY = "SELECT * FROM t WHERE a = %s AND b = %s"
+
+
+def test_prepare_once_then_execute():
+    statements = PreparedStatements()
+    cur = FakeCursor(preparing_connection())
+    statements.execute(cur, QUERY, ["x", 1])
+    statements.execute(cur, QUERY, ["y", 2])
+    name = cur.connection.prepared[QUERY]
+    assert cur.executed == [
+        (f"PREPARE {name} AS SELECT * FROM t WHERE a = $1 AND b = $2", None),
+        (f"EXECUTE {name} (%s, %s)", ["x", 1]),
+        (f"EXECUTE {name} (%s, %s)", ["y", 2]),
+    ]
+    stats = statements.stats()
+    assert (stats["prepared"], stats["hits"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_name_is_the_same_on_every_connection():
+    statements = PreparedStatements()
+    names = []
+    for _ in range(2):
+        cur = FakeCursor(preparing_connection())
+        statements.execute(cur, QUERY, ["x", 1])
+        names.append(cur.connection.prepared[QUERY])
+    assert names[0] == names[1] and names[0].startswith("q_")
+
+
+def test_no_parameters():
+    statements = PreparedStatements()
+    cur = FakeCursor(preparing_connection())
+    statements.execute(cur, "SELECT MAX(x) FROM t")
+    name = cur.connection.prepared["SELECT MAX(x) FROM t"]
+    assert cur.executed[-1] == (f"EXECUTE {name}", None)
+
+
+def test_least_recently_executed_is_deallocated():
+    statements = PreparedStatements(max_per_connection=2)
+    cur = FakeCursor(preparing_connection())
+    queries = [f"SELECT {i} WHERE a = %s" for i in range(3)]
+    statements.execute(cur, queries[0], [1])
+    statements.execute(cur, queries[1], [1])
+    statements.execute(cur, queries[0], [1])   # queries[1] теперь самый давний
+    evicted = cur.connection.prepared[queries[1]]
+    cur.executed.clear()
+    statements.execute(cur, queries[2], [1])
+    assert [q for q, _ in cur.executed if not q.startswith("EXECUTE")] == [
+        f"PREPARE {cur.connection.prepared[queries[2]]} AS SELECT 2 WHERE a = $1", f"DEALLOCATE {evicted}"]
+    assert list(cur.connection.prepared) == [queries[0], queries[2]]
+    assert statements.stats()["deallocated"] == 1
+
+
+def test_falls_back_to_plain_execute():
+    statements = PreparedStatements()
+    # соединение без списка операторов (не PreparingConnection)
+    cur = FakeCursor(SimpleNamespace())
+    statements.execute(cur, QUERY, ["x", 1])
+    # число значений не совпадает с плейсхолдерами — ошибку покажет сам запрос
+    prepared_cur = FakeCursor(preparing_connection())
+    statements.execute(prepared_cur, QUERY, ["x"])
+    assert cur.executed == [(QUERY, ["x", 1])] and prepared_cur.executed == [(QUERY, ["x"])]
+    assert not prepared_cur.connection.prepared
+    assert statements.stats()["unprepared"] == 2
+
+
+def test_metered_cursor_sees_source_query():
+    statements = PreparedStatements()
+    cur = FakeCursor(preparing_connection(), metered=True)
+    statements.execute(cur, QUERY, ["x", 1])
+    assert cur.sources == [(QUERY, ["x", 1])] * 2   # PREPARE и EXECUTE
+    assert cur.sql_source is None
+
+
+def test_query_compiler_builds_once_and_evicts_lru():
+    compiler = QueryCompiler(max_entries=2)
+    built = []
+
+    def build(text):
+        return lambda: built.append(text) or text
+
+    assert compiler.compile("a", build("A")) == "A"
+    assert compiler.compile("a", build("A2")) == "A"
+    compiler.compile("b", build("B"))
+    compiler.compile("a", build("A3"))   # «b» теперь самый давний
+    compiler.compile("c", build("C"))
+    assert compiler.compile("b", build("B2")) == "B2"
+    assert compiler.compile("a", build("A4")) == "A4"   # вытеснен добавлением «b»
+    assert built == ["A", "B", "C", "B2", "A4"]
+    assert compiler.stats()["entries"] == 2
@@ -0,0 +1,52 @@
+"""Регион по ИНН: region_codes, region_names, region_name_for_inn и Arrow-вариант дают одно и то же."""
+import pytest
+
+from regions import UNKNOWN_REGION, region_codes, region_label, region_name, region_name_for_inn, region_names
+
+try:
+    import pyarrow as pa
+    from regions import region_names_arrow
+except ImportError:
+    pa = None
+
+CASES = [
+    # (ИНН, код, наименование)
+    (None, 0, UNKNOWN_REGION),
+    ("", 0, UNKNOWN_REGION),
+    ("  ", 0, UNKNOWN_REGION),
+    ("7", 7, "Кабардино-Балкарская Республика"),
+    ("7a", 7, "Кабардино-Балкарская Республика"),
+    ("a7", 7, "Кабардино-Балкарская Республика"),
+    ("7712345678", 77, "Москва"),
+    (7712345678, 77, "Москва"),
+    ("0212345678", 2, "Республика Башкортостан"),
+    # код без региона в таблице — пустое наименование (как и в SQL, region_names_sql)
+    ("8012345678", 80, ""),
+    ("9912345678", 99, "Иные территории"),
+]
+
+
+@pytest.mark.parametrize("inn, code, name", CASES)
+def test_single_inn(inn, code, name):
+    assert region_codes([inn])[0] == code
+    assert region_names([inn])[0] == name
+    assert region_name_for_inn(inn) == name
+    assert region_name(code) == name
+
+
+def test_batch_matches_single():
+    inns = [inn for inn, _, _ in CASES]
+    assert list(region_codes(inns)) == [code for _, code, _ in CASES]
+    assert list(region_names(inns)) == [region_name_for_inn(inn) for inn in inns]
+
+
+@pytest.mark.skipif(pa is None, reason="нужен pyarrow")
+def test_arrow_matches_numpy():
+    inns = [inn for inn, _, _ in CASES if not isinstance(inn, int)]
+    assert region_names_arrow(pa.array(inns, type=pa.string())).to_pylist() == list(region_names(inns))
+
+
+def test_region_label_and_out_of_range():
+    assert region_label(77) == "77 — Москва"
+    assert region_name(100) == UNKNOWN_REGION
+    assert region_name(-1) == UNKNOWN_REGION
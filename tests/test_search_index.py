@@ -0,0 +1,59 @@
+"""Поиск подстроки в памяти (search_index.py): тот же результат, что ILIKE, но сначала префиксы."""
+import random
+
+import pytest
+
+from search_index import SubstringIndex
+
+VALUES = ["ООО Ромашка", "Ромашка-Юг", "ИП Иванов", "Ромб", "АО Мега", "мегаполис", "Омега", "Иванов и партнёры"]
+
+
+def reference(values, q, limit):
+    """Ожидаемая выдача: совпадения по началу строки, затем остальные, внутри — в исходном порядке."""
+    q = q.lower()
+    prefix = [v for v in values if v.lower().startswith(q)]
+    inner = [v for v in values if q in v.lower() and not v.lower().startswith(q)]
+    return (prefix + inner)[:limit]
+
+
+def test_prefix_matches_first():
+    index = SubstringIndex(VALUES)
+    assert index.search("ром") == ["Ромашка-Юг", "Ромб", "ООО Ромашка"]
+    assert index.search("мега") == ["мегаполис", "АО Мега", "Омега"]
+
+
+@pytest.mark.parametrize("q", ["о", "ро", "ов", "Р"])
+def test_short_query_scans_values(q):
+    """Одно-двухсимвольный ввод — без триграмм, проходом по значениям."""
+    index = SubstringIndex(VALUES)
+    assert index.search(q) == reference(VALUES, q, 50)
+
+
+def test_limit_applies_to_both_groups():
+    index = SubstringIndex(VALUES)
+    assert index.search("ом", limit=2) == reference(VALUES, "ом", 2)
+    assert index.search("ром", limit=1) == ["Ромашка-Юг"]
+
+
+def test_empty_query_and_no_match():
+    index = SubstringIndex(VALUES)
+    assert index.search("", limit=3) == VALUES[:3]
+    assert index.search("xyz") == []
+    assert index.search("ромашкаа") == []
+
+
+def test_non_string_values():
+    index = SubstringIndex([7712345678, 7801234567, 5077123456])
+    assert index.search("77") == [7712345678, 5077123456]
+    assert index.search("780") == [7801234567]
+
+
+def test_matches_reference_on_random_values():
+    rng = random.Random(1)
+    values = sorted({"".join(rng.choice("абвгд ") for _ in range(rng.randint(1, 12))) for _ in range(2000)})
+    index = SubstringIndex(values)
+    for _ in range(300):
+        s = rng.choice(values)
+        start = rng.randrange(len(s))
+        q = s[start:start + rng.randint(1, 5)]
+        assert index.search(q, limit=20) == reference(values, q, 20), q